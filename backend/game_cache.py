@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class GameCache:
+    """
+    Bounded, byte-size-aware LRU for served game content, in front of KV.
+
+    Entries hold whatever /games serves (gzip bytes or legacy text) plus its ETag,
+    and expire no later than the underlying KV key so a cached game never outlives
+    its 24h (generated) or 7d (published) retention.
+    """
+
+    def __init__(self, max_bytes: int = None, max_ttl: int = None):
+        self.max_bytes = max_bytes or int(os.getenv("GAME_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.max_ttl = max_ttl or int(os.getenv("GAME_CACHE_MAX_TTL", "604800"))
+        self._entries = OrderedDict()  # game_id -> (content, etag, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, game_id: str):
+        """Returns (content, etag) or None."""
+        with self._lock:
+            entry = self._entries.get(game_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            content, etag, expires_at, _ = entry
+            if expires_at <= time.time():
+                self._remove(game_id)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(game_id)
+            self.hits += 1
+            return content, etag
+
+    def put(self, game_id: str, content, etag: str, ttl: int):
+        if ttl is None or ttl <= 0:
+            return
+        size = len(content)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if game_id in self._entries:
+                self._remove(game_id)
+            self._entries[game_id] = (content, etag, time.time() + min(ttl, self.max_ttl), size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, game_id: str):
+        with self._lock:
+            if game_id in self._entries:
+                self._remove(game_id)
+
+    def _remove(self, game_id: str):
+        _, _, _, size = self._entries.pop(game_id)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,250 @@
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+from backend.game_validator import validate_game
+from backend.metrics import metrics
+from backend.utils import HtmlPostProcessor
+
+EDIT_SYSTEM_INSTRUCTION = """You edit existing single-file HTML educational games.
+You receive the current game and a change request. Reply ONLY with SEARCH/REPLACE blocks, no commentary and no markdown fences:
+
+<<<<<<< SEARCH
+lines copied exactly from the current game
+=======
+the lines that replace them
+>>>>>>> REPLACE
+
+Rules:
+- Every SEARCH section must match the current game exactly (including indentation) and only once; include just enough surrounding lines to make it unique.
+- Keep blocks small and use one block per place that changes. Never resend unchanged parts of the game.
+- To insert code, put the adjacent anchor line in SEARCH and repeat it in REPLACE next to the new code. To delete code, leave REPLACE empty.
+- Keep `const GAME_ID`, the `API_BASE` helper, the `${API_BASE}/submit-score` call and the `initGame()` call working.
+"""
+
+BLOCK = re.compile(
+    r"^<{5,9} ?SEARCH[ \t]*\n(.*?)^={5,9}[ \t]*\n(.*?)^>{5,9} ?REPLACE[ \t]*$",
+    re.MULTILINE | re.DOTALL,
+)
+METADATA = re.compile(
+    r'\s*<!-- GENERATED METADATA -->\s*<script id="game-metadata" type="application/json">(.*?)</script>',
+    re.DOTALL,
+)
+GAME_ID = re.compile(r"""\b(?:const|let|var)\s+GAME_ID\s*=\s*["'`]([^"'`\n]+)["'`]""")
+
+
+class PatchError(ValueError):
+    """The model's reply could not be applied to the game."""
+
+
+class EditFailed(RuntimeError):
+    """No attempt produced a patch that applies and keeps the game valid."""
+
+
+def render_metadata_script(metadata: dict) -> str:
+    """Metadata script tag used by the Import/Edit features."""
+    # Securely serialize JSON and inject as a script tag
+    return f'\n<!-- GENERATED METADATA -->\n<script id="game-metadata" type="application/json">\n{json.dumps(metadata, indent=2)}\n</script>'
+
+
+def split_metadata(html: str) -> tuple:
+    """Returns (html without the metadata script, metadata dict or {})."""
+    match = None
+    for match in METADATA.finditer(html):
+        pass
+    if match is None:
+        return html, {}
+    try:
+        metadata = json.loads(match.group(1))
+    except ValueError:
+        metadata = {}
+    return html[:match.start()] + html[match.end():], metadata
+
+
+def game_id_of(html: str):
+    """The leaderboard id the game submits scores under (its `const GAME_ID`), or None."""
+    match = GAME_ID.search(html)
+    return match.group(1) if match else None
+
+
+def parse_edit_blocks(text: str) -> list:
+    """[(search, replace)] from a SEARCH/REPLACE reply."""
+    blocks = [(_chomp(search), _chomp(replace)) for search, replace in BLOCK.findall(text)]
+    if not blocks:
+        raise PatchError("The reply contained no SEARCH/REPLACE blocks")
+    for search, _ in blocks:
+        if not search.strip():
+            raise PatchError("A SEARCH section was empty; SEARCH must quote existing lines")
+    return blocks
+
+
+def _chomp(text: str) -> str:
+    return text[:-1] if text.endswith("\n") else text
+
+
+def apply_edit_blocks(html: str, blocks: list) -> tuple:
+    """
+    Applies blocks in order. SEARCH text must occur exactly once; when it doesn't
+    occur verbatim, a unique match of the trimmed text, or of its lines ignoring
+    their indentation, is accepted. Returns (html, number of such loose matches).
+    """
+    loose = 0
+    errors = []
+    for search, replace in blocks:
+        count = html.count(search)
+        if count == 1:
+            html = html.replace(search, replace, 1)
+            continue
+        if count > 1:
+            errors.append(f"SEARCH matches {count} places: {_first_line(search)!r}")
+            continue
+        trimmed = search.strip()
+        if html.count(trimmed) == 1:
+            html = html.replace(trimmed, replace.strip(), 1)
+            loose += 1
+            continue
+        span = _find_lines_loosely(html, search)
+        if span is None:
+            errors.append(f"SEARCH not found: {_first_line(search)!r}")
+            continue
+        start, end = span
+        html = html[:start] + replace + html[end:]
+        loose += 1
+    if errors:
+        raise PatchError("; ".join(errors))
+    return html, loose
+
+
+def _first_line(text: str) -> str:
+    return text.strip().split("\n", 1)[0][:80]
+
+
+def _find_lines_loosely(html: str, search: str):
+    """(start, end) offsets of the unique run of lines equal to `search` modulo indentation."""
+    wanted = [line.strip() for line in search.strip("\n").split("\n")]
+    lines = html.split("\n")
+    stripped = [line.strip() for line in lines]
+    matches = [
+        i for i in range(len(lines) - len(wanted) + 1)
+        if stripped[i] == wanted[0] and stripped[i:i + len(wanted)] == wanted
+    ]
+    if len(matches) != 1:
+        return None
+    first = matches[0]
+    start = sum(len(line) + 1 for line in lines[:first])
+    end = start + sum(len(line) + 1 for line in lines[first:first + len(wanted)]) - 1
+    return start, end
+
+
+class GameEditor:
+    """
+    Applies change requests to stored games as patches (see /edit-game).
+
+    The model sees the current game but only answers with SEARCH/REPLACE blocks,
+    so output tokens and decode time follow the size of the change rather than
+    the game. Replies that don't apply, or that break something the original
+    game had right, are retried with the error up to EDIT_MAX_ATTEMPTS times.
+    """
+
+    def __init__(self, max_attempts: int = None):
+        self.max_attempts = max_attempts or int(os.getenv("EDIT_MAX_ATTEMPTS", "2"))
+
+        self.edits = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.blocks_applied = 0
+        self.loose_matches = 0
+        self.output_tokens = 0
+        self.game_chars = 0
+        self.seconds = 0.0
+        self.results = metrics.counter("game_edits_total", "Game edits by outcome", ("result",))
+
+    def edit(self, html: str, instruction: str, parent_id: str, generate, validate) -> tuple:
+        """
+        `generate(prompt)` returns (text, usage) from a model call and `validate(html, known)`
+        returns (html, report), where `known` holds the codes of problems the original
+        game already had. Returns (edited html, edit info); raises EditFailed.
+        """
+        start = time.perf_counter()
+        game, metadata = split_metadata(html)
+        known_problems = {p.code for p in validate_game(game)[0]}
+        prompt = self.edit_prompt(game, instruction)
+        self.edits += 1
+        self.game_chars += len(game)
+
+        error = None
+        for attempt in range(self.max_attempts):
+            if error is not None:
+                self.retries += 1
+                prompt = self.retry_prompt(game, instruction, error)
+            text, usage = generate(prompt)
+            output_tokens = (usage or {}).get("output_tokens", 0)
+            self.output_tokens += output_tokens
+            try:
+                blocks = parse_edit_blocks(text)
+                edited, loose = apply_edit_blocks(game, blocks)
+            except PatchError as e:
+                error = str(e)
+                print(f"Warning: Edit attempt {attempt + 1} did not apply: {error}")
+                continue
+
+            edited, report = validate(edited, known_problems)
+            new_problems = [p for p in (report or {}).get("remaining", []) if p["code"] not in known_problems]
+            if new_problems:
+                error = "The edited game has problems: " + "; ".join(p["message"] for p in new_problems)
+                print(f"Warning: Edit attempt {attempt + 1} broke the game: {error}")
+                continue
+
+            self.succeeded += 1
+            self.blocks_applied += len(blocks)
+            self.loose_matches += loose
+            self.results.inc(result="succeeded")
+            self.seconds += time.perf_counter() - start
+            version = metadata.get("version", 1) + 1
+            metadata = {
+                **metadata,
+                "version": version,
+                "edited_from": parent_id,
+                "edit_instruction": instruction,
+                "edited_at": datetime.now().isoformat(),
+            }
+            edited = HtmlPostProcessor(metadata_script=render_metadata_script(metadata)).run(edited)
+            return edited, {
+                "version": version,
+                "blocks": len(blocks),
+                "attempts": attempt + 1,
+                "output_tokens": output_tokens,
+                "validation": report,
+            }
+
+        self.failed += 1
+        self.results.inc(result="failed")
+        self.seconds += time.perf_counter() - start
+        raise EditFailed(f"Could not apply the edit after {self.max_attempts} attempts: {error}")
+
+    @staticmethod
+    def edit_prompt(game: str, instruction: str) -> str:
+        return f"[CURRENT GAME]\n{game}\n[/CURRENT GAME]\n\n[CHANGE REQUEST]\n{instruction}\n[/CHANGE REQUEST]"
+
+    def retry_prompt(self, game: str, instruction: str, error: str) -> str:
+        return (
+            self.edit_prompt(game, instruction)
+            + f"\n\nA previous reply was rejected: {error}\n"
+            "Reply again with SEARCH/REPLACE blocks against the CURRENT GAME above."
+        )
+
+    def stats(self) -> dict:
+        return {
+            "edits": self.edits,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retries": self.retries,
+            "blocks_applied": self.blocks_applied,
+            "loose_matches": self.loose_matches,
+            "avg_output_tokens": self.output_tokens / self.edits if self.edits else 0.0,
+            "avg_game_chars": self.game_chars / self.edits if self.edits else 0.0,
+            "avg_seconds": self.seconds / self.edits if self.edits else 0.0,
+        }
@@ -0,0 +1,431 @@
+import os
+import re
+import time
+from html.parser import HTMLParser
+
+from backend.metrics import metrics
+
+JS_TYPES = ("", "text/javascript", "application/javascript", "module")
+
+API_BASE_SNIPPET = """const getApiBaseUrl = () => {
+    const protocol = window.location.protocol;
+    if (protocol === 'blob:') return window.location.origin;
+    if (protocol === 'file:') return 'http://localhost:8000';
+    return '';
+};
+const API_BASE = getApiBaseUrl();
+"""
+
+INIT_SNIPPET = """
+try {
+    initGame();
+} catch (e) {
+    console.error("Critical Init Error:", e);
+    alert("Game Error: " + e.message);
+}
+"""
+
+# What the game-generation prompt requires of the combined page script
+CONTRACT = (
+    ("missing_game_id", re.compile(r"\b(?:const|let|var)\s+GAME_ID\s*="), "No `const GAME_ID = ...` declaration"),
+    ("missing_api_base", re.compile(r"\b(?:const|let|var)\s+API_BASE\s*="), "No `const API_BASE = getApiBaseUrl()` helper"),
+    ("missing_submit_score", re.compile(r"/submit-score"), "Scores are never sent to `${API_BASE}/submit-score`"),
+)
+INIT_DEFINED = re.compile(r"\bfunction\s+initGame\s*\(|\binitGame\s*=")
+INIT_CALL = re.compile(r"(?<![\w.$])(?<!function )initGame\s*\(\s*\)")
+
+CLOSERS = {"(": ")", "[": "]", "{": "}"}
+# A "/" after one of these (or a keyword below) starts a regex literal, not a division
+REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+REGEX_KEYWORDS = {"return", "typeof", "case", "in", "of", "delete", "void", "throw", "new", "else", "do"}
+
+_SPECIAL = re.compile(r"[\"'`/(){}\[\]]")
+_DOUBLE = re.compile(r'"(?:[^"\\\n]|\\.)*"', re.S)
+_SINGLE = re.compile(r"'(?:[^'\\\n]|\\.)*'", re.S)
+_TEMPLATE_BODY = re.compile(r"(?:[^`\\$]|\\.|\$(?!\{))*", re.S)
+_REGEX = re.compile(r"/(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[a-z]*")
+_WORD_BEFORE = re.compile(r"[A-Za-z_$][\w$]*$")
+
+
+def scan_js(code: str) -> tuple:
+    """
+    Lightweight syntax check: bracket balance, ignoring strings, template
+    literals (with nested ${...}), comments and regex literals.
+    Returns (errors, unclosed): errors are (offset, message); unclosed lists the
+    brackets still open at the end, innermost last, when nothing else is wrong.
+    """
+    stack = []  # (char, offset); "`" marks a ${ inside a template literal
+    errors = []
+    i = 0
+    n = len(code)
+    while i < n:
+        match = _SPECIAL.search(code, i)
+        if match is None:
+            break
+        i = match.start()
+        char = code[i]
+
+        if char in CLOSERS:
+            stack.append((char, i))
+            i += 1
+        elif char in ")]}":
+            if not stack:
+                errors.append((i, f"Unexpected '{char}'"))
+                return errors, []
+            opener, at = stack.pop()
+            if opener == "`" and char == "}":
+                i = _scan_template(code, i + 1, stack, errors)
+                if errors:
+                    return errors, []
+                continue
+            if CLOSERS.get(opener) != char:
+                errors.append((i, f"'{char}' closes '{opener}' opened at line {line_of(code, at)}"))
+                return errors, []
+            i += 1
+        elif char in "\"'":
+            string = (_DOUBLE if char == '"' else _SINGLE).match(code, i)
+            if string is None:
+                errors.append((i, "Unterminated string literal"))
+                return errors, []
+            i = string.end()
+        elif char == "`":
+            i = _scan_template(code, i + 1, stack, errors)
+            if errors:
+                return errors, []
+        elif code.startswith("//", i):
+            end = code.find("\n", i)
+            i = n if end == -1 else end
+        elif code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            if end == -1:
+                errors.append((i, "Unterminated block comment"))
+                return errors, []
+            i = end + 2
+        else:  # "/": regex literal or division
+            regex = _REGEX.match(code, i) if _starts_regex(code, i) else None
+            i = regex.end() if regex else i + 1
+
+    if any(opener == "`" for opener, _ in stack):
+        errors.append((stack[-1][1], "Unterminated template literal"))
+        return errors, []
+    return errors, [opener for opener, _ in stack]
+
+
+def _scan_template(code: str, i: int, stack: list, errors: list) -> int:
+    """Scans a template literal body from `i`; returns the offset after it or after its next `${`."""
+    body = _TEMPLATE_BODY.match(code, i)
+    end = body.end()
+    if code.startswith("${", end):
+        stack.append(("`", end))
+        return end + 2
+    if end >= len(code):
+        errors.append((i - 1, "Unterminated template literal"))
+        return end
+    return end + 1  # closing backtick
+
+
+def _starts_regex(code: str, i: int) -> bool:
+    j = i - 1
+    while j >= 0 and code[j] in " \t\r\n":
+        j -= 1
+    if j < 0 or code[j] in REGEX_PRECEDERS:
+        return True
+    word = _WORD_BEFORE.search(code, max(0, j - 10), j + 1)
+    return bool(word) and word.group() in REGEX_KEYWORDS
+
+
+def line_of(text: str, offset: int) -> int:
+    return text.count("\n", 0, offset) + 1
+
+
+class ScriptSection:
+    """An inline <script> block: its content span in the document and type."""
+
+    def __init__(self, index: int, start: int, end: int, script_type: str, closed: bool):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.type = script_type
+        self.closed = closed
+
+    @property
+    def is_js(self) -> bool:
+        return self.type in JS_TYPES
+
+
+class GameHtmlScanner(HTMLParser):
+    """Streaming tokenizer pass that records <script> blocks and the closing tags seen."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.scripts = []
+        self.end_tags = set()
+        self._line_starts = [0]
+        self._consumed = 0
+        self._current = None
+
+    def feed(self, data: str):
+        # Line start offsets let getpos() (line, column) map back to document offsets
+        for match in re.finditer("\n", data):
+            self._line_starts.append(self._consumed + match.end())
+        self._consumed += len(data)
+        super().feed(data)
+
+    def _offset(self) -> int:
+        line, column = self.getpos()
+        return self._line_starts[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "script":
+            attrs = dict(attrs)
+            if attrs.get("src"):
+                return
+            start = self._offset() + len(self.get_starttag_text())
+            script_type = (attrs.get("type") or "").strip().lower()
+            self._current = ScriptSection(len(self.scripts), start, None, script_type, False)
+
+    def handle_endtag(self, tag):
+        self.end_tags.add(tag)
+        if tag == "script" and self._current is not None:
+            self._current.end = self._offset()
+            self._current.closed = True
+            self.scripts.append(self._current)
+            self._current = None
+
+    def close(self):
+        super().close()
+        if self._current is not None:
+            # Unclosed script: everything to the end of the document is script content
+            self._current.end = self._consumed
+            self.scripts.append(self._current)
+            self._current = None
+
+
+class Problem:
+    def __init__(self, code: str, message: str, script: int = None):
+        self.code = code
+        self.message = message
+        self.script = script  # index of the affected script section, if any
+
+    def to_dict(self) -> dict:
+        return {"code": self.code, "message": self.message, "script": self.script}
+
+
+def validate_game(html: str) -> tuple:
+    """Returns (problems, scripts) for a post-processed game document."""
+    scanner = GameHtmlScanner()
+    scanner.feed(html)
+    scanner.close()
+    scripts = scanner.scripts
+    js = [s for s in scripts if s.is_js]
+    problems = []
+
+    if "html" not in scanner.end_tags:
+        problems.append(Problem("truncated", "Document has no closing </html>"))
+    for section in js:
+        code = html[section.start:section.end]
+        if not section.closed:
+            problems.append(Problem("unclosed_script", f"<script> #{section.index} is never closed", section.index))
+        errors, unclosed = scan_js(code)
+        for offset, message in errors:
+            problems.append(Problem("js_syntax", f"Line {line_of(code, offset)} of script #{section.index}: {message}", section.index))
+        if unclosed:
+            problems.append(Problem(
+                "js_unclosed", f"Script #{section.index} ends with unclosed '{''.join(unclosed)}'", section.index
+            ))
+
+    if not js:
+        problems.append(Problem("no_script", "The game has no inline script"))
+        return problems, scripts
+    combined = "\n".join(html[s.start:s.end] for s in js)
+    for code, pattern, message in CONTRACT:
+        if not pattern.search(combined):
+            problems.append(Problem(code, message))
+    if INIT_DEFINED.search(combined) and not INIT_CALL.search(combined):
+        problems.append(Problem("missing_init_call", "initGame() is defined but never called"))
+    return problems, scripts
+
+
+class GameValidator:
+    """
+    Checks generated games against the prompt's contract and repairs them (GAME_VALIDATION).
+
+    - "repair" (default): structural problems with a known fix (missing API_BASE
+      helper or GAME_ID const, unclosed <script> or trailing brackets, missing
+      initGame() call) are patched locally. Script blocks that still fail are
+      sent back to a cheap model (GEMINI_REPAIR_MODEL) one section at a time, at
+      most GAME_REPAIR_MAX_SECTIONS per game, instead of regenerating the game.
+    - "check": report problems only.
+    - "off": skip.
+    """
+
+    def __init__(self, mode: str = None, max_sections: int = None, repair_model: str = None):
+        self.mode = mode or os.getenv("GAME_VALIDATION", "repair")
+        self.max_sections = max_sections if max_sections is not None else int(os.getenv("GAME_REPAIR_MAX_SECTIONS", "2"))
+        self.repair_model = repair_model or os.getenv("GEMINI_REPAIR_MODEL", "gemini-2.5-flash")
+
+        self.validated = 0
+        self.passed = 0
+        self.repaired_locally = 0
+        self.regenerated_sections = 0
+        self.regeneration_failures = 0
+        self.regeneration_tokens = 0
+        self.still_failing = 0
+        self.seconds = 0.0
+        self.results = metrics.counter("game_validation_total", "Validated games by outcome", ("result",))
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def process(self, html: str, game_id: str = None, regenerate=None, known: set = ()) -> tuple:
+        """
+        Validates (and in "repair" mode repairs) a game. `regenerate(prompt)` returns
+        (text, usage) from a model call; sections whose problems all have codes in
+        `known` (e.g. ones an edited game already had) are not regenerated.
+        Returns (html, report dict).
+        """
+        if not self.enabled:
+            return html, None
+        start = time.perf_counter()
+        problems, scripts = validate_game(html)
+        found = [p.to_dict() for p in problems]
+        repairs = []
+
+        if problems and self.mode == "repair":
+            html, problems, scripts = self._repair_locally(html, problems, scripts, game_id, repairs)
+            if problems and regenerate is not None:
+                html, problems = self._regenerate_sections(html, problems, scripts, game_id, regenerate, repairs, known)
+
+        self.validated += 1
+        if not found:
+            self.passed += 1
+            result = "passed"
+        elif not problems:
+            result = "repaired"
+        else:
+            self.still_failing += 1
+            result = "failed"
+        if repairs and any(r["kind"] == "local" for r in repairs):
+            self.repaired_locally += 1
+        self.results.inc(result=result)
+        self.seconds += time.perf_counter() - start
+        return html, {
+            "result": result,
+            "problems": found,
+            "repairs": repairs,
+            "remaining": [p.to_dict() for p in problems],
+        }
+
+    def _repair_locally(self, html: str, problems: list, scripts: list, game_id: str, repairs: list) -> tuple:
+        attempted = set()
+        while True:
+            for problem in problems:
+                key = (problem.code, problem.script)
+                if key in attempted:
+                    continue
+                attempted.add(key)
+                fixed = self._local_fix(html, problem, scripts, game_id)
+                if fixed is not None:
+                    break
+            else:
+                return html, problems, scripts
+            html = fixed
+            repairs.append({"kind": "local", "code": problem.code})
+            # Offsets moved; rescan before the next fix
+            problems, scripts = validate_game(html)
+
+    @staticmethod
+    def _local_fix(html: str, problem: Problem, scripts: list, game_id: str):
+        js = [s for s in scripts if s.is_js]
+        if problem.code == "missing_api_base" and js:
+            return html[:js[0].start] + "\n" + API_BASE_SNIPPET + html[js[0].start:]
+        if problem.code == "missing_game_id" and js and game_id:
+            return html[:js[0].start] + f'\nconst GAME_ID = "{game_id}";' + html[js[0].start:]
+        if problem.code == "missing_init_call" and js:
+            last = js[-1]
+            return html[:last.end] + INIT_SNIPPET + html[last.end:]
+        if problem.code == "unclosed_script":
+            section = scripts[problem.script]
+            body_end = html.lower().rfind("</body>", section.start)
+            at = body_end if body_end != -1 else len(html)
+            return html[:at] + "\n</script>\n" + html[at:]
+        if problem.code == "js_unclosed":
+            section = scripts[problem.script]
+            _, unclosed = scan_js(html[section.start:section.end])
+            closers = "".join(CLOSERS[c] for c in reversed(unclosed))
+            return html[:section.end] + f"\n{closers}\n" + html[section.end:]
+        return None
+
+    def _regenerate_sections(self, html: str, problems: list, scripts: list, game_id: str, regenerate, repairs: list, known: set) -> tuple:
+        js = [s for s in scripts if s.is_js]
+        by_section = {}
+        for problem in problems:
+            if problem.script is not None:
+                by_section.setdefault(problem.script, []).append(problem)
+            elif problem.code.startswith("missing_") and js:
+                # Contract gaps go to the main (largest) script
+                largest = max(js, key=lambda s: s.end - s.start)
+                by_section.setdefault(largest.index, []).append(problem)
+        by_section = {index: found for index, found in by_section.items() if any(p.code not in known for p in found)}
+
+        # Later sections first, so earlier offsets stay valid while splicing
+        for index in sorted(by_section, reverse=True)[:self.max_sections]:
+            section = scripts[index]
+            original = html[section.start:section.end]
+            try:
+                text, usage = regenerate(self.repair_prompt(original, by_section[index], game_id))
+            except Exception as e:
+                self.regeneration_failures += 1
+                print(f"Warning: Focused repair of script #{index} failed: {e}")
+                continue
+            self.regeneration_tokens += (usage or {}).get("prompt_tokens", 0) + (usage or {}).get("output_tokens", 0)
+            fixed = strip_code_fence(text)
+            errors, unclosed = scan_js(fixed)
+            if errors or unclosed:
+                self.regeneration_failures += 1
+                print(f"Warning: Focused repair of script #{index} is still invalid, keeping the original")
+                continue
+            self.regenerated_sections += 1
+            html = html[:section.start] + "\n" + fixed + "\n" + html[section.end:]
+            repairs.append({"kind": "regenerated", "script": index, "codes": [p.code for p in by_section[index]]})
+
+        problems, _ = validate_game(html)
+        return html, problems
+
+    @staticmethod
+    def repair_prompt(code: str, problems: list, game_id: str) -> str:
+        issues = "\n".join(f"- {p.message}" for p in problems)
+        return (
+            "The JavaScript below is one <script> block of a generated HTML educational game. "
+            "It has these problems:\n"
+            f"{issues}\n\n"
+            "Fix only these problems and keep everything else unchanged. The game must keep "
+            f'`const GAME_ID = "{game_id}";`, the `API_BASE` helper (`const API_BASE = getApiBaseUrl();`), '
+            "send scores with `fetch(`${API_BASE}/submit-score`, ...)` and call `initGame()` at the end.\n"
+            "Return ONLY the corrected JavaScript, without <script> tags, markdown fences or commentary.\n\n"
+            f"{code}"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "validated": self.validated,
+            "passed_first_time": self.passed,
+            "repaired_locally": self.repaired_locally,
+            "regenerated_sections": self.regenerated_sections,
+            "regeneration_failures": self.regeneration_failures,
+            "regeneration_tokens": self.regeneration_tokens,
+            "still_failing": self.still_failing,
+            "avg_ms": self.seconds / self.validated * 1000 if self.validated else 0.0,
+        }
+
+
+def strip_code_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+    if text.endswith("```"):
+        text = text[:-3]
+    text = re.sub(r"^\s*<script[^>]*>|</script>\s*$", "", text.strip(), flags=re.I)
+    return text.strip()
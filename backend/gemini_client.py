@@ -1,12 +1,339 @@
+import hashlib
+import json
 import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from datetime import timedelta
 from dotenv import load_dotenv
 import google.generativeai as genai
 
+from backend.metrics import metrics
+from backend.rate_limit import RateLimiter, backoff_delay
+
 # Load environment variables
 from pathlib import Path
 env_path = Path(__file__).parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
+FINISH_STOP = 1
+FINISH_MAX_TOKENS = 2
+
+CONTINUE_INSTRUCTION = (
+    "Your previous answer was cut off by the output length limit. "
+    "Continue EXACTLY where it stopped, starting with the very next character. "
+    "Do not repeat anything already written, do not restart the document, "
+    "and do not add markdown fences or commentary."
+)
+
+# How far back we look for text the model repeated at the start of a continuation
+OVERLAP_WINDOW = 400
+MIN_OVERLAP = 20
+
+
+# How the static system prompt is sent (GEMINI_PROMPT_CACHE):
+#   explicit - a cached-content handle, billed at the cached-token rate
+#   system   - a system_instruction on every request (a stable prefix for implicit caching)
+#   off      - one concatenated prompt, as before
+PROMPT_CACHE_MODES = ("explicit", "system", "off")
+
+
+# Smallest prompt (in tokens) the API accepts for an explicit context cache, per model
+CONTEXT_CACHE_MIN_TOKENS = {
+    "gemini-2.5-pro": 4096,
+    "gemini-2.5-flash": 1024,
+}
+# Models not listed get the largest minimum, so they're never sent a create that must fail
+CONTEXT_CACHE_MIN_TOKENS_DEFAULT = 4096
+
+
+def instruction_key(model_name: str, system_instruction: str) -> str:
+    return hashlib.sha256(f"{model_name}\n{system_instruction}".encode("utf-8")).hexdigest()
+
+
+class ContextCache:
+    """
+    Explicit Gemini context caches for static system instructions.
+
+    One cached-content handle per (model, instruction), created on first use and
+    kept alive by extending its TTL when it gets close to expiring. Instructions
+    estimated below the model's minimum cacheable size (CONTEXT_CACHE_MIN_TOKENS,
+    overridable per model with GEMINI_CONTEXT_CACHE_MIN_TOKENS as JSON) are never
+    sent to CachedContent.create. If creation fails anyway the pair is skipped for
+    GEMINI_CONTEXT_CACHE_RETRY seconds and callers fall back.
+
+    Warm handles are returned without locking. Only one thread creates or refreshes
+    a given handle; meanwhile other requests keep using the current handle, or fall
+    back if there is none yet, instead of queueing behind the network call.
+    """
+
+    def __init__(self, ttl: int = None, refresh_margin: int = None, retry_after: int = None, min_tokens: dict = None):
+        self.ttl = ttl or int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+        self.refresh_margin = refresh_margin or int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH", "300"))
+        self.retry_after = retry_after or int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY", "600"))
+        self.min_tokens = {
+            **CONTEXT_CACHE_MIN_TOKENS,
+            **(min_tokens if min_tokens is not None else json.loads(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "{}"))),
+        }
+        self._entries = {}  # key -> (cached_content, model, expires_at)
+        self._failed = {}  # key -> retry_at
+        self._pending = set()  # keys being created or refreshed
+        self._lock = threading.Lock()
+        self.created = 0
+        self.refreshed = 0
+        self.failures = 0
+        self.too_small = 0
+
+    def min_tokens_for(self, model_name: str) -> int:
+        return self.min_tokens.get(model_name.split("/")[-1], CONTEXT_CACHE_MIN_TOKENS_DEFAULT)
+
+    def model_for(self, model_name: str, system_instruction: str, generation_config: dict):
+        """Returns a GenerativeModel bound to the cached instruction, or None to fall back."""
+        # ~4 characters per token, as for rate-limit estimates
+        if (len(system_instruction) + 3) // 4 < self.min_tokens_for(model_name):
+            self.too_small += 1
+            return None
+        key = instruction_key(model_name, system_instruction)
+        now = time.time()
+        if self._failed.get(key, 0) > now:
+            return None
+        entry = self._entries.get(key)
+        if entry and entry[2] - now > self.refresh_margin:
+            return entry[1]
+
+        with self._lock:
+            if key in self._pending:
+                # Another thread is creating/refreshing it; don't wait on its network call
+                return entry[1] if entry and entry[2] > now else None
+            self._pending.add(key)
+        try:
+            return self._create_or_refresh(key, self._entries.get(key), model_name, system_instruction, generation_config)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _create_or_refresh(self, key: str, entry, model_name: str, system_instruction: str, generation_config: dict):
+        now = time.time()
+        if entry and entry[2] - now > self.refresh_margin:
+            return entry[1]  # refreshed by the previous owner
+        try:
+            if entry and entry[2] > now:
+                cached, model = entry[0], entry[1]
+                cached.update(ttl=timedelta(seconds=self.ttl))
+                self.refreshed += 1
+            else:
+                cached = genai.caching.CachedContent.create(
+                    model=f"models/{model_name}",
+                    display_name="game-generation-prompt",
+                    system_instruction=system_instruction,
+                    ttl=timedelta(seconds=self.ttl),
+                )
+                model = genai.GenerativeModel.from_cached_content(cached, generation_config=generation_config)
+                self.created += 1
+                print(f"Created Gemini context cache {cached.name} for {model_name}")
+        except Exception as e:
+            self.failures += 1
+            with self._lock:
+                self._failed[key] = now + self.retry_after
+                self._entries.pop(key, None)
+            print(f"Warning: Gemini context cache unavailable for {model_name}, falling back: {e}")
+            return None
+        with self._lock:
+            self._entries[key] = (cached, model, now + self.ttl)
+        return model
+
+    def invalidate(self, model_name: str, system_instruction: str):
+        """Drops a handle that failed at generation time (e.g. it expired server-side)."""
+        key = instruction_key(model_name, system_instruction)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._failed[key] = time.time() + self.retry_after
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "failures": self.failures,
+            "too_small": self.too_small,
+        }
+
+
+def stitch_overlap(existing: str, addition: str) -> str:
+    """
+    Returns `addition` minus any prefix that merely repeats the end of `existing`.
+    Short overlaps are ignored, since they are more likely coincidence than repetition.
+    """
+    tail = existing[-OVERLAP_WINDOW:]
+    for k in range(min(len(tail), len(addition)), MIN_OVERLAP - 1, -1):
+        if tail.endswith(addition[:k]):
+            return addition[k:]
+    return addition
+
+
+# Failures worth retrying on another model, as opposed to bad requests or safety blocks
+FALLBACK_ERRORS = {
+    "ResourceExhausted": "quota",
+    "TooManyRequests": "quota",
+    "DeadlineExceeded": "timeout",
+    "TimeoutError": "timeout",
+    "ReadTimeout": "timeout",
+    "ServiceUnavailable": "unavailable",
+    "InternalServerError": "unavailable",
+    # Our own limiter (backend.rate_limit): the quota is spent locally, another model may have room
+    "RateLimitExceeded": "throttled",
+}
+FALLBACK_MESSAGES = {
+    "429": "quota",
+    "quota": "quota",
+    "deadline": "timeout",
+    "timed out": "timeout",
+    "503": "unavailable",
+}
+
+
+# Kinds worth retrying on the same model after a backoff; timeouts go straight to the next model
+RETRY_SAME_MODEL = ("quota", "unavailable")
+
+
+def classify_error(error: Exception):
+    """Returns "quota", "timeout", "unavailable" or "throttled" for errors another model may not hit, else None."""
+    while error is not None:
+        kind = FALLBACK_ERRORS.get(type(error).__name__)
+        if kind:
+            return kind
+        message = str(error).lower()
+        for needle, kind in FALLBACK_MESSAGES.items():
+            if needle in message:
+                return kind
+        error = error.__cause__
+    return None
+
+
+class ModelStats:
+    """Rolling latency and error counters for one model."""
+
+    def __init__(self, window: int = 200):
+        self.latencies = deque(maxlen=window)
+        self.first_token = deque(maxlen=window)
+        self.requests = 0
+        self.successes = 0
+        self.errors = {}  # kind -> count
+        self.hedges_won = 0
+
+    @staticmethod
+    def percentile(values, p):
+        if not values:
+            return None
+        values = sorted(values)
+        return values[min(int(len(values) * p), len(values) - 1)]
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "successes": self.successes,
+            "errors": dict(self.errors),
+            "error_rate": 1 - self.successes / self.requests if self.requests else 0.0,
+            "p50_seconds": self.percentile(self.latencies, 0.50),
+            "p95_seconds": self.percentile(self.latencies, 0.95),
+            "ttft_p95_seconds": self.percentile(self.first_token, 0.95),
+            "hedges_won": self.hedges_won,
+        }
+
+
+class ModelRouter:
+    """
+    Chooses models per request and tracks how each one performs.
+
+    - GEMINI_MODEL is the default; GEMINI_MODEL_BY_DIFFICULTY (JSON, e.g.
+      '{"easy": "gemini-2.5-flash"}') overrides it per difficulty, except that
+      prompts over GEMINI_LARGE_PROMPT_CHARS always go to GEMINI_MODEL.
+    - GEMINI_FALLBACK_MODELS (comma-separated) are tried in order when a model
+      times out, runs out of quota or is unavailable.
+    - With GEMINI_HEDGE=1 a second request goes to the first fallback once the
+      primary has been running longer than its p95 latency (time to first token
+      for streams), and the first valid result wins.
+    """
+
+    def __init__(self):
+        self.default_model = os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
+        self.by_difficulty = json.loads(os.getenv("GEMINI_MODEL_BY_DIFFICULTY", "{}"))
+        self.large_prompt_chars = int(os.getenv("GEMINI_LARGE_PROMPT_CHARS", "4000"))
+        self.fallbacks = [m.strip() for m in os.getenv("GEMINI_FALLBACK_MODELS", "gemini-2.5-flash").split(",") if m.strip()]
+        self.hedge = os.getenv("GEMINI_HEDGE", "0") == "1"
+        # Used until a model has enough samples for a p95
+        self.hedge_delay_default = float(os.getenv("GEMINI_HEDGE_DELAY", "90"))
+        self.hedge_ttft_default = float(os.getenv("GEMINI_HEDGE_TTFT_DELAY", "20"))
+        self.hedge_min_samples = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+        self.hedges = 0
+        self.fallbacks_used = 0
+        self.retries = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=int(os.getenv("GEMINI_HEDGE_WORKERS", "8")), thread_name_prefix="gemini-hedge")
+
+    def primary(self, difficulty: str = None, prompt: str = "") -> str:
+        if len(prompt) > self.large_prompt_chars:
+            return self.default_model
+        return self.by_difficulty.get(difficulty, self.default_model)
+
+    def plan(self, difficulty: str = None, prompt: str = "", model: str = None) -> list:
+        """Primary model (or `model`, when forced) followed by the fallbacks, without repeats."""
+        models = [model or self.primary(difficulty, prompt)]
+        for model in [self.default_model] + self.fallbacks:
+            if model not in models:
+                models.append(model)
+        return models
+
+    def _model_stats(self, model_name: str) -> ModelStats:
+        stats = self._stats.get(model_name)
+        if stats is None:
+            stats = self._stats[model_name] = ModelStats()
+        return stats
+
+    def record_success(self, model_name: str, seconds: float, first_token_seconds: float = None):
+        with self._lock:
+            stats = self._model_stats(model_name)
+            stats.requests += 1
+            stats.successes += 1
+            stats.latencies.append(seconds)
+            if first_token_seconds is not None:
+                stats.first_token.append(first_token_seconds)
+
+    def record_error(self, model_name: str, error: Exception):
+        kind = classify_error(error) or "other"
+        with self._lock:
+            stats = self._model_stats(model_name)
+            stats.requests += 1
+            stats.errors[kind] = stats.errors.get(kind, 0) + 1
+
+    def record_hedge_win(self, model_name: str):
+        with self._lock:
+            self._model_stats(model_name).hedges_won += 1
+
+    def hedge_delay(self, model_name: str, stream: bool = False) -> float:
+        with self._lock:
+            stats = self._model_stats(model_name)
+            samples = stats.first_token if stream else stats.latencies
+            if len(samples) < self.hedge_min_samples:
+                return self.hedge_ttft_default if stream else self.hedge_delay_default
+            return ModelStats.percentile(samples, 0.95)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "default": self.default_model,
+                "fallbacks": self.fallbacks,
+                "hedging": self.hedge,
+                "hedges": self.hedges,
+                "fallbacks_used": self.fallbacks_used,
+                "retries": self.retries,
+                "models": {name: stats.to_dict() for name, stats in self._stats.items()},
+            }
+
+
 class GeminiClient:
     def __init__(self):
         api_key = os.getenv("GEMINI_API_KEY")
@@ -15,43 +342,157 @@ class GeminiClient:
 
         genai.configure(api_key=api_key)
 
-        self.model = genai.GenerativeModel(
-            model_name="gemini-2.5-pro", 
-            generation_config={
-                "temperature": 0.5,
-                "max_output_tokens": 65536,
-            }
-        )
+        self.router = ModelRouter()
+        self.model_name = self.router.default_model
+        self.generation_config = {
+            "temperature": 0.5,
+            "max_output_tokens": 65536,
+        }
+        # Per-request timeout, so a stuck call can fall back to another model
+        self.timeout = float(os.getenv("GEMINI_TIMEOUT", "600"))
+        self.limiter = RateLimiter()
+        # Same-model retries on 429/5xx before the router moves on, with jittered backoff
+        self.max_retries = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+        self.retry_base_delay = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "1"))
+        self.retry_max_delay = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "20"))
+        self._models = {}  # model name -> GenerativeModel
+
+        self.prompt_cache = os.getenv("GEMINI_PROMPT_CACHE", "explicit")
+        if self.prompt_cache not in PROMPT_CACHE_MODES:
+            raise ValueError(f"GEMINI_PROMPT_CACHE must be one of {PROMPT_CACHE_MODES}")
+        self.context_cache = ContextCache()
+        self._system_models = {}  # instruction key -> GenerativeModel with system_instruction
+
+        # Follow-up requests allowed when output stops on MAX_TOKENS
+        self.max_continuations = int(os.getenv("GEMINI_MAX_CONTINUATIONS", "2"))
+        # Token accounting for the most recent call on each thread
+        self._local = threading.local()
+
+    @property
+    def model(self):
+        return self._plain_model(self.model_name)
+
+    @property
+    def last_usage(self) -> dict:
+        """Usage of the last generate()/generate_stream() call made on this thread."""
+        return getattr(self._local, "usage", None)
+
+    def _new_usage(self, model_name: str) -> dict:
+        usage = {
+            "model": model_name,
+            "continuations": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "output_tokens": 0,
+            "finish_reason": None,
+            "prompt_cache": "off",
+            "first_token_seconds": None,
+        }
+        self._local.usage = usage
+        return usage
+
+    def _plain_model(self, model_name: str):
+        model = self._models.get(model_name)
+        if model is None:
+            model = genai.GenerativeModel(model_name=model_name, generation_config=self.generation_config)
+            self._models[model_name] = model
+        return model
+
+    def _model_for(self, model_name: str, system_instruction: str):
+        """Picks how to send the static instruction. Returns (model, mode)."""
+        if not system_instruction or self.prompt_cache == "off":
+            return self._plain_model(model_name), "off"
+        if self.prompt_cache == "explicit":
+            model = self.context_cache.model_for(model_name, system_instruction, self.generation_config)
+            if model is not None:
+                return model, "explicit"
+        key = instruction_key(model_name, system_instruction)
+        model = self._system_models.get(key)
+        if model is None:
+            model = genai.GenerativeModel(
+                model_name=model_name,
+                generation_config=self.generation_config,
+                system_instruction=system_instruction
+            )
+            self._system_models[key] = model
+        return model, "system"
+
+    def _fall_back(self, model_name: str, mode: str, system_instruction: str, error: Exception):
+        print(f"Warning: Generation with prompt cache mode '{mode}' failed, retrying with the full prompt: {error}")
+        if mode == "explicit":
+            self.context_cache.invalidate(model_name, system_instruction)
+
+    def route(self, difficulty: str = None, prompt: str = "") -> str:
+        """Model a request will be sent to first (fallbacks aside)."""
+        return self.router.primary(difficulty, prompt)
 
-    def generate(self, prompt: str) -> str:
+    @staticmethod
+    def _continuation_contents(prompt: str, partial: str) -> list:
+        """Replays the partial output as the model's own turn and asks it to carry on."""
+        return [
+            {"role": "user", "parts": [prompt]},
+            {"role": "model", "parts": [partial]},
+            {"role": "user", "parts": [CONTINUE_INSTRUCTION]},
+        ]
+
+    def _reserve_quota(self, usage: dict, contents) -> tuple:
         """
-        Sends prompt to Gemini and returns raw text output.
+        Waits for rate-limit room for this call, estimating its input tokens
+        from the request text. Returns what to settle once usage is reported.
         """
+        if isinstance(contents, str):
+            chars = len(contents)
+        else:
+            chars = sum(len(part) for turn in contents for part in turn["parts"])
+        estimate = (chars + 3) // 4
+        self.limiter.acquire(usage["model"], estimate)
+        return estimate, usage["prompt_tokens"]
+
+    def _settle_quota(self, usage: dict, reserved: tuple):
+        estimate, prompt_tokens_before = reserved
+        actual = usage["prompt_tokens"] - prompt_tokens_before
+        if actual:
+            self.limiter.settle(usage["model"], actual - estimate)
+
+    @staticmethod
+    def _record_usage(response, usage: dict):
+        if response.candidates:
+            usage["finish_reason"] = response.candidates[0].finish_reason
         try:
-            response = self.model.generate_content(prompt)
-        except Exception as e:
-            raise RuntimeError(f"Gemini API call failed using {self.model.model_name}: {str(e)}")
+            usage["prompt_tokens"] += response.usage_metadata.prompt_token_count
+            usage["output_tokens"] += response.usage_metadata.candidates_token_count
+            usage["cached_tokens"] += response.usage_metadata.cached_content_token_count or 0
+        except:
+            pass
 
-        if not response:
-            raise RuntimeError("Empty response object from Gemini")
+    def _should_continue(self, usage: dict) -> bool:
+        if usage["finish_reason"] != FINISH_MAX_TOKENS or usage["continuations"] >= self.max_continuations:
+            return False
+        usage["continuations"] += 1
+        print(f"Output hit MAX_TOKENS, requesting continuation {usage['continuations']}/{self.max_continuations}")
+        return True
 
+    @staticmethod
+    def _log_usage(usage: dict, label: str):
         # Check for safety blocks or other finish reasons
-        if response.candidates:
-            finish_reason = response.candidates[0].finish_reason
-            if finish_reason != 1:  # 1 is STOP (Natural stop)
-                print(f"WARNING: Game generation stopped prematurely. Reason: {finish_reason}")
-            
-            # Log token usage if available
-            try:
-                print(f"Tokens generated: {response.usage_metadata.candidates_token_count}")
-            except:
-                pass
+        if usage["finish_reason"] is not None and usage["finish_reason"] != FINISH_STOP:
+            print(f"WARNING: {label} stopped prematurely. Reason: {usage['finish_reason']}")
+        print(
+            f"Tokens generated: {usage['output_tokens']} "
+            f"(prompt tokens billed: {usage['prompt_tokens']}, cached: {usage['cached_tokens']}, "
+            f"prompt cache: {usage['prompt_cache']}, continuations: {usage['continuations']})"
+        )
+        metrics.record_generation(usage)
+
+    def _response_text(self, response) -> str:
+        if not response:
+            raise RuntimeError("Empty response object from Gemini")
 
         try:
             text = response.text
             if not text:
                 raise RuntimeError("Response text is empty")
-            return text.strip()
+            return text
         except ValueError:
             # This often happens when the model blocks the output due to safety
             reason = "Unknown"
@@ -60,3 +501,314 @@ class GeminiClient:
             raise RuntimeError(f"Gemini blocked the response. Feedback: {reason}")
         except Exception as e:
             raise RuntimeError(f"Error accessing Gemini response text: {str(e)}")
+
+    def generate(self, prompt: str, system_instruction: str = None, difficulty: str = None, model: str = None) -> str:
+        """
+        Sends prompt to Gemini and returns raw text output.
+        - The model is chosen by ModelRouter (or forced with `model`); timeouts, quota and
+          availability errors fall back to the next model, and GEMINI_HEDGE races a second one.
+        - The static `system_instruction` (if given) goes out as a cached-content handle
+          or system instruction per GEMINI_PROMPT_CACHE, falling back to the full prompt.
+        - If the output stops on MAX_TOKENS, asks the model to continue (bounded by
+          GEMINI_MAX_CONTINUATIONS) and stitches the pieces together.
+        """
+        models = self.router.plan(difficulty, prompt, model)
+        if self.router.hedge and len(models) > 1:
+            text, usage = self._generate_hedged(models, prompt, system_instruction)
+        else:
+            text, usage = self._generate_with_fallback(models, prompt, system_instruction)
+        self._local.usage = usage
+        return text
+
+    def _generate_with_fallback(self, models: list, prompt: str, system_instruction: str):
+        for i, model_name in enumerate(models):
+            try:
+                return self._attempt(model_name, prompt, system_instruction)
+            except RuntimeError as e:
+                if i == len(models) - 1 or not classify_error(e):
+                    raise
+                self.router.fallbacks_used += 1
+                print(f"Warning: {model_name} failed ({classify_error(e)}), falling back to {models[i + 1]}: {e}")
+
+    def _generate_hedged(self, models: list, prompt: str, system_instruction: str):
+        primary, backup = models[0], models[1]
+        futures = {self.router.executor.submit(self._attempt, primary, prompt, system_instruction): primary}
+        done, _ = wait(futures, timeout=self.router.hedge_delay(primary))
+        if not done:
+            self.router.hedges += 1
+            print(f"{primary} slower than its p95, hedging with {backup}")
+            futures[self.router.executor.submit(self._attempt, backup, prompt, system_instruction)] = backup
+
+        error = None
+        for future in as_completed(futures):
+            try:
+                text, usage = future.result()
+            except RuntimeError as e:
+                error = e
+                continue
+            if futures[future] != primary:
+                self.router.record_hedge_win(futures[future])
+            return text, usage
+
+        # Primary failed before the hedge fired: plain fallback through the rest
+        if len(futures) == 1 and classify_error(error):
+            self.router.fallbacks_used += 1
+            return self._generate_with_fallback(models[1:], prompt, system_instruction)
+        raise error
+
+    def _should_retry(self, model_name: str, retry: int, error: Exception) -> bool:
+        """Backs off before another try on the same model if the error is transient."""
+        if retry >= self.max_retries or classify_error(error) not in RETRY_SAME_MODEL:
+            return False
+        delay = backoff_delay(retry, self.retry_base_delay, self.retry_max_delay)
+        self.router.retries += 1
+        print(f"Warning: {model_name} failed ({classify_error(error)}), retry {retry + 1}/{self.max_retries} in {delay:.1f}s")
+        time.sleep(delay)
+        return True
+
+    def _attempt(self, model_name: str, prompt: str, system_instruction: str):
+        """One model, retrying transient errors. Returns (text, usage)."""
+        retry = 0
+        while True:
+            try:
+                return self._attempt_once(model_name, prompt, system_instruction)
+            except RuntimeError as e:
+                if not self._should_retry(model_name, retry, e):
+                    raise
+                retry += 1
+
+    def _attempt_once(self, model_name: str, prompt: str, system_instruction: str):
+        """One call to one model, with the prompt-cache fallback."""
+        usage = self._new_usage(model_name)
+        model, mode = self._model_for(model_name, system_instruction)
+        start = time.perf_counter()
+        try:
+            if mode != "off":
+                try:
+                    text = self._generate(model, prompt, usage, mode)
+                    self.router.record_success(model_name, time.perf_counter() - start)
+                    return text, usage
+                except RuntimeError as e:
+                    # Quota/timeouts are the router's to handle; a full-prompt retry would hit them too
+                    if classify_error(e):
+                        raise
+                    self._fall_back(model_name, mode, system_instruction, e)
+                    usage = self._new_usage(model_name)
+            text = self._generate(self._plain_model(model_name), (system_instruction or "") + prompt, usage, "off")
+        except RuntimeError as e:
+            self.router.record_error(model_name, e)
+            raise
+        self.router.record_success(model_name, time.perf_counter() - start)
+        return text, usage
+
+    def _generate(self, model, prompt: str, usage: dict, mode: str) -> str:
+        usage["prompt_cache"] = mode
+        contents = prompt
+        text = ""
+
+        while True:
+            reserved = self._reserve_quota(usage, contents)
+            try:
+                response = model.generate_content(contents, request_options={"timeout": self.timeout})
+            except Exception as e:
+                raise RuntimeError(f"Gemini API call failed using {usage['model']}: {str(e)}") from e
+
+            self._record_usage(response, usage)
+            self._settle_quota(usage, reserved)
+            piece = self._response_text(response)
+            text = text + stitch_overlap(text, piece) if text else piece
+
+            if not self._should_continue(usage):
+                break
+            contents = self._continuation_contents(prompt, text)
+
+        self._log_usage(usage, "Game generation")
+        return text.strip()
+
+    def generate_stream(self, prompt: str, system_instruction: str = None, difficulty: str = None):
+        """
+        Streams raw text chunks from Gemini as they are produced.
+        Handles routing, the system instruction and MAX_TOKENS continuations the way
+        generate() does. Fallbacks only happen before the first chunk; hedging races
+        two models to their first chunk and streams the winner.
+        """
+        models = self.router.plan(difficulty, prompt)
+        if self.router.hedge and len(models) > 1:
+            yield from self._stream_hedged(models, prompt, system_instruction)
+            return
+
+        for i, model_name in enumerate(models):
+            streamed = False
+            try:
+                for piece in self._attempt_stream(model_name, prompt, system_instruction):
+                    streamed = True
+                    yield piece
+                return
+            except RuntimeError as e:
+                if streamed or i == len(models) - 1 or not classify_error(e):
+                    raise
+                self.router.fallbacks_used += 1
+                print(f"Warning: {model_name} failed ({classify_error(e)}), falling back to {models[i + 1]}: {e}")
+
+    def _stream_hedged(self, models: list, prompt: str, system_instruction: str):
+        primary, backup = models[0], models[1]
+        events = queue.Queue()
+        stopped = set()  # producers whose output is no longer wanted
+
+        def produce(model_name):
+            try:
+                for piece in self._attempt_stream(model_name, prompt, system_instruction):
+                    if model_name in stopped:
+                        return
+                    events.put((model_name, "chunk", piece))
+                events.put((model_name, "done", self.last_usage))
+            except Exception as e:
+                events.put((model_name, "error", e))
+
+        def start(model_name):
+            started.append(model_name)
+            self.router.executor.submit(produce, model_name)
+
+        winner = None
+        started = []
+        failed = set()
+        start(primary)
+        deadline = time.monotonic() + self.router.hedge_delay(primary, stream=True)
+
+        try:
+            while True:
+                timeout = None if winner or backup in started else max(deadline - time.monotonic(), 0)
+                try:
+                    model_name, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    self.router.hedges += 1
+                    print(f"{primary} first token slower than its p95, hedging with {backup}")
+                    start(backup)
+                    continue
+
+                if winner is None:
+                    if kind == "error":
+                        failed.add(model_name)
+                        if backup not in started and classify_error(value):
+                            # Primary failed before the hedge fired: fall back straight away
+                            self.router.fallbacks_used += 1
+                            start(backup)
+                        elif len(failed) == len(started):
+                            raise value
+                        continue
+                    winner = model_name
+                    stopped.update(m for m in started if m != winner)
+                    if winner != primary and primary not in failed:
+                        self.router.record_hedge_win(winner)
+
+                if model_name != winner:
+                    continue
+                if kind == "chunk":
+                    yield value
+                elif kind == "done":
+                    self._local.usage = value
+                    return
+                else:
+                    raise value
+        finally:
+            # Client went away or we are done: let any producer still running stop early
+            stopped.update(started)
+
+    def _attempt_stream(self, model_name: str, prompt: str, system_instruction: str):
+        """One model, retrying transient errors that happen before anything was yielded."""
+        retry = 0
+        while True:
+            streamed = False
+            try:
+                for piece in self._attempt_stream_once(model_name, prompt, system_instruction):
+                    streamed = True
+                    yield piece
+                return
+            except RuntimeError as e:
+                if streamed or not self._should_retry(model_name, retry, e):
+                    raise
+                retry += 1
+
+    def _attempt_stream_once(self, model_name: str, prompt: str, system_instruction: str):
+        """One streamed call to one model, with the prompt-cache fallback (only before anything was yielded)."""
+        usage = self._new_usage(model_name)
+        model, mode = self._model_for(model_name, system_instruction)
+        start = time.perf_counter()
+        try:
+            if mode != "off":
+                streamed = False
+                try:
+                    for piece in self._generate_stream(model, prompt, usage, mode):
+                        streamed = True
+                        yield piece
+                    self.router.record_success(model_name, time.perf_counter() - start, usage["first_token_seconds"])
+                    return
+                except RuntimeError as e:
+                    if streamed or classify_error(e):
+                        raise
+                    self._fall_back(model_name, mode, system_instruction, e)
+                    usage = self._new_usage(model_name)
+            yield from self._generate_stream(self._plain_model(model_name), (system_instruction or "") + prompt, usage, "off")
+        except RuntimeError as e:
+            self.router.record_error(model_name, e)
+            raise
+        self.router.record_success(model_name, time.perf_counter() - start, usage["first_token_seconds"])
+
+    def _generate_stream(self, model, prompt: str, usage: dict, mode: str):
+        usage["prompt_cache"] = mode
+        contents = prompt
+        text = ""
+        start = time.perf_counter()
+
+        while True:
+            reserved = self._reserve_quota(usage, contents)
+            try:
+                response = model.generate_content(contents, stream=True, request_options={"timeout": self.timeout})
+            except Exception as e:
+                raise RuntimeError(f"Gemini API call failed using {usage['model']}: {str(e)}") from e
+
+            # Continuation output is buffered until it is long enough to drop a repeated prefix
+            dedupe = bool(text)
+            buffered = ""
+            try:
+                for chunk in response:
+                    try:
+                        piece = chunk.text
+                    except ValueError:
+                        # Chunks without text parts (e.g. the final finish_reason chunk)
+                        continue
+                    if not piece:
+                        continue
+                    if usage["first_token_seconds"] is None:
+                        # Time to first token: dominated by prefill of the (uncached) prompt
+                        usage["first_token_seconds"] = time.perf_counter() - start
+                    if dedupe:
+                        buffered += piece
+                        if len(buffered) < OVERLAP_WINDOW:
+                            continue
+                        piece = stitch_overlap(text, buffered)
+                        dedupe = False
+                    text += piece
+                    yield piece
+            except Exception as e:
+                raise RuntimeError(f"Gemini stream failed using {usage['model']}: {str(e)}") from e
+
+            if dedupe and buffered:
+                piece = stitch_overlap(text, buffered)
+                if piece:
+                    text += piece
+                    yield piece
+
+            self._record_usage(response, usage)
+            self._settle_quota(usage, reserved)
+            if not text:
+                reason = "Unknown"
+                if response.prompt_feedback:
+                    reason = str(response.prompt_feedback)
+                raise RuntimeError(f"Gemini returned no content. Feedback: {reason}")
+
+            if not self._should_continue(usage):
+                break
+            contents = self._continuation_contents(prompt, text)
+
+        self._log_usage(usage, "Streamed game generation")
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercases, collapses whitespace and drops trailing punctuation."""
+    return " ".join(prompt.lower().split()).rstrip(".!?")
+
+
+class GenerationCache:
+    """
+    Content-addressed cache for raw model output; post-processing runs on every hit.
+
+    Tier 1 is an in-process LRU bounded by entry count, total bytes and TTL.
+    Tier 2 is optional and goes through kv_client, so hits are shared across
+    instances. A KV hit is promoted into the LRU.
+    """
+
+    def __init__(self, kv=None, max_entries: int = None, max_bytes: int = None, ttl: int = None):
+        self.kv = kv
+        self.max_entries = max_entries or int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "128"))
+        self.max_bytes = max_bytes or int(os.getenv("GENERATION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        self.ttl = ttl or int(os.getenv("GENERATION_CACHE_TTL", "86400"))
+        self.enabled = os.getenv("GENERATION_CACHE_ENABLED", "1") != "0"
+
+        self._entries = OrderedDict()  # key -> (expires_at, html, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.kv_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(prompt: str, difficulty: str, is_timed: bool, model_name: str, template_version: str) -> str:
+        raw = "\x1f".join([
+            normalize_prompt(prompt),
+            difficulty.strip().lower(),
+            "timed" if is_timed else "untimed",
+            model_name,
+            template_version,
+        ])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, html, _ = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return html
+                self._remove(key)
+
+        html = None
+        if self.kv is not None:
+            try:
+                html = self.kv.get_cached_generation(key)
+            except Exception as e:
+                print(f"Warning: Generation cache KV lookup failed: {e}")
+
+        with self._lock:
+            if html:
+                self.kv_hits += 1
+                self._insert(key, html)
+                return html
+            self.misses += 1
+        return None
+
+    def set(self, key: str, html: str):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._insert(key, html)
+
+        if self.kv is not None:
+            try:
+                self.kv.save_cached_generation(key, html, ttl=self.ttl)
+            except Exception as e:
+                print(f"Warning: Generation cache KV write failed: {e}")
+
+    def _insert(self, key: str, html: str):
+        size = len(html.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.time() + self.ttl, html, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.kv_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "kv_hits": self.kv_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.kv_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,238 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+class Job:
+    """A single queued generation and its lifecycle state."""
+
+    def __init__(self, job_id: str, payload, handler=None):
+        self.id = job_id
+        self.payload = payload
+        # Overrides the queue's handler; such jobs are anonymous (see JobQueue.run)
+        self.handler = handler
+        self.status = "queued"  # queued -> running -> succeeded | failed, or queued -> cancelled
+        self.result = None
+        self.error = None
+        self.exception = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class InMemoryJobBackend:
+    """
+    Keeps pending work and job state in process memory.
+    Good enough for a single instance; no Redis required.
+    """
+
+    def __init__(self, retention: int = 3600):
+        self.retention = retention
+        self.jobs = {}
+        self._queue = None
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        # Created lazily so it binds to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def put(self, job: Job):
+        self.save(job)
+        await self.queue.put(job.id)
+
+    async def get(self) -> Job:
+        job_id = await self.queue.get()
+        return self.jobs[job_id]
+
+    def save(self, job: Job):
+        self.jobs[job.id] = job
+        self._prune()
+
+    def load(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def delete(self, job_id: str):
+        self.jobs.pop(job_id, None)
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        expired = [j.id for j in self.jobs.values() if j.finished and j.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+
+class JobQueue:
+    """
+    Bounded asyncio worker pool. Each worker pulls a job from the backend and
+    runs the (blocking) handler in a thread, so at most `concurrency` handlers
+    are in flight regardless of how many requests arrive.
+
+    Generation that can't be a job (the SSE stream's producer thread) takes one
+    of the same `concurrency` slots through slot(), so the bound is global.
+    """
+
+    def __init__(self, handler, backend=None, concurrency: int = None, max_depth: int = None):
+        self.handler = handler
+        self.backend = backend or InMemoryJobBackend()
+        self.concurrency = concurrency or int(os.getenv("GENERATION_CONCURRENCY", "4"))
+        # Jobs allowed to wait before new submissions are turned away (0 = unbounded)
+        self.max_depth = max_depth if max_depth is not None else int(os.getenv("GENERATION_MAX_QUEUE", "32"))
+        self._workers = []
+        self._slots = threading.Semaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._waiters = {}  # job id -> futures resolved when the job finishes
+        self.running = 0
+        self.waiting = 0  # threads blocked on a slot
+        self.rejected = 0
+        self.cancelled = 0
+        # Moving average of handler run time, for Retry-After estimates
+        self.avg_seconds = None
+
+    def _ensure_workers(self):
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def submit(self, payload, job_id: str = None, handler=None) -> Job:
+        job = Job(job_id or uuid.uuid4().hex, payload, handler)
+        await self.backend.put(job)
+        self._ensure_workers()
+        return job
+
+    async def wait(self, job: Job) -> Job:
+        """Resolves once the job has succeeded or failed."""
+        if job.finished:
+            return job
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job.id, []).append(future)
+        return await future
+
+    async def run(self, handler, payload):
+        """
+        Runs handler(payload) as an anonymous job, queued behind the others, and
+        returns its result or raises what it raised. The job is not kept afterwards.
+        If the caller is cancelled before a worker picks the job up, it never runs.
+        """
+        job = await self.submit(payload, handler=handler)
+        try:
+            job = await self.wait(job)
+        except asyncio.CancelledError:
+            self.cancel(job)
+            raise
+        if job.exception is not None:
+            raise job.exception
+        return job.result
+
+    @contextmanager
+    def slot(self):
+        """Holds one of the `concurrency` generation slots (blocking; call from a thread)."""
+        with self._lock:
+            self.waiting += 1
+        self._slots.acquire()
+        with self._lock:
+            self.waiting -= 1
+            self.running += 1
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            with self._lock:
+                self.running -= 1
+                self.avg_seconds = seconds if self.avg_seconds is None else 0.8 * self.avg_seconds + 0.2 * seconds
+            self._slots.release()
+
+    def _run_in_slot(self, handler, payload):
+        with self.slot():
+            return handler(payload)
+
+    def cancel(self, job: Job):
+        """Marks a job that hasn't started so workers skip it; a running job is left to finish."""
+        if job.status != "queued":
+            return
+        job.status = "cancelled"
+        job.finished_at = time.time()
+        self.cancelled += 1
+        self._waiters.pop(job.id, None)
+
+    def get(self, job_id: str):
+        return self.backend.load(job_id)
+
+    def depth(self) -> int:
+        return self.backend.depth()
+
+    def saturated(self, count: int = 1) -> bool:
+        """Whether `count` more jobs would overfill the queue (a batch larger than the queue fits an empty one)."""
+        if not self.max_depth:
+            return False
+        return self.depth() + self.waiting + min(count, self.max_depth) > self.max_depth
+
+    def estimated_wait(self) -> float:
+        """Seconds until a job submitted now would start, from queue depth and recent run times."""
+        ahead = self.depth() + self.waiting + self.running - self.concurrency + 1
+        if ahead <= 0:
+            return 0.0
+        return ahead / self.concurrency * (self.avg_seconds or 30.0)
+
+    def reject(self):
+        self.rejected += 1
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "running": self.running,
+            "waiting": self.waiting,
+            "concurrency": self.concurrency,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "avg_seconds": self.avg_seconds,
+        }
+
+    async def _worker(self):
+        while True:
+            job = await self.backend.get()
+            if job.status == "cancelled":
+                self.backend.delete(job.id)
+                continue
+            job.status = "running"
+            job.started_at = time.time()
+            self.backend.save(job)
+            try:
+                job.result = await asyncio.to_thread(self._run_in_slot, job.handler or self.handler, job.payload)
+                job.status = "succeeded"
+            except Exception as e:
+                job.error = str(e)
+                job.exception = e
+                job.status = "failed"
+            job.finished_at = time.time()
+            if job.handler is not None:
+                self.backend.delete(job.id)
+            else:
+                self.backend.save(job)
+            for future in self._waiters.pop(job.id, ()):
+                if not future.done():
+                    future.set_result(job)
@@ -1,98 +1,432 @@
+import base64
 import os
-from upstash_redis import Redis
+import threading
+import time
+from collections import deque
+
+import httpx
 from dotenv import load_dotenv
 from pathlib import Path
 
+from backend.metrics import metrics
+from backend.utils import compress_html, decompress_html
+
 # Load env from parent dir if needed
 env_path = Path(__file__).parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
+
+class KVError(RuntimeError):
+    """Error reported by the KV backend (Upstash REST API or the local SQLite store)."""
+
+
+# KV retention for game HTML
+GENERATED_GAME_TTL = 86400  # 24h drafts
+PUBLISHED_GAME_TTL = 604800  # 7 days
+
+# Compressed game values are "gz1:" + base64(gzip(html)); anything else is a legacy raw entry
+GZIP_MARKER = "gz1:"
+
+
+def encode_game(html_content: str, compress: bool = True) -> str:
+    if not compress:
+        return html_content
+    return GZIP_MARKER + base64.b64encode(compress_html(html_content)).decode("ascii")
+
+
+def decode_game(value, decompress: bool = True):
+    """
+    Returns the stored game as HTML text. With decompress=False, compressed entries
+    are returned as raw gzip bytes (ready to send with Content-Encoding: gzip),
+    while legacy entries are still returned as text.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    if not value.startswith(GZIP_MARKER):
+        return value
+    data = base64.b64decode(value[len(GZIP_MARKER):])
+    return decompress_html(data) if decompress else data
+
+
+def parse_flat_scores(results) -> list:
+    """Raw WITHSCORES reply: [member, score, member, score, ...]."""
+    if not results:
+        return []
+    return [{"name": str(results[i]), "score": float(results[i + 1])} for i in range(0, len(results) - 1, 2)]
+
+
+class LatencyRecorder:
+    """Keeps a bounded window of recent call latencies per operation."""
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, op: str, seconds: float):
+        with self._lock:
+            if op not in self._samples:
+                self._samples[op] = deque(maxlen=self.window)
+                self._counts[op] = 0
+            self._samples[op].append(seconds)
+            self._counts[op] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = {op: sorted(samples) for op, samples in self._samples.items()}
+            counts = dict(self._counts)
+
+        def pct(values, p):
+            return values[min(int(len(values) * p), len(values) - 1)]
+
+        return {
+            op: {
+                "count": counts[op],
+                "p50_ms": pct(values, 0.50) * 1000,
+                "p99_ms": pct(values, 0.99) * 1000,
+                "max_ms": values[-1] * 1000,
+            }
+            for op, values in snapshot.items() if values
+        }
+
+
+class UpstashRest:
+    """
+    Minimal Upstash REST transport on pooled keep-alive HTTP sessions.
+    The sync session serves threadpool handlers; the async one serves `async def` handlers.
+    """
+
+    def __init__(self, url: str, token: str, pool_size: int = 20, timeout: float = 10.0, connect_timeout: float = 5.0):
+        self.url = url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=60,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._sync = httpx.Client(headers=self.headers, limits=self.limits, timeout=self.timeout)
+        self._async = None
+
+    @property
+    def async_session(self) -> httpx.AsyncClient:
+        # Created lazily so it is bound to the running event loop
+        if self._async is None:
+            self._async = httpx.AsyncClient(headers=self.headers, limits=self.limits, timeout=self.timeout)
+        return self._async
+
+    @staticmethod
+    def _result(response: httpx.Response):
+        data = response.json()
+        if isinstance(data, dict) and data.get("error"):
+            raise KVError(data["error"])
+        response.raise_for_status()
+        return data["result"]
+
+    @staticmethod
+    def _pipeline_results(response: httpx.Response) -> list:
+        data = response.json()
+        if isinstance(data, dict) and data.get("error"):
+            raise KVError(data["error"])
+        response.raise_for_status()
+        for item in data:
+            if item.get("error"):
+                raise KVError(item["error"])
+        return [item["result"] for item in data]
+
+    def execute(self, *command):
+        return self._result(self._sync.post(self.url, json=[str(c) for c in command]))
+
+    async def aexecute(self, *command):
+        return self._result(await self.async_session.post(self.url, json=[str(c) for c in command]))
+
+    def pipeline(self, commands: list) -> list:
+        """Sends several commands in one round trip via the /pipeline endpoint."""
+        body = [[str(c) for c in command] for command in commands]
+        return self._pipeline_results(self._sync.post(f"{self.url}/pipeline", json=body))
+
+    async def apipeline(self, commands: list) -> list:
+        body = [[str(c) for c in command] for command in commands]
+        return self._pipeline_results(await self.async_session.post(f"{self.url}/pipeline", json=body))
+
+    async def asubscribe(self, channel: str):
+        """
+        Yields messages published on `channel`, via the streaming /subscribe endpoint.
+        Uses its own connection since the stream stays open indefinitely.
+        """
+        timeout = httpx.Timeout(None, connect=self.timeout.connect)
+        headers = {**self.headers, "Accept": "text/event-stream"}
+        async with httpx.AsyncClient(headers=headers, timeout=timeout) as session:
+            async with session.stream("POST", f"{self.url}/subscribe/{channel}") as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    # Events look like "data: message,<channel>,<payload>"
+                    if not line.startswith("data:"):
+                        continue
+                    kind, _, rest = line[5:].strip().partition(",")
+                    if kind == "message":
+                        yield rest.partition(",")[2]
+
+    def close(self):
+        self._sync.close()
+
+
 class KVClient:
     def __init__(self):
         # Try Vercel KV vars first, then generic Upstash vars
         url = os.getenv("KV_REST_API_URL") or os.getenv("UPSTASH_REDIS_REST_URL")
         token = os.getenv("KV_REST_API_TOKEN") or os.getenv("UPSTASH_REDIS_REST_TOKEN")
-        
-        if not url or not token:
+        self.latency = LatencyRecorder()
+        self.backend = os.getenv("KV_BACKEND", "upstash")
+
+        if self.backend == "sqlite":
+            # Embedded local store for self-hosted deployments and tests
+            from backend.sqlite_store import SqliteStore
+            default_path = Path(__file__).parent.parent / "data" / "kv.sqlite3"
+            self.client = SqliteStore(os.getenv("KV_SQLITE_PATH", str(default_path)))
+            print(f"Using SQLite KV backend at {self.client.path}")
+        elif not url or not token:
             self.client = None
             print("WARNING: Vercel KV credentials missing. Global leaderboard will be disabled.")
         else:
-            self.client = Redis(url=url, token=token)
+            self.client = UpstashRest(
+                url,
+                token,
+                pool_size=int(os.getenv("KV_POOL_SIZE", "20")),
+                timeout=float(os.getenv("KV_TIMEOUT", "10")),
+                connect_timeout=float(os.getenv("KV_CONNECT_TIMEOUT", "5")),
+            )
+        self.compress_games = os.getenv("KV_COMPRESS_GAMES", "1") != "0"
 
     def is_enabled(self):
         return self.client is not None
 
+    def _call(self, op: str, *command):
+        start = time.perf_counter()
+        try:
+            return self.client.execute(*command)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.latency.record(op, elapsed)
+            metrics.kv_seconds.observe(elapsed, op=op)
+
+    async def _acall(self, op: str, *command):
+        start = time.perf_counter()
+        try:
+            return await self.client.aexecute(*command)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.latency.record(op, elapsed)
+            metrics.kv_seconds.observe(elapsed, op=op)
+
+    def _pipeline(self, op: str, commands: list) -> list:
+        start = time.perf_counter()
+        try:
+            return self.client.pipeline(commands)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.latency.record(op, elapsed)
+            metrics.kv_seconds.observe(elapsed, op=op)
+
+    async def _apipeline(self, op: str, commands: list) -> list:
+        start = time.perf_counter()
+        try:
+            return await self.client.apipeline(commands)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.latency.record(op, elapsed)
+            metrics.kv_seconds.observe(elapsed, op=op)
+
     def submit_score(self, game_id: str, name: str, score: float):
         if not self.client:
             return None
-        
-        # Use a sorted set for leaderboard
+
+        # Use a sorted set for leaderboard; GT keeps each player's best score
+        key = f"leaderboard:{game_id}"
+        return self._call("submit_score", "ZADD", key, "GT", score, name)
+
+    async def submit_scores_async(self, scores: dict):
+        """
+        Writes {game_id: {player: score}} in one pipelined request, one ZADD per game.
+        GT keeps each player's best score, as on the direct submit path.
+        """
+        if not self.client or not scores:
+            return None
+        commands = []
+        for game_id, players in scores.items():
+            command = ["ZADD", f"leaderboard:{game_id}", "GT"]
+            for name, score in players.items():
+                command += [score, name]
+            commands.append(command)
+        return await self._apipeline("submit_scores", commands)
+
+    @staticmethod
+    def _submit_and_fetch_commands(game_id: str, name: str, score: float, limit: int, with_rank: bool) -> list:
         key = f"leaderboard:{game_id}"
-        return self.client.zadd(key, {name: score})
+        commands = [
+            ["ZADD", key, "GT", score, name],
+            ["ZREVRANGE", key, 0, limit - 1, "WITHSCORES"],
+            ["ZCARD", key],
+        ]
+        if with_rank:
+            commands.append(["ZREVRANK", key, name])
+        return commands
+
+    def _submit_and_fetch_result(self, results: list) -> dict:
+        leaderboard = parse_flat_scores(results[1])
+        for i, entry in enumerate(leaderboard):
+            entry["rank"] = i + 1
+        result = {"leaderboard": leaderboard, "total": results[2]}
+        if len(results) > 3:
+            # ZREVRANK is 0-based; players think in 1-based ranks
+            result["rank"] = results[3] + 1 if results[3] is not None else None
+        return result
+
+    def submit_score_and_get_leaderboard(self, game_id: str, name: str, score: float, limit: int = 10, with_rank: bool = True):
+        """
+        ZADD + ZREVRANGE + ZCARD (+ ZREVRANK) in a single round trip. Returns
+        {"leaderboard": [...], "total": players on the board, "rank": 1-based rank of `name`}.
+        """
+        if not self.client:
+            return None
+        commands = self._submit_and_fetch_commands(game_id, name, score, limit, with_rank)
+        return self._submit_and_fetch_result(self._pipeline("submit_score_and_fetch", commands))
+
+    async def submit_score_and_get_leaderboard_async(self, game_id: str, name: str, score: float, limit: int = 10, with_rank: bool = True):
+        if not self.client:
+            return None
+        commands = self._submit_and_fetch_commands(game_id, name, score, limit, with_rank)
+        return self._submit_and_fetch_result(await self._apipeline("submit_score_and_fetch", commands))
 
     def get_leaderboard(self, game_id: str, limit: int = 10):
         if not self.client:
             return []
-        
+
         key = f"leaderboard:{game_id}"
         # Get top scores (descending)
-        # Get top scores (descending)
         try:
-            # upstash-redis might not support desc=True in zrange. Use zrevrange instead.
-            results = self.client.zrevrange(key, 0, limit - 1, withscores=True)
-            print(f"DEBUG: Leaderboard raw results: {results}") # Log for debugging
-            
-            # Clean up the parsing logic
-            if not results:
-                return []
-
-            # Check structure of the first item
-            first_item = results[0]
-            print(f"DEBUG: First item type: {type(first_item)}, content: {first_item}")
-
-            # Scenario A: List of objects (ScoredMember from upstash-redis)
-            # We access .member and .score directly.
-            if hasattr(first_item, 'member') and hasattr(first_item, 'score'):
-                return [{"name":str(item.member), "score": float(item.score)} for item in results]
-
-            # Scenario B: List of dictionaries (JSON response sometimes)
-            if isinstance(first_item, dict):
-                 # Try to find common keys
-                 name = first_item.get('member') or first_item.get('name') or first_item.get('value')
-                 score = first_item.get('score')
-                 if name is not None and score is not None:
-                     return [{"name": str(item.get('member', item.get('name'))), "score": float(item.get('score', 0))} for item in results]
-
-            # Scenario C: List of tuples/lists [(name, score), ...]
-            if isinstance(first_item, (list, tuple)):
-                 return [{"name": str(item[0]), "score": float(item[1])} for item in results]
-
-            # Scenario D: Flat list [name, score, name, score]
-            # This is the "raw" Redis response for withscores=True
-            formatted = []
-            for i in range(0, len(results), 2):
-                if i + 1 < len(results):
-                    name = str(results[i])
-                    score = float(results[i+1])
-                    formatted.append({"name": name, "score": score})
-            return formatted
+            results = self._call("get_leaderboard", "ZREVRANGE", key, 0, limit - 1, "WITHSCORES")
+            return parse_flat_scores(results)
+        except Exception as e:
+            print(f"ERROR Parsing Leaderboard: {e}")
+            return []
+
+    async def publish_async(self, channel: str, message: str):
+        if not self.client:
+            return None
+        return await self._acall("publish", "PUBLISH", channel, message)
+
+    def supports_pubsub(self) -> bool:
+        return self.client is not None and hasattr(self.client, "asubscribe")
+
+    def subscribe_async(self, channel: str):
+        """Async iterator over messages on a pub/sub channel."""
+        return self.client.asubscribe(channel)
 
+    async def get_leaderboard_async(self, game_id: str, limit: int = 10):
+        if not self.client:
+            return []
+
+        key = f"leaderboard:{game_id}"
+        try:
+            results = await self._acall("get_leaderboard", "ZREVRANGE", key, 0, limit - 1, "WITHSCORES")
+            return parse_flat_scores(results)
         except Exception as e:
             print(f"ERROR Parsing Leaderboard: {e}")
             return []
 
-    def save_game(self, game_id: str, html_content: str, ttl: int = 86400):
-        """Saves generated game HTML to Redis with 24h expiration."""
+    async def get_leaderboard_page_async(self, game_id: str, offset: int = 0, limit: int = 10):
+        """
+        One page of the leaderboard plus its total size, in one round trip.
+        Returns (entries with 1-based `rank`, total players).
+        """
+        if not self.client:
+            return [], 0
+        key = f"leaderboard:{game_id}"
+        results, total = await self._apipeline("get_leaderboard_page", [
+            ["ZREVRANGE", key, offset, offset + limit - 1, "WITHSCORES"],
+            ["ZCARD", key],
+        ])
+        entries = parse_flat_scores(results)
+        for i, entry in enumerate(entries):
+            entry["rank"] = offset + i + 1
+        return entries, total
+
+    async def get_player_rank_async(self, game_id: str, name: str):
+        """Returns {"name", "rank" (1-based), "score"} for one player, or None if they have no score."""
+        if not self.client:
+            return None
+        key = f"leaderboard:{game_id}"
+        rank, score = await self._apipeline("get_player_rank", [
+            ["ZREVRANK", key, name],
+            ["ZSCORE", key, name],
+        ])
+        if rank is None:
+            return None
+        return {"name": name, "rank": rank + 1, "score": float(score)}
+
+    def save_game(self, game_id: str, html_content: str, ttl: int = GENERATED_GAME_TTL):
+        """Saves generated game HTML (gzip-compressed) to Redis with 24h expiration."""
         if not self.client:
             return False
         key = f"game_html:{game_id}"
-        return self.client.set(key, html_content, ex=ttl)
+        return self._call("save_game", "SET", key, encode_game(html_content, self.compress_games), "EX", ttl)
+
+    def save_games(self, games: dict, ttl: int = GENERATED_GAME_TTL, batch_size: int = 100):
+        """
+        Saves many games ({game_id: html}) with one pipelined request per `batch_size` games.
+        Used for bulk publishing and migrations.
+        """
+        if not self.client or not games:
+            return False
+        items = list(games.items())
+        for i in range(0, len(items), batch_size):
+            commands = [
+                ["SET", f"game_html:{game_id}", encode_game(html, self.compress_games), "EX", ttl]
+                for game_id, html in items[i:i + batch_size]
+            ]
+            self._pipeline("save_games", commands)
+        return True
 
-    def get_game(self, game_id: str):
-        """Retrieves game HTML from Redis."""
+    def get_game(self, game_id: str, decompress: bool = True):
+        """Retrieves game HTML from Redis, decompressing transparently (see decode_game)."""
         if not self.client:
             return None
         key = f"game_html:{game_id}"
-        return self.client.get(key)
+        return decode_game(self._call("get_game", "GET", key), decompress)
+
+    async def get_game_async(self, game_id: str, decompress: bool = True):
+        if not self.client:
+            return None
+        key = f"game_html:{game_id}"
+        return decode_game(await self._acall("get_game", "GET", key), decompress)
+
+    async def get_game_with_ttl_async(self, game_id: str, decompress: bool = True):
+        """
+        GET + TTL in one round trip. Returns (content, ttl_seconds); ttl is -1 for
+        keys without expiry and -2 when the key does not exist.
+        """
+        if not self.client:
+            return None, -2
+        key = f"game_html:{game_id}"
+        value, ttl = await self._apipeline("get_game", [["GET", key], ["TTL", key]])
+        return decode_game(value, decompress), ttl
+
+    def save_cached_generation(self, cache_key: str, html_content: str, ttl: int = 86400):
+        """Stores raw model output for the generation cache (post-processed on each hit)."""
+        if not self.client:
+            return False
+        key = f"gen_cache:{cache_key}"
+        return self._call("save_cached_generation", "SET", key, encode_game(html_content, self.compress_games), "EX", ttl)
+
+    def get_cached_generation(self, cache_key: str):
+        """Retrieves cached generation output, if any."""
+        if not self.client:
+            return None
+        key = f"gen_cache:{cache_key}"
+        return decode_game(self._call("get_cached_generation", "GET", key))
 
 kv_client = KVClient()
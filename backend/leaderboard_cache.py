@@ -0,0 +1,98 @@
+import asyncio
+import os
+import time
+
+
+class LeaderboardCache:
+    """
+    Short-TTL cache of leaderboard heads (ranked top-N plus the board's size),
+    keyed by (game_id, limit).
+
+    Games poll /leaderboard/{game_id}; within one TTL window every poll for the
+    same game is served from memory, and concurrent misses share a single KV
+    fetch. Score submissions write their freshly pipelined top-N through, so
+    readers on this instance see new scores immediately rather than after the TTL.
+    """
+
+    def __init__(self, kv, ttl: float = None):
+        self.kv = kv
+        self.ttl = ttl if ttl is not None else float(os.getenv("LEADERBOARD_CACHE_TTL", "2"))
+        self._entries = {}  # (game_id, limit) -> (expires_at, (leaderboard, total))
+        self._inflight = {}  # (game_id, limit) -> asyncio.Future
+        # Bumped on writes so a fetch that started before a submit can't overwrite it.
+        # Only games with a fetch in flight have an entry, so this stays as small as _inflight.
+        self._versions = {}  # game_id -> int
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get(self, game_id: str, limit: int = 10) -> list:
+        return (await self.get_page(game_id, limit))[0]
+
+    async def get_page(self, game_id: str, limit: int = 10) -> tuple:
+        """(top `limit` entries with their `rank`, total players on the board)."""
+        key = (game_id, limit)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        pending = self._inflight.get(key)
+        if pending:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        version = self._versions.get(game_id, 0)
+        try:
+            page = await self.kv.get_leaderboard_page_async(game_id, 0, limit)
+            if self._versions.get(game_id, 0) == version:
+                self._store(key, page)
+            future.set_result(page)
+            return page
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so waiter-less futures don't log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            if not self._fetching(game_id):
+                self._versions.pop(game_id, None)
+
+    def _fetching(self, game_id: str) -> bool:
+        return any(k[0] == game_id for k in self._inflight)
+
+    def update(self, game_id: str, leaderboard: list, total: int, limit: int = 10):
+        """Write-through after a score submission; other limits for the game are dropped."""
+        self.invalidate(game_id)
+        self._store((game_id, limit), (leaderboard, total))
+
+    def invalidate(self, game_id: str):
+        if self._fetching(game_id):
+            self._versions[game_id] = self._versions.get(game_id, 0) + 1
+        for key in [k for k in self._entries if k[0] == game_id]:
+            del self._entries[key]
+
+    def _store(self, key, page: tuple):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        self._entries[key] = (now + self.ttl, page)
+        # Expired entries are swept lazily so idle games don't accumulate
+        if len(self._entries) > 1024:
+            for k in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+                del self._entries[k]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
@@ -1,14 +1,34 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import List
+from datetime import datetime
+import asyncio
+import hashlib
+import json
+import math
 import os
+import queue
+import re
+import threading
+import time
 import uuid
 
 from backend.gemini_client import GeminiClient
-from backend.prompt_templates import build_game_generation_prompt
-from backend.utils import clean_html_output
+from backend.jobs import JobQueue
+from backend.game_cache import GameCache
+from backend.game_editor import EDIT_SYSTEM_INSTRUCTION, EditFailed, GameEditor, game_id_of, render_metadata_script, split_metadata
+from backend.game_validator import GameValidator
+from backend.generation_cache import GenerationCache, normalize_prompt
+from backend.leaderboard_cache import LeaderboardCache
+from backend.metrics import metrics
+from backend.pubsub import create_broker
+from backend.score_buffer import ScoreBuffer
+from backend.singleflight import SingleFlight
+from backend.prompt_templates import prompt_registry
+from backend.utils import compress_html, decompress_html, HtmlPostProcessor
 
 # Reload triggered for model version update
 app = FastAPI(title="AI Game Generator")
@@ -18,39 +38,128 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if os.environ.get("VERCEL"):
     GENERATED_GAMES_DIR = "/tmp"
 else:
-    GENERATED_GAMES_DIR = os.path.join(BASE_DIR, "generated_games")
+    GENERATED_GAMES_DIR = os.getenv("GENERATED_GAMES_DIR", os.path.join(BASE_DIR, "generated_games"))
 
 os.makedirs(GENERATED_GAMES_DIR, exist_ok=True)
 
+# Games are immutable per game_id, so browsers may keep them for as long as KV does
+GAME_CACHE_MAX_AGE = int(os.getenv("GAME_CACHE_MAX_AGE", "86400"))
+STATIC_CACHE_MAX_AGE = int(os.getenv("STATIC_CACHE_MAX_AGE", "3600"))
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles already answers If-None-Match/If-Modified-Since with 304; this adds a max-age."""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", f"public, max-age={STATIC_CACHE_MAX_AGE}")
+        return response
+
+
 # Static files
-app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
+app.mount("/static", CachedStaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
+
+
+def game_file_paths(game_id: str):
+    """Compressed path first, then the legacy uncompressed one."""
+    base = os.path.join(GENERATED_GAMES_DIR, f"game_{game_id}.html")
+    return base + ".gz", base
+
+
+def write_game_file(game_id: str, html: str) -> bytes:
+    """Writes the game gzip-compressed to the (ephemeral) games directory. Returns the gzip bytes."""
+    gz_path, _ = game_file_paths(game_id)
+    with metrics.stage("disk_write"):
+        data = compress_html(html)
+        with open(gz_path, "wb") as f:
+            f.write(data)
+    return data
+
+
+def warm_game_cache(game_id: str, data: bytes, ttl: int):
+    """Replaces any cached copy (e.g. on publish) with freshly written content."""
+    game_cache.invalidate(game_id)
+    game_cache.put(game_id, data, game_etag(game_id, data), ttl)
+
+
+def accepts_gzip(request: Request) -> bool:
+    encodings = request.headers.get("accept-encoding", "").lower()
+    return "gzip" in encodings and "gzip;q=0" not in encodings.replace(" ", "")
+
+
+def game_etag(game_id: str, content) -> str:
+    """Weak ETag (same for the gzip and identity encodings), prefixed with the game id."""
+    data = content if isinstance(content, bytes) else content.encode("utf-8")
+    return f'W/"{game_id}-{hashlib.sha256(data).hexdigest()[:16]}"'
+
+
+def cached_game_etag(request: Request, game_id: str):
+    """
+    Returns the client's ETag if it was issued for this game_id. Game content never
+    changes for a given id, so any such tag is still valid and no KV lookup is needed.
+    """
+    prefix = f'"{game_id}-'
+    for tag in request.headers.get("if-none-match", "").split(","):
+        tag = tag.strip()
+        if tag.removeprefix("W/").startswith(prefix):
+            return tag
+    return None
+
+
+def game_cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": f"public, max-age={GAME_CACHE_MAX_AGE}, immutable"}
+
+
+def game_response(request: Request, game_id: str, content, etag: str = None) -> Response:
+    """
+    Serves stored game content. Gzip bytes go out as-is with Content-Encoding: gzip
+    when the client accepts it, skipping a decompress/recompress round trip.
+    """
+    headers = game_cache_headers(etag or game_etag(game_id, content))
+    if isinstance(content, bytes):
+        headers["Vary"] = "Accept-Encoding"
+        if accepts_gzip(request):
+            headers["Content-Encoding"] = "gzip"
+            return Response(content=content, media_type="text/html; charset=utf-8", headers=headers)
+        content = decompress_html(content)
+    return HTMLResponse(content=content, headers=headers)
+
+
 @app.get("/games/{filename}")
-def serve_game(filename: str):
+async def serve_game(filename: str, request: Request):
     # Extract ID. Filename format: game_{id}.html
     game_id = filename.replace("game_", "").replace(".html", "")
+
+    # 0. Revalidation: the browser already has this (immutable) game
+    etag = cached_game_etag(request, game_id)
+    if etag:
+        return Response(status_code=304, headers=game_cache_headers(etag))
     
-    # 1. Try Redis first (Persistent Storage)
-    content = kv_client.get_game(game_id)
+    # 1. Hot games are served from memory
+    cached = game_cache.get(game_id)
+    if cached:
+        content, etag = cached
+        return game_response(request, game_id, content, etag)
+
+    # 2. Try Redis (Persistent Storage); TTL comes back in the same round trip
+    content, ttl = await kv_client.get_game_with_ttl_async(game_id, decompress=False)
     if content:
-        # Redis might return bytes or string depending on client config, ensure string for HTMLResponse
-        if isinstance(content, bytes):
-            content = content.decode('utf-8')
-        return HTMLResponse(content=content)
+        etag = game_etag(game_id, content)
+        game_cache.put(game_id, content, etag, ttl if ttl > 0 else game_cache.max_ttl)
+        return game_response(request, game_id, content, etag)
 
-    # 2. Fallback to File System (Ephemeral)
-    file_path = os.path.join(GENERATED_GAMES_DIR, filename)
+    # 3. Fallback to File System (Ephemeral)
+    gz_path, file_path = game_file_paths(game_id)
+
+    if os.path.exists(gz_path):
+        with open(gz_path, "rb") as f:
+            return game_response(request, game_id, f.read())
 
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Game not found or expired. Please generate a new one.")
 
-    return FileResponse(
-        file_path,
-        media_type="text/html",
-        headers={
-            "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-            "Pragma": "no-cache",
-        }
-    )
+    with open(file_path, "r", encoding="utf-8") as f:
+        return game_response(request, game_id, f.read())
 
 
 gemini_client = None
@@ -68,92 +177,667 @@ class GameRequest(BaseModel):
     is_timed: bool = True
 
 
-@app.get("/", response_class=HTMLResponse)
-def read_root():
+# (mtime, content, etag) of static/index.html, re-read only when the file changes
+_index_cache = None
+
+
+def load_index():
+    global _index_cache
     # In Vercel, the file structure might be flattened or different.
     # We should rely on standard relative paths from the project root.
     index_path = os.path.join(BASE_DIR, "static", "index.html")
     if not os.path.exists(index_path):
         # Fallback for some serverless structures
         index_path = "static/index.html"
-    
-    try:
+
+    mtime = os.stat(index_path).st_mtime
+    if _index_cache is None or _index_cache[0] != mtime:
         with open(index_path, "r", encoding="utf-8") as f:
-            return f.read()
+            content = f.read()
+        etag = f'"{hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]}"'
+        _index_cache = (mtime, content, etag)
+    return _index_cache[1], _index_cache[2]
+
+
+@app.get("/", response_class=HTMLResponse)
+def read_root(request: Request):
+    try:
+        content, etag = load_index()
     except FileNotFoundError:
         return """
         <h1>AI Game Generator</h1>
         <p>Frontend file not found. Please ensure static/index.html exists.</p>
         """
 
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={STATIC_CACHE_MAX_AGE}"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=content, headers=headers)
 
-from backend.kv_client import kv_client
 
-@app.post("/generate-game")
-def generate_game(request: GameRequest):
-    if not request.prompt.strip():
-        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
+from backend.kv_client import kv_client, GENERATED_GAME_TTL, PUBLISHED_GAME_TTL
+
+# Short-TTL leaderboard reads, refreshed on every score submission
+leaderboard_cache = LeaderboardCache(kv_client)
+
+# Pushes each game's refreshed top 10 to /leaderboard/{game_id}/stream subscribers
+leaderboard_broker = create_broker(kv_client)
+LEADERBOARD_STREAM_HEARTBEAT = float(os.getenv("LEADERBOARD_STREAM_HEARTBEAT", "15"))
+
+# Optional write-behind for /submit-score: acknowledge from memory, flush batched ZADDs
+SCORE_WRITE_BEHIND = os.getenv("SCORE_WRITE_BEHIND", "0") == "1"
+score_buffer = None
+if SCORE_WRITE_BEHIND:
+    score_buffer = ScoreBuffer(
+        kv_client,
+        on_flush=lambda game_ids: [leaderboard_cache.invalidate(game_id) for game_id in game_ids]
+    )
+
+
+@app.on_event("startup")
+async def start_score_buffer():
+    if score_buffer:
+        score_buffer.start()
+
+
+@app.on_event("shutdown")
+async def flush_on_shutdown():
+    if score_buffer:
+        await score_buffer.close()
+    await leaderboard_broker.close()
+
+# In-process LRU of served game content, in front of KV
+game_cache = GameCache()
+
+# Cleaned output keyed on normalized prompt + options; the KV tier is shared across instances
+generation_cache = GenerationCache(kv=kv_client if os.getenv("GENERATION_CACHE_KV", "1") != "0" else None)
+
+# Identical concurrent generations (same built prompt + model) share one Gemini call
+generation_flights = SingleFlight()
 
+# Structural/JS checks on every generated game, with local fixes and focused section repairs
+game_validator = GameValidator()
+
+# Patch-based edits of stored games (/edit-game)
+game_editor = GameEditor()
+
+def select_prompt_template(request: GameRequest):
+    """Template (or A/B variant) for this request; identical prompts always get the same one."""
+    return prompt_registry.select(request.difficulty, normalize_prompt(request.prompt))
+
+
+def build_prompt_parts(request: GameRequest, template) -> tuple:
+    """
+    Builds the strict generation prompt with the [OPTIONS] block, split into the
+    static instruction and the per-request text (see PromptTemplate.render_parts).
+    """
+    prompt_with_options = request.prompt
+    prompt_with_options += f"\n\n[OPTIONS]\nDifficulty: {request.difficulty}\nTimed Mode: {'YES' if request.is_timed else 'NO'}"
+    return template.render_parts(prompt_with_options)
+
+
+def build_metadata_script(request: GameRequest, template) -> str:
+    """Metadata script tag used by the Import/Edit features."""
+    metadata = {
+        "prompt": request.prompt,
+        "difficulty": request.difficulty,
+        "is_timed": request.is_timed,
+        "template": template.id,
+        "generated_at": datetime.now().isoformat()
+    }
+    return render_metadata_script(metadata)
+
+
+def generation_cache_key(request: GameRequest, model_name: str, template) -> str:
+    return GenerationCache.make_key(
+        request.prompt, request.difficulty, request.is_timed, model_name, template.id
+    )
+
+
+def generate_recorded(client, template, prompt_parts: tuple, difficulty: str) -> str:
+    """client.generate(), with tokens and latency attributed to the template."""
+    system_instruction, prompt = prompt_parts
+    start = time.perf_counter()
+    with metrics.stage("model_call"):
+        html = client.generate(prompt, system_instruction=system_instruction, difficulty=difficulty)
+    prompt_registry.record(template.id, client.last_usage, time.perf_counter() - start)
+    return html
+
+
+def generate_stream_recorded(client, template, prompt_parts: tuple, difficulty: str):
+    system_instruction, prompt = prompt_parts
+    start = time.perf_counter()
+    yield from client.generate_stream(prompt, system_instruction=system_instruction, difficulty=difficulty)
+    seconds = time.perf_counter() - start
+    # Includes time the consumer spends between chunks; TTFT is recorded separately per model
+    metrics.stage_seconds.observe(seconds, stage="model_call")
+    prompt_registry.record(template.id, client.last_usage, seconds)
+
+
+def validate_generated_game(html: str, game_id: str, known: set = ()) -> tuple:
+    """
+    Runs game_validator on cleaned HTML; failing scripts are regenerated one
+    section at a time with the (cheap) repair model, unless all their problem
+    codes are in `known`. Returns (html, report).
+    """
+    client = get_gemini_client()
+
+    def regenerate(prompt: str):
+        return client.generate(prompt, model=game_validator.repair_model), client.last_usage
+
+    with metrics.stage("validate"):
+        return game_validator.process(html, game_id, regenerate, known)
+
+
+def save_generated_game(game_id: str, html: str) -> str:
+    """Writes the game to disk and Redis. Returns the filename."""
+    filename = f"game_{game_id}.html"
+    data = write_game_file(game_id, html)
+
+    # Save to Redis (Persistent Storage)
     try:
-        # Build strict prompt with options
-        prompt_with_options = request.prompt
-        prompt_with_options += f"\n\n[OPTIONS]\nDifficulty: {request.difficulty}\nTimed Mode: {'YES' if request.is_timed else 'NO'}"
-        
-        full_prompt = build_game_generation_prompt(prompt_with_options)
+        with metrics.stage("kv_write"):
+            kv_client.save_game(game_id, html, ttl=GENERATED_GAME_TTL)
+        print(f"Game saved to Redis: {game_id}")
+    except Exception as e:
+        print(f"Warning: Failed to save to Redis: {e}")
 
-        # Generate HTML from Gemini
-        client = get_gemini_client()
-        raw_html = client.generate(full_prompt)
+    warm_game_cache(game_id, data, GENERATED_GAME_TTL)
 
-        # Clean output defensively
-        clean_html = clean_html_output(raw_html)
-        
-        # Inject Game ID for the shared leaderboard
-        game_id = uuid.uuid4().hex
-        clean_html = clean_html.replace("[[GAME_ID]]", game_id)
-
-        # Inject Metadata for Import/Edit features
-        import json
-        from datetime import datetime
-        metadata = {
-            "prompt": request.prompt,
-            "difficulty": request.difficulty,
-            "is_timed": request.is_timed,
-            "generated_at": datetime.now().isoformat()
-        }
-        # Securely serialize JSON and inject as a script tag
-        metadata_script = f'\n<!-- GENERATED METADATA -->\n<script id="game-metadata" type="application/json">\n{json.dumps(metadata, indent=2)}\n</script>'
-        
-        if "</body>" in clean_html:
-            clean_html = clean_html.replace("</body>", f"{metadata_script}\n</body>")
+    return filename
+
+
+def build_game(request: GameRequest, game_id: str) -> tuple:
+    """
+    Prompt -> Gemini -> clean -> validate, with the game id and metadata injected.
+    Returns (html, cache_status, validation report); persisting is up to the caller.
+    """
+    # Build strict prompt with options
+    with metrics.stage("prompt_build"):
+        template = select_prompt_template(request)
+        prompt_parts = build_prompt_parts(request, template)
+
+    # Reuse a previous generation for the same normalized prompt + options
+    client = get_gemini_client()
+    # Model the router sends this request to first; fallbacks/hedges don't change the key
+    model_name = client.route(request.difficulty, prompt_parts[1])
+    cache_key = generation_cache_key(request, model_name, template)
+    raw_html = generation_cache.get(cache_key)
+    cache_status = "hit" if raw_html is not None else "miss"
+    served_model = model_name
+
+    if raw_html is None:
+        # Generate HTML from Gemini, piggybacking on an identical in-flight call if there is one
+        raw_html, shared = generation_flights.do(
+            f"{model_name}\n{''.join(prompt_parts)}", lambda: generate_recorded(client, template, prompt_parts, request.difficulty)
+        )
+        if shared:
+            cache_status = "coalesced"
         else:
-            clean_html += metadata_script
+            served_model = (client.last_usage or {}).get("model")
 
-        # Save game file
-        filename = f"game_{game_id}.html"
-        file_path = os.path.join(GENERATED_GAMES_DIR, filename)
+    # Clean output defensively, inject the Game ID for the shared leaderboard and
+    # the metadata for Import/Edit features, all in one pass
+    processor = HtmlPostProcessor(
+        replacements={"[[GAME_ID]]": game_id},
+        metadata_script=build_metadata_script(request, template),
+    )
+    with metrics.stage("clean"):
+        clean_html = processor.run(raw_html)
+    clean_html, report = validate_generated_game(clean_html, game_id)
+
+    # Cached output is re-processed per game; never cache a truncated or broken one, nor
+    # one a fallback/hedge model produced, which the key would pass off as the primary's
+    if cache_status == "miss" and served_model == model_name and not processor.truncated and cacheable(report):
+        generation_cache.set(cache_key, raw_html)
+
+    return clean_html, cache_status, report
+
+
+def cacheable(report: dict) -> bool:
+    """Raw output is only worth reusing if validation passed or local fixes sufficed."""
+    if report is None:
+        return True
+    return report["result"] != "failed" and not any(r["kind"] == "regenerated" for r in report["repairs"])
+
+
+def run_generation_pipeline(payload: dict) -> dict:
+    """
+    Prompt -> Gemini -> clean -> persist. Runs inside a job worker thread.
+    """
+    game_id = payload["game_id"]
+    clean_html, cache_status, report = build_game(payload["request"], game_id)
+
+    # Save game file
+    filename = save_generated_game(game_id, clean_html)
+
+    return {
+        "game_url": f"/games/{filename}",
+        "game_id": game_id,
+        "cache": cache_status,
+        "validation": report
+    }
+
+
+generation_jobs = JobQueue(run_generation_pipeline)
+
+
+def admission_retry_after(requests: list):
+    """
+    Seconds a client should wait before resubmitting, or None if the generations can be queued.
+    Rejects when the job queue can't take all of them or every model one of them
+    could use is out of local quota.
+    """
+    if generation_jobs.saturated(len(requests)):
+        return max(1, round(generation_jobs.estimated_wait()))
+    client = gemini_client
+    if client is None:
+        return None
+    worst = 0.0
+    for request in requests:
+        waits = [client.limiter.wait_time(model) for model in client.router.plan(request.difficulty, request.prompt)]
+        worst = max(worst, min(waits))
+    if worst > client.limiter.max_wait:
+        return max(1, round(worst))
+    return None
+
+
+def admit(requests: list):
+    """Fails fast with 429 + Retry-After instead of queueing work that would only time out."""
+    retry_after = admission_retry_after(requests)
+    if retry_after is not None:
+        generation_jobs.reject()
+        raise HTTPException(
+            status_code=429,
+            detail="Game generation is at capacity, please retry shortly",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+@app.post("/generate-game", status_code=202)
+async def generate_game(request: GameRequest):
+    """
+    Enqueues a generation job and returns immediately.
+    Poll `/jobs/{job_id}` until the status is `succeeded`; `game_url` is valid from then on.
+    """
+    if not request.prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
 
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(clean_html)
+    admit([request])
 
-        # Save to Redis (Persistent Storage)
+    # The game id is allocated up front so the URL can be shared before the job finishes
+    game_id = uuid.uuid4().hex
+    job = await generation_jobs.submit({"request": request, "game_id": game_id})
+
+    return JSONResponse(status_code=202, content={
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "game_id": game_id,
+        "game_url": f"/games/game_{game_id}.html"
+    })
+
+
+class BatchGameRequest(BaseModel):
+    games: List[GameRequest]
+
+
+BATCH_MAX_GAMES = int(os.getenv("BATCH_MAX_GAMES", "30"))
+# Generations in flight per batch request
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+
+def build_batch_game(payload: dict) -> tuple:
+    """Job handler for one game of a batch; persisting happens once for the whole batch."""
+    return build_game(payload["request"], payload["game_id"])
+
+
+@app.post("/generate-games/batch")
+async def generate_games_batch(request: BatchGameRequest):
+    """
+    Generates several games concurrently (at most BATCH_CONCURRENCY at a time, as
+    generation jobs within the global GENERATION_CONCURRENCY bound) and
+    streams NDJSON: one line per game as it finishes, in completion order, with its
+    `index` in the request. Games are written to KV together in one pipelined call
+    at the end; the final `done` line reports whether that succeeded.
+    """
+    if not request.games:
+        raise HTTPException(status_code=400, detail="No games requested")
+    if len(request.games) > BATCH_MAX_GAMES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_GAMES} games per batch")
+    if any(not game.prompt.strip() for game in request.games):
+        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
+
+    admit(request.games)
+
+    async def results():
+        start = time.perf_counter()
+        limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def run(index: int, game: GameRequest):
+            game_id = uuid.uuid4().hex
+            async with limit:
+                try:
+                    # Queued as a job, so batches share the global generation bound
+                    html, cache_status, report = await generation_jobs.run(build_batch_game, {"request": game, "game_id": game_id})
+                    data = await asyncio.to_thread(write_game_file, game_id, html)
+                except Exception as e:
+                    return index, game_id, None, str(e)
+            return index, game_id, (html, data, cache_status, report), None
+
+        tasks = [asyncio.create_task(run(i, game)) for i, game in enumerate(request.games)]
+        games = {}
         try:
-            kv_client.save_game(game_id, clean_html)
-            print(f"Game saved to Redis: {game_id}")
+            for finished in asyncio.as_completed(tasks):
+                index, game_id, result, error = await finished
+                if error is not None:
+                    yield json.dumps({"index": index, "status": "failed", "error": error}) + "\n"
+                    continue
+                html, data, cache_status, report = result
+                games[game_id] = (html, data)
+                yield json.dumps({
+                    "index": index,
+                    "status": "succeeded",
+                    "game_id": game_id,
+                    "game_url": f"/games/game_{game_id}.html",
+                    "cache": cache_status,
+                    "validation": report,
+                }) + "\n"
+
+            # One pipelined write for the whole batch instead of a round trip per game
+            kv_saved = False
+            if games:
+                try:
+                    with metrics.stage("kv_write"):
+                        kv_saved = await asyncio.to_thread(
+                            kv_client.save_games, {game_id: html for game_id, (html, _) in games.items()}, GENERATED_GAME_TTL
+                        )
+                except Exception as e:
+                    print(f"Warning: Failed to save batch to Redis: {e}")
+                for game_id, (_, data) in games.items():
+                    warm_game_cache(game_id, data, GENERATED_GAME_TTL)
+            print(f"Batch generated {len(games)}/{len(tasks)} games in {time.perf_counter() - start:.1f}s")
+            yield json.dumps({
+                "status": "done",
+                "succeeded": len(games),
+                "failed": len(tasks) - len(games),
+                "kv_saved": bool(kv_saved),
+                "seconds": time.perf_counter() - start,
+            }) + "\n"
+        finally:
+            # Client went away: games not started yet are dropped from the queue; running ones finish
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = generation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return {**job.to_dict(), "queue_depth": generation_jobs.depth()}
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def generate_stream_in_slot(client, template, prompt_parts: tuple, difficulty: str, served: dict):
+    """
+    generate_stream_recorded() holding a generation_jobs slot, so streams share the
+    jobs' concurrency bound. Records the model that actually answered in `served`.
+    """
+    with generation_jobs.slot():
+        yield from generate_stream_recorded(client, template, prompt_parts, difficulty)
+    served["model"] = (client.last_usage or {}).get("model")
+
+
+@app.post("/generate-game/stream")
+def generate_game_stream(request: GameRequest):
+    """
+    Streaming variant of /generate-game (Server-Sent Events).
+    Emits `start` (game id/url), `chunk` (cleaned HTML fragments), then `done` once saved.
+    Validation runs on the complete document; when it changed the game, `done` has
+    `repaired: true` and the saved file differs from the streamed chunks.
+    The game is finished (cleaned, validated, saved, cached) on a worker thread, so
+    `game_url` from `start` resolves even if the client disconnects mid-stream.
+    Admission control and the generation concurrency bound apply as for /generate-game.
+    """
+    if not request.prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
+    admit([request])
+
+    with metrics.stage("prompt_build"):
+        template = select_prompt_template(request)
+        prompt_parts = build_prompt_parts(request, template)
+    client = get_gemini_client()
+    model_name = client.route(request.difficulty, prompt_parts[1])
+    cache_key = generation_cache_key(request, model_name, template)
+    game_id = uuid.uuid4().hex
+    filename = f"game_{game_id}.html"
+
+    def finish_game(chunks, cache_status: str, served: dict, events: queue.Queue):
+        """Cleans the chunks into `events` as they arrive, then validates, saves and caches the game."""
+        cleaner = HtmlPostProcessor(
+            replacements={"[[GAME_ID]]": game_id},
+            metadata_script=build_metadata_script(request, template),
+        )
+        parts = []
+        raw_chunks = []
+        try:
+            clean_seconds = 0.0
+            for chunk in chunks:
+                raw_chunks.append(chunk)
+                clean_start = time.perf_counter()
+                html = cleaner.feed(chunk)
+                clean_seconds += time.perf_counter() - clean_start
+                if html:
+                    parts.append(html)
+                    events.put(("chunk", html))
+
+            clean_start = time.perf_counter()
+            tail = cleaner.finish()
+            metrics.stage_seconds.observe(clean_seconds + time.perf_counter() - clean_start, stage="clean")
+            if tail:
+                parts.append(tail)
+                events.put(("chunk", tail))
+
+            streamed_html = "".join(parts)
+            html, report = validate_generated_game(streamed_html, game_id)
+            save_generated_game(game_id, html)
+            if cache_status == "miss" and served.get("model") == model_name and not cleaner.truncated and cacheable(report):
+                generation_cache.set(cache_key, "".join(raw_chunks))
+
+            events.put(("done", {
+                "game_url": f"/games/{filename}",
+                "game_id": game_id,
+                "truncated": cleaner.truncated,
+                "cache": cache_status,
+                "validation": report,
+                "repaired": html != streamed_html
+            }))
         except Exception as e:
-            print(f"Warning: Failed to save to Redis: {e}")
+            events.put(("error", {"detail": str(e)}))
 
-        return JSONResponse({
-            "game_url": f"/games/{filename}",
-            "game_id": game_id
-        })
+    def event_stream():
+        served = {}
+        cached_html = generation_cache.get(cache_key)
+        if cached_html is not None:
+            chunks, cache_status = [cached_html], "hit"
+        else:
+            # Identical concurrent streams replay one upstream stream
+            chunks, shared = generation_flights.do_stream(
+                f"{model_name}\n{''.join(prompt_parts)}", lambda: generate_stream_in_slot(client, template, prompt_parts, request.difficulty, served)
+            )
+            cache_status = "coalesced" if shared else "miss"
+
+        # Started before anything is sent: a disconnect only stops the relaying below
+        events = queue.Queue()
+        threading.Thread(target=finish_game, args=(chunks, cache_status, served, events), daemon=True).start()
+
+        yield sse_event("start", {"game_id": game_id, "game_url": f"/games/{filename}", "cache": cache_status})
+        while True:
+            event, data = events.get()
+            yield sse_event(event, data)
+            if event != "chunk":
+                break
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def load_game_html(game_id: str):
+    """Stored game HTML from the memory cache, KV or disk, or None."""
+    cached = game_cache.get(game_id)
+    content = cached[0] if cached else kv_client.get_game(game_id, decompress=False)
+    if content is None:
+        gz_path, file_path = game_file_paths(game_id)
+        if os.path.exists(gz_path):
+            with open(gz_path, "rb") as f:
+                content = f.read()
+        elif os.path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                content = f.read()
+    return decompress_html(content) if isinstance(content, bytes) else content
+
+
+class EditGameRequest(BaseModel):
+    game_id: str
+    instruction: str
+
+
+def run_edit_pipeline(payload: dict) -> dict:
+    """
+    Patch -> apply -> validate -> persist for /edit-game. Runs as a generation job.
+    """
+    client = get_gemini_client()
+    game_id = payload["game_id"]
+    difficulty = payload["difficulty"]
+    # Repairs must restore the leaderboard id the game already uses, not the new storage id
+    leaderboard_id = game_id_of(payload["html"]) or payload["parent_id"]
+
+    def generate(prompt: str):
+        with metrics.stage("model_call"):
+            text = client.generate(prompt, system_instruction=EDIT_SYSTEM_INSTRUCTION, difficulty=difficulty)
+        return text, client.last_usage
+
+    with metrics.stage("edit"):
+        edited, info = game_editor.edit(
+            payload["html"], payload["instruction"], payload["parent_id"], generate,
+            validate=lambda patched, known: validate_generated_game(patched, leaderboard_id, known),
+        )
 
+    filename = save_generated_game(game_id, edited)
+    return {
+        "game_url": f"/games/{filename}",
+        "game_id": game_id,
+        "parent_id": payload["parent_id"],
+        **info,
+    }
+
+
+@app.post("/edit-game")
+async def edit_game(request: EditGameRequest):
+    """
+    Applies a change request to a stored game and saves the result as a new game
+    (games are immutable per id). The model answers with SEARCH/REPLACE patches
+    instead of a full file; the patched game is validated before it is stored.
+    The edited game keeps its GAME_ID, so it shares the original's leaderboard.
+    Edits are queued with generation jobs and subject to the same admission control.
+    """
+    if not request.instruction.strip():
+        raise HTTPException(status_code=400, detail="Instruction cannot be empty")
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", request.game_id):
+        raise HTTPException(status_code=400, detail="Invalid game id")
+
+    html = await asyncio.to_thread(load_game_html, request.game_id)
+    if html is None:
+        raise HTTPException(status_code=404, detail="Game not found or expired. Please generate a new one.")
+
+    difficulty = split_metadata(html)[1].get("difficulty") or "medium"
+    admit([GameRequest(prompt=request.instruction, difficulty=difficulty)])
+
+    try:
+        return await generation_jobs.run(run_edit_pipeline, {
+            "html": html,
+            "instruction": request.instruction,
+            "parent_id": request.game_id,
+            "game_id": uuid.uuid4().hex,
+            "difficulty": difficulty,
+        })
+    except EditFailed as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Edit failed: {str(e)}")
+
 
 class PublishRequest(BaseModel):
     html_content: str
 
+@app.get("/stats")
+def get_stats():
+    """Cache, request-coalescing and KV latency counters."""
+    return {
+        "generation_cache": generation_cache.stats(),
+        "single_flight": generation_flights.stats(),
+        "prompt_templates": prompt_registry.stats(),
+        "game_cache": game_cache.stats(),
+        "leaderboard_cache": leaderboard_cache.stats(),
+        "leaderboard_stream": leaderboard_broker.stats(),
+        "score_buffer": score_buffer.stats() if score_buffer else None,
+        "gemini_context_cache": gemini_client.context_cache.stats() if gemini_client else None,
+        "gemini_models": gemini_client.router.stats() if gemini_client else None,
+        "gemini_rate_limits": gemini_client.limiter.stats() if gemini_client else None,
+        "generation_jobs": generation_jobs.stats(),
+        "game_validation": game_validator.stats(),
+        "game_edits": game_editor.stats(),
+        "kv_latency": kv_client.latency.stats()
+    }
+
+
+@metrics.collector
+def pipeline_gauges():
+    """Cache hit ratios, job queue, single-flight and per-model counters, read from the components' stats() at scrape time."""
+    samples = []
+    caches = (("generation", generation_cache.stats()), ("game", game_cache.stats()), ("leaderboard", leaderboard_cache.stats()))
+    for name, stats in caches:
+        samples.append(("cache_hit_ratio", "Share of lookups served from cache", "gauge", {"cache": name}, stats["hit_ratio"]))
+        samples.append(("cache_misses_total", "Cache lookups that missed", "counter", {"cache": name}, stats["misses"]))
+    jobs = generation_jobs.stats()
+    samples += [
+        ("generation_queue_depth", "Generation jobs waiting for a worker", "gauge", {}, jobs["depth"]),
+        ("generation_jobs_running", "Generation jobs in progress", "gauge", {}, jobs["running"]),
+        ("generation_jobs_rejected_total", "Generation requests turned away by admission control", "counter", {}, jobs["rejected"]),
+    ]
+    flights = generation_flights.stats()
+    samples += [
+        ("generation_flights_in_flight", "Distinct generations currently running upstream", "gauge", {}, flights["in_flight"]),
+        ("generation_flight_leaders_total", "Generations that called Gemini themselves", "counter", {}, flights["leaders"]),
+        ("generation_flight_coalesced_total", "Generations that shared an identical in-flight call", "counter", {}, flights["coalesced"]),
+        ("generation_flight_max_waiters", "Most followers seen on one in-flight call", "gauge", {}, flights["max_waiters"]),
+        ("generation_flight_window_seconds", "How long an in-flight call stayed open to followers", "gauge", {"window": "last"}, flights["last_window_seconds"]),
+        ("generation_flight_window_seconds", "How long an in-flight call stayed open to followers", "gauge", {"window": "avg"}, flights["avg_window_seconds"]),
+    ]
+    if gemini_client:
+        for model, stats in gemini_client.router.stats()["models"].items():
+            samples.append(("gemini_requests_total", "Gemini calls per model", "counter", {"model": model}, stats["requests"]))
+            for kind, count in stats["errors"].items():
+                samples.append(("gemini_errors_total", "Failed Gemini calls", "counter", {"model": model, "kind": kind}, count))
+    return samples
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition (METRICS_ENABLED=1)."""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled; set METRICS_ENABLED=1")
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/publish-game")
 def publish_game(request: PublishRequest):
     try:
@@ -181,19 +865,18 @@ def publish_game(request: PublishRequest):
         
         # SAVE FILE
         filename = f"game_{game_id}.html"
-        file_path = os.path.join(GENERATED_GAMES_DIR, filename)
-
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(html_content)
+        data = write_game_file(game_id, html_content)
 
         # SAVE TO REDIS
         try:
             # 7 Days Retention (604800 seconds) for published games
-            kv_client.save_game(game_id, html_content, ttl=604800)
+            kv_client.save_game(game_id, html_content, ttl=PUBLISHED_GAME_TTL)
             print(f"Published game saved to Redis: {game_id}")
         except Exception as e:
             print(f"Warning: Failed to save published game to Redis: {e}")
 
+        warm_game_cache(game_id, data, PUBLISHED_GAME_TTL)
+
         return JSONResponse({
             "game_url": f"/games/{filename}",
             "game_id": game_id
@@ -202,25 +885,158 @@ def publish_game(request: PublishRequest):
     except Exception as e:
          raise HTTPException(status_code=500, detail=str(e))
 
+class PublishBatchRequest(BaseModel):
+    html_contents: List[str]
+
+@app.post("/publish-games")
+def publish_games(request: PublishBatchRequest):
+    """Bulk publish/migration: writes every game to KV in pipelined batches."""
+    for html_content in request.html_contents:
+        if "<!DOCTYPE html>" not in html_content:
+            raise HTTPException(status_code=400, detail="Invalid HTML content")
+
+    try:
+        games = {uuid.uuid4().hex: html for html in request.html_contents}
+        written = {game_id: write_game_file(game_id, html_content) for game_id, html_content in games.items()}
+
+        # 7 Days Retention, same as /publish-game
+        kv_client.save_games(games, ttl=PUBLISHED_GAME_TTL)
+        for game_id, data in written.items():
+            warm_game_cache(game_id, data, PUBLISHED_GAME_TTL)
+        print(f"Published {len(games)} games to Redis")
+
+        return JSONResponse({
+            "games": [{"game_url": f"/games/game_{game_id}.html", "game_id": game_id} for game_id in games]
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 class ScoreSubmission(BaseModel):
     game_id: str
     player_name: str
     score: float
 
 @app.post("/submit-score")
-def submit_score(submission: ScoreSubmission):
+async def submit_score(submission: ScoreSubmission):
     if not kv_client.is_enabled():
         raise HTTPException(status_code=503, detail="Leaderboard service unavailable (Missing Credentials)")
+    # Python's JSON parser accepts Infinity/NaN; neither is a storable leaderboard score
+    if not math.isfinite(submission.score):
+        raise HTTPException(status_code=400, detail="Score must be a finite number")
+
+    if score_buffer:
+        return await submit_score_buffered(submission)
+
+    try:
+        # Score write and the refreshed top 10 (plus the player's rank) in one KV round trip
+        result = await kv_client.submit_score_and_get_leaderboard_async(
+            submission.game_id, submission.player_name, submission.score
+        )
+        leaderboard_cache.update(submission.game_id, result["leaderboard"], result["total"])
+        await leaderboard_broker.publish(submission.game_id, json.dumps(result["leaderboard"]))
+        return {"status": "success", **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Score submission failed: {str(e)}")
 
+async def submit_score_buffered(submission: ScoreSubmission):
+    """
+    Write-behind path: the score is acknowledged once buffered. The returned top 10
+    includes it (read-your-writes); `rank` is only known if the player made the top 10.
+    """
     try:
-        kv_client.submit_score(submission.game_id, submission.player_name, submission.score)
-        return {"status": "success"}
+        score_buffer.add(submission.game_id, submission.player_name, submission.score)
+        leaderboard = score_buffer.overlay(submission.game_id, await leaderboard_cache.get(submission.game_id))
+        rank = next((i + 1 for i, entry in enumerate(leaderboard) if entry["name"] == submission.player_name), None)
+        await leaderboard_broker.publish(submission.game_id, json.dumps(leaderboard))
+        return {"status": "success", "leaderboard": leaderboard, "rank": rank}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Score submission failed: {str(e)}")
 
+LEADERBOARD_MAX_PAGE = 100
+
 @app.get("/leaderboard/{game_id}")
-def get_leaderboard(game_id: str):
+async def get_leaderboard(game_id: str, response: Response, limit: int = 10, offset: int = 0, around: str = None):
+    """
+    Returns a JSON array of `{name, score, rank}`, best first (`rank` is 1-based).
+    - `limit`/`offset` page through large leaderboards; `around=<player>` returns the
+      `limit`-sized window centred on that player.
+    - Every page, the first included, carries X-Total-Count and X-Next-Offset headers,
+      so the body stays a plain array for existing games.
+    """
+    if not 1 <= limit <= LEADERBOARD_MAX_PAGE or offset < 0:
+        raise HTTPException(status_code=400, detail=f"limit must be 1-{LEADERBOARD_MAX_PAGE} and offset >= 0")
+
     try:
-        return kv_client.get_leaderboard(game_id)
+        if offset == 0 and around is None:
+            # The head of the board is what games poll; serve it from the cache
+            entries, total = await leaderboard_cache.get_page(game_id, limit)
+            if score_buffer:
+                entries = score_buffer.overlay(game_id, entries, limit)
+                # Buffered players may be new to the board; the exact count is known after the flush
+                total = max(total, len(entries))
+        else:
+            if around is not None:
+                player = await kv_client.get_player_rank_async(game_id, around)
+                if player is None:
+                    raise HTTPException(status_code=404, detail="Player not found on this leaderboard")
+                offset = max(player["rank"] - 1 - limit // 2, 0)
+            entries, total = await kv_client.get_leaderboard_page_async(game_id, offset, limit)
+
+        response.headers["X-Total-Count"] = str(total)
+        if offset + len(entries) < total:
+            response.headers["X-Next-Offset"] = str(offset + len(entries))
+        return entries
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Leaderboard retrieval failed: {str(e)}")
+
+@app.get("/leaderboard/{game_id}/rank/{player_name}")
+async def get_player_rank(game_id: str, player_name: str):
+    """Rank (1-based) and score for a single player, via ZREVRANK + ZSCORE."""
+    if not kv_client.is_enabled():
+        raise HTTPException(status_code=503, detail="Leaderboard service unavailable (Missing Credentials)")
+
+    try:
+        player = await kv_client.get_player_rank_async(game_id, player_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Rank lookup failed: {str(e)}")
+    if player is None:
+        raise HTTPException(status_code=404, detail="Player not found on this leaderboard")
+    return player
+
+@app.get("/leaderboard/{game_id}/stream")
+async def stream_leaderboard(game_id: str, request: Request):
+    """
+    Server-Sent Events: sends the current top 10 as a `leaderboard` event, then a
+    new one each time a score is submitted for this game. Replaces client polling.
+    """
+    queue = leaderboard_broker.subscribe(game_id)
+
+    async def event_stream():
+        try:
+            try:
+                leaderboard = await leaderboard_cache.get(game_id)
+                if score_buffer:
+                    leaderboard = score_buffer.overlay(game_id, leaderboard)
+                yield sse_event("leaderboard", leaderboard)
+            except Exception as e:
+                print(f"Warning: Initial leaderboard fetch failed: {e}")
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=LEADERBOARD_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: leaderboard\ndata: {message}\n\n"
+        finally:
+            leaderboard_broker.unsubscribe(game_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
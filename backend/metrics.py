@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Seconds; spans KV round trips (ms) through full generations (minutes)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def format_labels(labels: tuple, names: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    return repr(int(value)) if value == int(value) else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}  # label values -> total
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(key, self.labelnames)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = format_labels(key, self.labelnames, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            inf = format_labels(key, self.labelnames, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {series[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(key, self.labelnames)} {series[-2]}")
+            lines.append(f"{self.name}_count{format_labels(key, self.labelnames)} {series[-1]}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class _NullMetric:
+    """Stands in for every metric when metrics are disabled."""
+
+    _timer = nullcontext()
+
+    def inc(self, amount: float = 1, **labels):
+        pass
+
+    def observe(self, value: float, **labels):
+        pass
+
+    def time(self, **labels):
+        return self._timer
+
+
+NULL_METRIC = _NullMetric()
+
+
+class MetricsRegistry:
+    """
+    Prometheus metrics for the generation pipeline (METRICS_ENABLED=1).
+
+    Counters and histograms are kept in-process and rendered in the text
+    exposition format by /metrics. Gauges that already live in a component's
+    stats() (cache hit ratios, queue depth) are read at scrape time through
+    collectors instead of being updated on every request. When disabled, every
+    metric is a shared no-op object, so instrumented code pays one method call.
+    """
+
+    def __init__(self, enabled: bool = None):
+        self.enabled = enabled if enabled is not None else os.getenv("METRICS_ENABLED", "0") == "1"
+        self._metrics = []
+        self._collectors = []  # callables returning [(name, help, type, {labels}, value)]
+
+        self.stage_seconds = self.histogram(
+            "game_generation_stage_seconds", "Time spent in each generation pipeline stage", ("stage",)
+        )
+        self.first_token_seconds = self.histogram(
+            "gemini_first_token_seconds", "Time to the first streamed token", ("model",)
+        )
+        self.gemini_tokens = self.counter("gemini_tokens_total", "Tokens reported by Gemini", ("model", "kind"))
+        self.gemini_finish_reasons = self.counter(
+            "gemini_finish_reasons_total", "Gemini responses by finish reason", ("model", "reason")
+        )
+        self.kv_seconds = self.histogram("kv_call_seconds", "KV round-trip latency per operation", ("op",))
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()):
+        if not self.enabled:
+            return NULL_METRIC
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        if not self.enabled:
+            return NULL_METRIC
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def stage(self, name: str):
+        """Context manager timing one pipeline stage."""
+        return self.stage_seconds.time(stage=name)
+
+    def record_generation(self, usage: dict):
+        """Token counts, finish reason and TTFT from GeminiClient usage."""
+        if not self.enabled or not usage:
+            return
+        model = usage["model"]
+        self.gemini_tokens.inc(usage["prompt_tokens"] - usage["cached_tokens"], model=model, kind="prompt")
+        self.gemini_tokens.inc(usage["cached_tokens"], model=model, kind="cached")
+        self.gemini_tokens.inc(usage["output_tokens"], model=model, kind="output")
+        reason = usage["finish_reason"]
+        self.gemini_finish_reasons.inc(model=model, reason=getattr(reason, "name", reason) or "unknown")
+        if usage["first_token_seconds"] is not None:
+            self.first_token_seconds.observe(usage["first_token_seconds"], model=model)
+
+    def collector(self, fn):
+        if self.enabled:
+            self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        # Samples of one metric must be contiguous, whichever collector produced them
+        families = {}
+        for fn in self._collectors:
+            try:
+                samples = fn()
+            except Exception as e:
+                print(f"Warning: Metrics collector {fn.__name__} failed: {e}")
+                continue
+            for name, help, kind, labels, value in samples:
+                if value is not None:
+                    families.setdefault((name, help, kind), []).append((labels, value))
+        for (name, help, kind), samples in families.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(tuple(labels.values()), tuple(labels))} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
@@ -1,33 +1,36 @@
-def build_game_generation_prompt(user_prompt: str) -> str:
-    """
-    Builds a strict prompt for a shared leaderboard educational game with navigation.
-    """
+import hashlib
+import json
+import os
 
-    final_prompt = f"""
+USER_PROMPT_SLOT = "{user_prompt}"
+
+# Version 4 drops the duplicated "DIFFICULTY CONFIGURATION" and "ANIMATIONS" lines of version 3.
+GAME_TEMPLATE_V4 = """
 You are an expert educational game developer.
 Your task is to generate a COMPLETE, VALID, SELF-CONTAINED HTML FILE.
 
 - **SHARED LEADERBOARD**: The game MUST support a global shared leaderboard.
   - When the game finishes, prompt the user for their name if they are in the top scores.
-  - Use `fetch('/submit-score', ...)` to send `{{ game_id, player_name, score }}`.
-  - Use `fetch('/leaderboard/${{GAME_ID}}')` to retrieve the current top 10 scores.
+  - Use `fetch('/submit-score', ...)` to send `{ game_id, player_name, score }`.
+  - Use `fetch('/leaderboard/${GAME_ID}')` to retrieve the current top 10 scores.
+  - Use `new EventSource('/leaderboard/${GAME_ID}/stream')` to receive live top 10 updates (fall back to polling).
   - IMPORTANT: Use a placeholder `const GAME_ID = "[[GAME_ID]]";` at the top of your script. This will be replaced by the server.
   
 - **API BASE URL LOGIC (CRITICAL - MUST BE FIRST IN SCRIPT)**:
   - The game might be played from a Blob URL (Imported) or `file://`.
   - At the very top of your global script (before `gameState`), define:
     ```javascript
-    const getApiBaseUrl = () => {{
+    const getApiBaseUrl = () => {
         const protocol = window.location.protocol;
         if (protocol === 'blob:') return window.location.origin; // e.g. http://localhost:8000
         if (protocol === 'file:') return 'http://localhost:8000'; // Fallback for local testing
         return ''; // Use relative path for standard hosting
-    }};
+    };
     const API_BASE = getApiBaseUrl();
     ```
   - **ALWAYS** prefix API calls with `API_BASE`.
-    - Example: `fetch(\`${{API_BASE}}/submit-score\`, ...)`
-    - Example: `fetch(\`${{API_BASE}}/leaderboard/${{GAME_ID}}\`)`
+    - Example: `fetch(\`${API_BASE}/submit-score\`, ...)`
+    - Example: `fetch(\`${API_BASE}/leaderboard/${GAME_ID}\`)`
 
 
 - **GAME STATE MANAGEMENT**:
@@ -37,7 +40,6 @@ Your task is to generate a COMPLETE, VALID, SELF-CONTAINED HTML FILE.
   - **GAME OVER (Lost)**: Show "Game Over", Final Score, and the **MANDATORY SUBMISSION UI**.
 
 - **DIFFICULTY CONFIGURATION**:
-  - **DIFFICULTY CONFIGURATION**:
   - **Analyze the [OPTIONS] block in the prompt**:
     - If `Timed Mode: YES`:
       - Implement a **VISUAL TIMER BAR** (CSS progress bar) that shrinks from 100% to 0% width over the duration.
@@ -54,8 +56,8 @@ Your task is to generate a COMPLETE, VALID, SELF-CONTAINED HTML FILE.
         - *Example (Easy)*: Level 1 = "What is a cat?", Level 3 = "Identify a Siamese cat".
         - *Example (Hard)*: Level 1 = "Bio-mechanics of feline agility", Level 3 = "Evolutionary divergence of Panthera leo".
   - **INSTRUCTIONS TEXT**: In the "How to Play" section, **HARDCODE** the numbers.
-    - Write: "You have 15 seconds..." NOT "You have {{time}} seconds...".
-    - Write: "Score 70% to pass..." NOT "Score {{pct}}% to pass...".
+    - Write: "You have 15 seconds..." NOT "You have {time} seconds...".
+    - Write: "Score 70% to pass..." NOT "Score {pct}% to pass...".
     - Ensure these numbers match your Javascript logic.
 
 - **NAVIGATION & PROGRESSION**:
@@ -75,7 +77,6 @@ Your task is to generate a COMPLETE, VALID, SELF-CONTAINED HTML FILE.
   - **ACCESSIBILITY (CRITICAL)**: Ensure HIGH CONTRAST. Do NOT use white text on light backgrounds. Use dark text (#1a1a2e) on light cards, or white text on very dark backgrounds.
   - **TYPOGRAPHY**: Center titles, but ALWAYS left-align (`text-align: left`) lists, instructions, and body text for readability.
   - **ANIMATIONS**: Use CSS animations for rewards, transitions, and interactions.
-  - **ANIMATIONS**: Use CSS animations for rewards, transitions, and interactions.
   - **LEADERBOARD STYLING**:
     - Use `<table style="width: 100%; text-align: left; border-collapse: collapse;">`.
     - Columns: **Rank** (15%), **Name** (55%), **Score** (30%, text-align: right).
@@ -95,18 +96,29 @@ Your task is to generate a COMPLETE, VALID, SELF-CONTAINED HTML FILE.
     - Input: `<input id="playerName" type="text" placeholder="Enter Name">`
     - Button: `<button onclick="submitScore()">Submit Score</button>`
   - **Behave**:
-    - **Define a function `refreshLeaderboard()`** that fetches `\`${{API_BASE}}/leaderboard/${{GAME_ID}}\`` and renders the table.
+    - **Define a function `refreshLeaderboard()`** that fetches `\`${API_BASE}/leaderboard/${GAME_ID}\`` and renders the table.
       - **CRITICAL**: Use `try...catch`. If fetch fails, show "Leaderboard unavailable" in table, but **do NOT crash the game**.
     - **Call `refreshLeaderboard()`** inside `initGame()`.
       - **CRITICAL**: Ensure `initGame()` continues to setup UI/Listeners even if leaderboard fails (use `refreshLeaderboard().catch(...)` or `await` inside try/catch).
+    - **LIVE UPDATES**: Define `subscribeLeaderboard()` and call it once from `initGame()`:
+      ```javascript
+      function subscribeLeaderboard() {
+          const startPolling = () => setInterval(() => refreshLeaderboard().catch(console.error), 10000);
+          if (!window.EventSource) return startPolling();
+          const source = new EventSource(`${API_BASE}/leaderboard/${GAME_ID}/stream`);
+          source.addEventListener('leaderboard', (e) => renderLeaderboard(JSON.parse(e.data)));
+          source.onerror = () => { source.close(); startPolling(); };
+      }
+      ```
+      - `renderLeaderboard(entries)` is the table renderer shared with `refreshLeaderboard()` and the submit response. Do NOT poll while the stream is open.
     - **On Submission Click**:
-      1. Call `fetch(\`${{API_BASE}}/submit-score\`, ...)` with JSON: `{{ "game_id": GAME_ID, "player_name": "Name", "score": 100 }}` (Ensure score is a Number!).
+      1. Call `fetch(\`${API_BASE}/submit-score\`, ...)` with JSON: `{ "game_id": GAME_ID, "player_name": "Name", "score": 100 }` (Ensure score is a Number!).
       2. If `response.ok` is FALSE: `alert("Error: " + await response.text());` (Show the REAL error).
       3. On Success: 
          - Disable button.
          - Show "Submitted!" text in **BRIGHT GREEN** (#00ff00).
-         - Call `refreshLeaderboard()`.
-         - **SCROLL TO LEADERBOARD**: `document.getElementById('leaderboard-table').scrollIntoView({{ behavior: 'smooth' }});`
+         - The response JSON is `{ "status": "success", "leaderboard": [...], "rank": 3 }`. Render `leaderboard` directly (same shape as the leaderboard API) instead of fetching it again, and show "Your rank: #3".
+         - **SCROLL TO LEADERBOARD**: `document.getElementById('leaderboard-table').scrollIntoView({ behavior: 'smooth' });`
     - **INPUT VISIBILITY**: The text input MUST have `background: #ffffff; color: #000000;` (Black text on White) for maximum readability.
     - **LEADERBOARD VISIBILITY**: The Leaderboard Table MUST be rendered on the Results screen, below the submission UI.
 
@@ -123,14 +135,14 @@ Your task is to generate a COMPLETE, VALID, SELF-CONTAINED HTML FILE.
 - **LOGIC & DATA INTEGRITY**:
   - **NO DUPLICATES**: Explicitly ensure all 4 answer options for a question are UNIQUE. No repeated questions.
   - **RANDOMIZE ANSWERS (CRITICAL)**: The `options` array MUST be shuffled in JavaScript before rendering. Do not always place the correct answer first. Use a Fisher-Yates shuffle or `sort(() => Math.random() - 0.5)`.
-  - **API CONTRACT**: `\`${{API_BASE}}/leaderboard/${{GAME_ID}}\`` returns a JSON ARRAY: `[{{ name: "Player", score: 100 }}, ...]`.
+  - **API CONTRACT**: `\`${API_BASE}/leaderboard/${GAME_ID}\`` returns a JSON ARRAY: `[{ name: "Player", score: 100 }, ...]`. Each `leaderboard` event on the `/stream` endpoint carries the same array as its `data`.
   - Handle empty leaderboard arrays gracefully (show "No scores yet").
   - **ERROR HANDLING**: Log fetch errors to console. If leaderboard fails, show specific error message.
 
 - **OPTIMIZATION & ARCHITECTURE**:
   - Use a "Question Generator Engine" (functions) instead of hardcoding massive data arrays.
   - Structure the code cleanly with a single `gameState` object.
-  - Example: `function generateQuestions(level) {{ ... return questions; }}`
+  - Example: `function generateQuestions(level) { ... return questions; }`
 
 **STRICT FORMATTING**: 
 1. Output ONLY raw HTML (no markdown).
@@ -138,12 +150,12 @@ Your task is to generate a COMPLETE, VALID, SELF-CONTAINED HTML FILE.
 4. **WRAP DATA STRINGS**: Use DOUBLE QUOTES `"` for all JSON keys and string values to prevent single-quote escaping errors (e.g. "It's" will break single quotes).
 5. **GLOBAL ERROR HANDLER**: Wrap `initGame()` in a try-catch block:
    ```javascript
-   try {{
+   try {
        initGame();
-   }} catch (e) {{
+   } catch (e) {
        console.error("Critical Init Error:", e);
        alert("Game Error: " + e.message);
-   }}
+   }
    ```
 6. Ensure `startGame()` is defined in the GLOBAL scope (not inside another function).
 
@@ -152,4 +164,138 @@ USER GAME REQUEST:
 
 CRITICAL: Return ONLY complete, valid HTML ending in </html>. No conversational filler.
 """
-    return final_prompt.strip()
+
+# Version 3, kept as the A/B control: version 4 with its duplicated lines restored.
+GAME_TEMPLATE_V3 = GAME_TEMPLATE_V4.replace(
+    "- **DIFFICULTY CONFIGURATION**:\n",
+    "- **DIFFICULTY CONFIGURATION**:\n  - **DIFFICULTY CONFIGURATION**:\n",
+    1,
+).replace(
+    "  - **ANIMATIONS**: Use CSS animations for rewards, transitions, and interactions.\n",
+    "  - **ANIMATIONS**: Use CSS animations for rewards, transitions, and interactions.\n" * 2,
+    1,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token count (~4 characters per token) for comparing templates offline."""
+    return (len(text) + 3) // 4
+
+
+class PromptTemplate:
+    """
+    A prompt template compiled once into the static text around the user's request,
+    so rendering is a single concatenation rather than re-formatting ~10 KB per call.
+    """
+
+    def __init__(self, template_id: str, text: str):
+        prefix, slot, suffix = text.partition(USER_PROMPT_SLOT)
+        if not slot:
+            raise ValueError(f"Template {template_id} has no {USER_PROMPT_SLOT} slot")
+        self.id = template_id
+        self.prefix = prefix.lstrip()
+        self.suffix = suffix.rstrip()
+        self.estimated_tokens = estimate_tokens(self.prefix + self.suffix)
+
+    def render(self, user_prompt: str) -> str:
+        return f"{self.prefix}{user_prompt}{self.suffix}"
+
+    def render_parts(self, user_prompt: str) -> tuple:
+        """
+        (static instruction, per-request text), concatenating to render(). The static
+        part is what GeminiClient sends as a cached or system instruction.
+        """
+        return self.prefix, f"{user_prompt}{self.suffix}"
+
+
+class TemplateRegistry:
+    """
+    Versioned prompt templates with per-difficulty A/B assignment.
+
+    PROMPT_TEMPLATE_AB maps a difficulty to weighted template ids, e.g.
+    '{"easy": {"game-v4": 50, "game-v5": 50}}'. Difficulties it doesn't list
+    can split between the default and the control template by setting
+    PROMPT_TEMPLATE_CONTROL_WEIGHT to the control's percentage (default 0: off).
+    Assignment hashes the prompt, so identical requests always get the same
+    template (and share generation cache entries). Per-template usage is
+    recorded for /stats.
+    """
+
+    def __init__(self, default_id: str, ab_config: dict = None, control_id: str = None, control_weight: int = None):
+        self.default_id = default_id
+        self.ab_config = ab_config if ab_config is not None else json.loads(os.getenv("PROMPT_TEMPLATE_AB", "{}"))
+        self.control_id = control_id
+        self.control_weight = control_weight if control_weight is not None else int(os.getenv("PROMPT_TEMPLATE_CONTROL_WEIGHT", "0"))
+        self._templates = {}
+        self._usage = {}  # template id -> {"requests", "prompt_tokens", "cached_tokens", "output_tokens", "seconds"}
+
+    def register(self, template: PromptTemplate):
+        self._templates[template.id] = template
+        self._usage[template.id] = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "seconds": 0.0}
+        return template
+
+    def get(self, template_id: str = None) -> PromptTemplate:
+        return self._templates[template_id or self.default_id]
+
+    def select(self, difficulty: str, seed: str) -> PromptTemplate:
+        config = self.ab_config.get(difficulty)
+        if config is None and self.control_id and self.control_id != self.default_id:
+            weight = min(max(self.control_weight, 0), 100)
+            config = {self.default_id: 100 - weight, self.control_id: weight}
+        variants = {tid: w for tid, w in (config or {}).items() if tid in self._templates and w > 0}
+        if not variants:
+            return self.get()
+        bucket = int(hashlib.sha256(seed.encode("utf-8")).hexdigest()[:8], 16) % sum(variants.values())
+        for template_id, weight in sorted(variants.items()):
+            if bucket < weight:
+                return self._templates[template_id]
+            bucket -= weight
+        return self.get()
+
+    def record(self, template_id: str, usage: dict, seconds: float):
+        """Accumulates billed tokens and latency for one generation made with `template_id`."""
+        stats = self._usage[template_id]
+        stats["requests"] += 1
+        stats["seconds"] += seconds
+        if usage:
+            stats["prompt_tokens"] += usage["prompt_tokens"]
+            stats["cached_tokens"] += usage.get("cached_tokens", 0)
+            stats["output_tokens"] += usage["output_tokens"]
+
+    def stats(self) -> dict:
+        report = {}
+        for template_id, template in self._templates.items():
+            usage = self._usage[template_id]
+            requests = usage["requests"]
+            report[template_id] = {
+                "estimated_tokens": template.estimated_tokens,
+                "requests": requests,
+                "avg_prompt_tokens": usage["prompt_tokens"] / requests if requests else None,
+                "avg_cached_tokens": usage["cached_tokens"] / requests if requests else None,
+                "avg_output_tokens": usage["output_tokens"] / requests if requests else None,
+                "avg_seconds": usage["seconds"] / requests if requests else None,
+            }
+        return {
+            "default": self.default_id,
+            "control": self.control_id,
+            "control_weight": self.control_weight,
+            "ab": self.ab_config,
+            "templates": report,
+        }
+
+
+# A template id is its version: changed text gets a new id, since the id is part of
+# the generation cache key and the game metadata.
+prompt_registry = TemplateRegistry(
+    default_id=os.getenv("PROMPT_TEMPLATE_DEFAULT", "game-v4"),
+    control_id=os.getenv("PROMPT_TEMPLATE_CONTROL", "game-v3"),
+)
+prompt_registry.register(PromptTemplate("game-v3", GAME_TEMPLATE_V3))
+prompt_registry.register(PromptTemplate("game-v4", GAME_TEMPLATE_V4))
+
+
+def build_game_generation_prompt(user_prompt: str, template_id: str = None) -> str:
+    """
+    Builds a strict prompt for a shared leaderboard educational game with navigation.
+    """
+    return prompt_registry.get(template_id).render(user_prompt)
@@ -0,0 +1,119 @@
+import asyncio
+import os
+
+
+class InMemoryBroker:
+    """
+    Process-local pub/sub used to push leaderboard updates to SSE subscribers.
+
+    Each subscriber gets a small bounded queue. Messages are full snapshots
+    (the current top N), so when a slow client falls behind its oldest
+    pending message is dropped rather than blocking the publisher.
+    """
+
+    def __init__(self, queue_size: int = 8):
+        self.queue_size = queue_size
+        self._subscribers = {}  # channel -> set of asyncio.Queue
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(channel, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(channel)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[channel]
+
+    async def publish(self, channel: str, message: str):
+        self.published += 1
+        self._fanout(channel, message)
+
+    def _fanout(self, channel: str, message: str):
+        for queue in list(self._subscribers.get(channel, ())):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(message)
+            self.delivered += 1
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "channels": len(self._subscribers),
+            "subscribers": sum(len(q) for q in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+class KVBroker(InMemoryBroker):
+    """
+    Shares updates across instances through Redis PUBLISH/SUBSCRIBE on the KV store.
+
+    Publishing goes to Redis only; every instance (including this one) receives
+    the message back on its subscription and fans it out to local clients. One
+    upstream subscription is held per channel while it has local subscribers.
+    """
+
+    def __init__(self, kv, queue_size: int = 8, prefix: str = "leaderboard_updates:"):
+        super().__init__(queue_size)
+        self.kv = kv
+        self.prefix = prefix
+        self._listeners = {}  # channel -> asyncio.Task
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        queue = super().subscribe(channel)
+        if channel not in self._listeners:
+            self._listeners[channel] = asyncio.create_task(self._listen(channel))
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        super().unsubscribe(channel, queue)
+        if channel not in self._subscribers:
+            task = self._listeners.pop(channel, None)
+            if task:
+                task.cancel()
+
+    async def publish(self, channel: str, message: str):
+        self.published += 1
+        try:
+            await self.kv.publish_async(self.prefix + channel, message)
+        except Exception as e:
+            # Local subscribers still get the update if Redis is unreachable
+            print(f"Warning: Failed to publish leaderboard update to Redis: {e}")
+            self._fanout(channel, message)
+
+    async def _listen(self, channel: str):
+        while channel in self._subscribers:
+            try:
+                async for message in self.kv.subscribe_async(self.prefix + channel):
+                    self._fanout(channel, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: Leaderboard subscription for {channel} dropped: {e}")
+            await asyncio.sleep(1)
+
+    async def close(self):
+        for task in self._listeners.values():
+            task.cancel()
+        self._listeners.clear()
+
+
+def create_broker(kv=None):
+    """PUBSUB_BACKEND=kv shares updates across instances; the default is in-process only."""
+    queue_size = int(os.getenv("PUBSUB_QUEUE_SIZE", "8"))
+    if os.getenv("PUBSUB_BACKEND", "memory") == "kv" and kv is not None and kv.supports_pubsub():
+        return KVBroker(kv, queue_size)
+    return InMemoryBroker(queue_size)
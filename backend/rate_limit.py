@@ -0,0 +1,151 @@
+import json
+import os
+import random
+import threading
+import time
+
+
+class RateLimitExceeded(RuntimeError):
+    """The local quota would not allow the call within the allowed wait."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Refills `rate_per_minute` units per minute up to `capacity`.
+
+    take() reserves units immediately and may drive the level negative; the
+    returned delay is how long the caller has to wait for its reservation to be
+    covered. Reserving up front keeps callers served in arrival order.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float) -> float:
+        self._refill()
+        deficit = amount - self.level
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def take(self, amount: float) -> float:
+        delay = self.delay_for(amount)
+        self.level -= amount
+        return delay
+
+    def give_back(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Client-side requests/min and tokens/min quotas, one pair of buckets per model.
+
+    GEMINI_RPM / GEMINI_TPM set the default quota (0 = unlimited) and
+    GEMINI_RATE_LIMITS overrides it per model, e.g.
+    '{"gemini-2.5-pro": {"rpm": 150, "tpm": 2000000}}'. Calls that would have to
+    wait longer than GEMINI_RATE_LIMIT_MAX_WAIT seconds fail with
+    RateLimitExceeded instead, so the router can try another model.
+    """
+
+    def __init__(self, rpm: float = None, tpm: float = None, per_model: dict = None, max_wait: float = None):
+        self.rpm = rpm if rpm is not None else float(os.getenv("GEMINI_RPM", "0"))
+        self.tpm = tpm if tpm is not None else float(os.getenv("GEMINI_TPM", "0"))
+        self.per_model = per_model if per_model is not None else json.loads(os.getenv("GEMINI_RATE_LIMITS", "{}"))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("GEMINI_RATE_LIMIT_MAX_WAIT", "30"))
+        self._buckets = {}  # model name -> (requests bucket or None, tokens bucket or None)
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.throttled = 0  # calls that had to wait
+        self.rejected = 0
+        self.waited_seconds = 0.0
+
+    def _buckets_for(self, model_name: str):
+        buckets = self._buckets.get(model_name)
+        if buckets is None:
+            quota = self.per_model.get(model_name, {})
+            rpm, tpm = quota.get("rpm", self.rpm), quota.get("tpm", self.tpm)
+            buckets = (TokenBucket(rpm) if rpm else None, TokenBucket(tpm) if tpm else None)
+            self._buckets[model_name] = buckets
+        return buckets
+
+    def wait_time(self, model_name: str, tokens: int = 0) -> float:
+        """Seconds a call of `tokens` input tokens would wait right now, without reserving."""
+        with self._lock:
+            requests, token_bucket = self._buckets_for(model_name)
+            return max(
+                requests.delay_for(1) if requests else 0.0,
+                token_bucket.delay_for(tokens) if token_bucket else 0.0,
+            )
+
+    def acquire(self, model_name: str, tokens: int):
+        """Blocks until one request and `tokens` tokens are available for the model."""
+        with self._lock:
+            requests, token_bucket = self._buckets_for(model_name)
+            if requests is None and token_bucket is None:
+                self.acquired += 1
+                return
+            delay = max(
+                requests.delay_for(1) if requests else 0.0,
+                token_bucket.delay_for(tokens) if token_bucket else 0.0,
+            )
+            if delay > self.max_wait:
+                self.rejected += 1
+                raise RateLimitExceeded(f"Local quota for {model_name} exhausted, next slot in {delay:.1f}s", delay)
+            if requests:
+                requests.take(1)
+            if token_bucket:
+                token_bucket.take(tokens)
+            self.acquired += 1
+            if delay:
+                self.throttled += 1
+                self.waited_seconds += delay
+        if delay:
+            time.sleep(delay)
+
+    def settle(self, model_name: str, extra_tokens: int):
+        """Corrects the token reservation once the real prompt size is known."""
+        if not extra_tokens:
+            return
+        with self._lock:
+            token_bucket = self._buckets_for(model_name)[1]
+            if token_bucket is None:
+                return
+            if extra_tokens > 0:
+                token_bucket.take(extra_tokens)
+            else:
+                token_bucket.give_back(-extra_tokens)
+
+    def stats(self) -> dict:
+        with self._lock:
+            levels = {}
+            for model_name, (requests, token_bucket) in self._buckets.items():
+                levels[model_name] = {
+                    "requests_available": requests.level if requests else None,
+                    "tokens_available": token_bucket.level if token_bucket else None,
+                }
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "rejected": self.rejected,
+                "waited_seconds": self.waited_seconds,
+                "models": levels,
+            }
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+import time
+
+
+class ScoreBuffer:
+    """
+    Write-behind buffer for score submissions (SCORE_WRITE_BEHIND=1).
+
+    Submissions are acknowledged once they land in memory (and, if
+    SCORE_JOURNAL_PATH is set, in an append-only local journal that is replayed
+    on startup). A background task flushes them every SCORE_FLUSH_INTERVAL
+    seconds, or as soon as SCORE_FLUSH_MAX_PENDING entries are waiting, as one
+    pipelined request with a single `ZADD GT` per game. Only each player's best
+    score is kept, both in the buffer and in Redis.
+
+    Scores that are pending or mid-flush are merged into leaderboard reads by
+    overlay(), so a submitting player sees their own score straight away.
+    """
+
+    def __init__(self, kv, flush_interval: float = None, max_pending: int = None, journal_path: str = None, on_flush=None):
+        self.kv = kv
+        self.flush_interval = flush_interval or float(os.getenv("SCORE_FLUSH_INTERVAL", "0.5"))
+        self.max_pending = max_pending or int(os.getenv("SCORE_FLUSH_MAX_PENDING", "500"))
+        self.journal_path = journal_path if journal_path is not None else os.getenv("SCORE_JOURNAL_PATH", "")
+        # Called with the flushed game ids once their scores are in Redis
+        self.on_flush = on_flush
+
+        self._pending = {}  # game_id -> {player: best score}
+        self._inflight = {}  # same shape, for the batch currently being written
+        self._oldest = None  # submit time of the oldest pending entry
+        self._wakeup = None
+        self._task = None
+        self._journal = None
+
+        self.flushes = 0
+        self.failures = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.total_flushed = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+        self.last_flush_seconds = 0.0
+
+        if self.journal_path:
+            self._replay_journal()
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def pending_count(self) -> int:
+        return sum(len(players) for players in self._pending.values())
+
+    def add(self, game_id: str, name: str, score: float):
+        players = self._pending.setdefault(game_id, {})
+        if name in players and players[name] >= score:
+            return
+        players[name] = score
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if self._journal:
+            self._journal.write(json.dumps([game_id, name, score]) + "\n")
+            self._journal.flush()
+
+        self._ensure_task()
+        if self.pending_count() >= self.max_pending:
+            self._wakeup.set()
+
+    def overlay(self, game_id: str, leaderboard: list, limit: int = 10) -> list:
+        """Merges not-yet-flushed scores for `game_id` into a leaderboard read from KV."""
+        buffered = {}
+        for source in (self._inflight, self._pending):
+            for name, score in source.get(game_id, {}).items():
+                buffered[name] = max(score, buffered.get(name, score))
+        if not buffered:
+            return leaderboard
+
+        merged = {entry["name"]: entry["score"] for entry in leaderboard}
+        for name, score in buffered.items():
+            merged[name] = max(score, merged.get(name, score))
+        # Same ordering as ZREVRANGE: score, then member, descending
+        ranked = sorted(merged.items(), key=lambda item: (item[1], item[0]), reverse=True)
+        return [{"name": name, "score": float(score), "rank": i + 1} for i, (name, score) in enumerate(ranked[:limit])]
+
+    def start(self):
+        """Starts the flush loop, e.g. to write out scores recovered from the journal."""
+        self._ensure_task()
+
+    def _ensure_task(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._pending:
+                await self.flush()
+
+    async def flush(self):
+        """Writes everything pending in one pipelined request. Failed batches are retried next cycle."""
+        if not self._pending or self._inflight:
+            return
+        batch, self._pending = self._pending, {}
+        self._inflight = batch
+        lag = time.monotonic() - self._oldest if self._oldest is not None else 0.0
+        self._oldest = None
+
+        size = sum(len(players) for players in batch.values())
+        start = time.perf_counter()
+        try:
+            await self.kv.submit_scores_async(batch)
+        except asyncio.CancelledError:
+            # Shutdown interrupted the write; ZADD GT makes writing the batch again harmless
+            self._merge_back(batch)
+            raise
+        except Exception as e:
+            self.failures += 1
+            print(f"Warning: Score flush failed, retrying next cycle: {e}")
+            self._merge_back(batch)
+            return
+        finally:
+            self._inflight = {}
+
+        self.flushes += 1
+        self.last_batch_size = size
+        self.max_batch_size = max(self.max_batch_size, size)
+        self.total_flushed += size
+        self.last_flush_lag = lag
+        self.max_flush_lag = max(self.max_flush_lag, lag)
+        self.last_flush_seconds = time.perf_counter() - start
+        self._compact_journal()
+        if self.on_flush:
+            self.on_flush(list(batch))
+
+    def _merge_back(self, batch: dict):
+        for game_id, players in batch.items():
+            current = self._pending.setdefault(game_id, {})
+            for name, score in players.items():
+                current[name] = max(score, current.get(name, score))
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    game_id, name, score = json.loads(line)
+                except ValueError:
+                    continue  # torn final line after a crash
+                players = self._pending.setdefault(game_id, {})
+                players[name] = max(score, players.get(name, score))
+        if self._pending:
+            self._oldest = time.monotonic()
+            print(f"Recovered {self.pending_count()} unflushed scores from {self.journal_path}")
+
+    def _compact_journal(self):
+        """Rewrites the journal to hold only what is still pending."""
+        if not self._journal:
+            return
+        self._journal.close()
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for game_id, players in self._pending.items():
+                for name, score in players.items():
+                    f.write(json.dumps([game_id, name, score]) + "\n")
+        os.replace(tmp_path, self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    async def close(self):
+        """Flushes what is left; called on shutdown."""
+        if self._task:
+            self._task.cancel()
+            # Let an interrupted flush put its batch back before the final one
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+    def stats(self) -> dict:
+        pending_age = time.monotonic() - self._oldest if self._oldest is not None else 0.0
+        return {
+            "pending": self.pending_count(),
+            "pending_age_ms": pending_age * 1000,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "flushed_scores": self.total_flushed,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": self.total_flushed / self.flushes if self.flushes else 0.0,
+            "last_flush_lag_ms": self.last_flush_lag * 1000,
+            "max_flush_lag_ms": self.max_flush_lag * 1000,
+            "last_flush_ms": self.last_flush_seconds * 1000,
+        }
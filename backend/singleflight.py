@@ -0,0 +1,134 @@
+import hashlib
+import threading
+import time
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.started_at = time.time()
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical upstream calls into one.
+
+    While a call for a key is in flight, further callers with the same key
+    wait for it and share its result instead of issuing their own. The key is
+    hashed, so full prompts can be passed directly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+        self.total_window = 0.0
+        self.last_window = 0.0
+
+    @staticmethod
+    def _hash(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _join(self, key: str):
+        """Returns (flight, is_leader)."""
+        key = self._hash(key)
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.coalesced += 1
+                return flight, False
+            flight = _Flight()
+            self._flights[key] = flight
+            self.leaders += 1
+            return flight, True
+
+    def _finish(self, key: str, flight: _Flight):
+        with self._lock:
+            self._flights.pop(self._hash(key), None)
+            # The coalescing window: how long followers could piggyback on this call
+            self.last_window = time.time() - flight.started_at
+            self.total_window += self.last_window
+            self.max_waiters = max(self.max_waiters, flight.waiters)
+        flight.done.set()
+
+    def do(self, key: str, fn):
+        """
+        Runs fn() once per concurrent key. Returns (result, shared) where shared
+        is True when the result came from another caller's call.
+        """
+        flight, leader = self._join(key)
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            self._finish(key, flight)
+        return flight.result, False
+
+    def do_stream(self, key: str, fn):
+        """
+        Streaming variant: fn() returns an iterator of chunks. One producer
+        thread drains it into a shared buffer that every caller replays, so a
+        caller disconnecting never stalls the others.
+        Returns (iterator, shared).
+        """
+        flight, leader = self._join(key)
+        if leader:
+            def produce():
+                try:
+                    for chunk in fn():
+                        with flight.cond:
+                            flight.chunks.append(chunk)
+                            flight.cond.notify_all()
+                except Exception as e:
+                    flight.error = e
+                finally:
+                    self._finish(key, flight)
+                    with flight.cond:
+                        flight.cond.notify_all()
+
+            threading.Thread(target=produce, daemon=True).start()
+
+        def replay():
+            i = 0
+            while True:
+                with flight.cond:
+                    while i >= len(flight.chunks) and not flight.done.is_set():
+                        flight.cond.wait()
+                    pending = flight.chunks[i:]
+                    finished = flight.done.is_set()
+                i += len(pending)
+                yield from pending
+                if finished and i >= len(flight.chunks):
+                    break
+            if flight.error is not None:
+                raise flight.error
+
+        return replay(), not leader
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._flights)
+        return {
+            "in_flight": in_flight,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "max_waiters": self.max_waiters,
+            "last_window_seconds": self.last_window,
+            "avg_window_seconds": self.total_window / self.leaders if self.leaders else 0.0,
+        }
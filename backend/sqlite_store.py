@@ -0,0 +1,242 @@
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at) WHERE expires_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS zset (
+    key TEXT NOT NULL,
+    member TEXT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (key, member)
+);
+CREATE INDEX IF NOT EXISTS zset_rank ON zset (key, score DESC, member DESC);
+"""
+
+READ_COMMANDS = {"GET", "TTL", "ZREVRANGE", "ZREVRANK", "ZSCORE", "ZCARD", "PUBLISH"}
+
+# Expired rows are otherwise only removed when read
+SWEEP_EVERY_WRITES = 500
+
+
+def kv_error(message: str):
+    # Imported late: importing kv_client builds its module-level client, which imports this module
+    from backend.kv_client import KVError
+    return KVError(message)
+
+
+def format_score(score: float) -> str:
+    """Scores come back as strings, like Redis replies."""
+    if math.isinf(score):
+        return "inf" if score > 0 else "-inf"
+    return repr(int(score)) if score == int(score) else repr(score)
+
+
+class SqliteStore:
+    """
+    Embedded drop-in for the Upstash transport (KV_BACKEND=sqlite).
+
+    Emulates the Redis commands KVClient issues (GET/SET EX/DEL/TTL, ZADD and the
+    ZREV* queries, PUBLISH) on a local SQLite database in WAL mode, so leaderboards
+    and games persist without credentials and reads cost microseconds instead of a
+    network round trip. Sorted-set queries use a (key, score DESC, member DESC) index.
+
+    Each thread gets its own connection (WAL lets readers run alongside the
+    writer); writes are serialized in-process. ":memory:" uses one shared connection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.memory = path == ":memory:"
+        if not self.memory:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._shared = None
+        self._writes = 0
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.memory:
+            if self._shared is None:
+                self._shared = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+                self._shared.executescript(SCHEMA)
+            return self._shared
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL only fsyncs at checkpoints; a crash can lose the last few writes, never corrupt
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    # --- transport interface (mirrors UpstashRest) ---
+
+    def execute(self, *command):
+        return self.pipeline([command])[0]
+
+    async def aexecute(self, *command):
+        # Writes can wait on the write lock or a busy database; keep that off the event loop
+        return await asyncio.to_thread(self.execute, *command)
+
+    def pipeline(self, commands: list) -> list:
+        """Runs all commands in one transaction."""
+        conn = self._connect()
+        writes = any(str(c[0]).upper() not in READ_COMMANDS for c in commands)
+        if not writes and not self.memory:
+            return [self._run(conn, [str(a) for a in c]) for c in commands]
+
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                results = [self._run(conn, [str(a) for a in c]) for c in commands]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._writes += len(commands)
+            if self._writes >= SWEEP_EVERY_WRITES:
+                self._writes = 0
+                conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        return results
+
+    async def apipeline(self, commands: list) -> list:
+        return await asyncio.to_thread(self.pipeline, commands)
+
+    def close(self):
+        conn = self._shared if self.memory else getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+
+    # --- command emulation ---
+
+    def _run(self, conn: sqlite3.Connection, command: list):
+        name, args = command[0].upper(), command[1:]
+        handler = getattr(self, f"_cmd_{name.lower()}", None)
+        if handler is None:
+            raise kv_error(f"ERR unknown command '{name}'")
+        return handler(conn, args)
+
+    @staticmethod
+    def _cmd_get(conn, args):
+        row = conn.execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (args[0], time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _cmd_set(conn, args):
+        key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+        expires_at = None
+        if "EX" in options:
+            expires_at = time.time() + int(args[2 + options.index("EX") + 1])
+        conn.execute(
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, value, expires_at),
+        )
+        return "OK"
+
+    @staticmethod
+    def _cmd_del(conn, args):
+        removed = 0
+        for key in args:
+            removed += conn.execute("DELETE FROM kv WHERE key = ?", (key,)).rowcount
+            removed += int(conn.execute("DELETE FROM zset WHERE key = ?", (key,)).rowcount > 0)
+        return removed
+
+    @staticmethod
+    def _cmd_ttl(conn, args):
+        row = conn.execute("SELECT expires_at FROM kv WHERE key = ?", (args[0],)).fetchone()
+        if row is None:
+            return -2
+        if row[0] is None:
+            return -1
+        remaining = row[0] - time.time()
+        return int(remaining) if remaining > 0 else -2
+
+    @staticmethod
+    def _cmd_zadd(conn, args):
+        key, rest = args[0], args[1:]
+        flags = set()
+        while rest and rest[0].upper() in ("NX", "XX", "GT", "LT", "CH"):
+            flags.add(rest[0].upper())
+            rest = rest[1:]
+        added = changed = 0
+        for i in range(0, len(rest), 2):
+            score, member = float(rest[i]), rest[i + 1]
+            if math.isnan(score):
+                # Redis accepts +/-inf but not NaN
+                raise kv_error("ERR value is not a valid float")
+            row = conn.execute("SELECT score FROM zset WHERE key = ? AND member = ?", (key, member)).fetchone()
+            if row is None:
+                if "XX" in flags:
+                    continue
+                conn.execute("INSERT INTO zset (key, member, score) VALUES (?, ?, ?)", (key, member, score))
+                added += 1
+                continue
+            current = row[0]
+            if "NX" in flags or ("GT" in flags and score <= current) or ("LT" in flags and score >= current):
+                continue
+            if score != current:
+                conn.execute("UPDATE zset SET score = ? WHERE key = ? AND member = ?", (score, key, member))
+                changed += 1
+        return added + changed if "CH" in flags else added
+
+    @staticmethod
+    def _cmd_zrevrange(conn, args):
+        key, start, stop = args[0], int(args[1]), int(args[2])
+        if start < 0 or stop < 0:
+            total = conn.execute("SELECT COUNT(*) FROM zset WHERE key = ?", (key,)).fetchone()[0]
+            start = max(start + total, 0) if start < 0 else start
+            stop = stop + total if stop < 0 else stop
+        if stop < start:
+            return []
+        rows = conn.execute(
+            "SELECT member, score FROM zset WHERE key = ? ORDER BY score DESC, member DESC LIMIT ? OFFSET ?",
+            (key, stop - start + 1, start),
+        ).fetchall()
+        if len(args) > 3 and args[3].upper() == "WITHSCORES":
+            flat = []
+            for member, score in rows:
+                flat += [member, format_score(score)]
+            return flat
+        return [member for member, _ in rows]
+
+    @staticmethod
+    def _cmd_zrevrank(conn, args):
+        key, member = args[0], args[1]
+        row = conn.execute("SELECT score FROM zset WHERE key = ? AND member = ?", (key, member)).fetchone()
+        if row is None:
+            return None
+        return conn.execute(
+            "SELECT COUNT(*) FROM zset WHERE key = ? AND (score > ? OR (score = ? AND member > ?))",
+            (key, row[0], row[0], member),
+        ).fetchone()[0]
+
+    @staticmethod
+    def _cmd_zscore(conn, args):
+        row = conn.execute("SELECT score FROM zset WHERE key = ? AND member = ?", (args[0], args[1])).fetchone()
+        return format_score(row[0]) if row else None
+
+    @staticmethod
+    def _cmd_zcard(conn, args):
+        return conn.execute("SELECT COUNT(*) FROM zset WHERE key = ?", (args[0],)).fetchone()[0]
+
+    @staticmethod
+    def _cmd_publish(conn, args):
+        # No cross-process pub/sub; leaderboard pushes stay on the in-process broker
+        return 0
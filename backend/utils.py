@@ -1,27 +1,151 @@
-import re
+import gzip
+
+TRUNCATION_BANNER = "\n<div style='position:fixed;bottom:0;left:0;width:100%;background:red;color:white;text-align:center;z-index:9999;padding:10px;'>Warning: This game was truncated during generation and may not work.</div>"
+
+
+def compress_html(html: str) -> bytes:
+    """Gzips game HTML. mtime is fixed so identical games compress to identical bytes."""
+    return gzip.compress(html.encode("utf-8"), compresslevel=6, mtime=0)
+
+
+def decompress_html(data: bytes) -> str:
+    return gzip.decompress(data).decode("utf-8")
+
 
 def clean_html_output(text: str) -> str:
     """
     Cleans Gemini output to ensure valid raw HTML.
-    Removes markdown fences if present.
+    Removes markdown fences if present and patches truncated documents.
+    """
+    return HtmlPostProcessor().run(text)
+
+
+_ASCII_LOWER = {ord(c): ord(c.lower()) for c in "ABCDEFGHIJKLMNOPQRSTUVWXYZ"}
+
+
+def lower_aligned(text: str) -> str:
+    """Lowercased copy whose indices line up with `text`."""
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # Some non-ASCII characters change length when lowercased; the tokens we look for are ASCII
+        lowered = text.translate(_ASCII_LOWER)
+    return lowered
+
+
+class HtmlPostProcessor:
     """
-    # Remove ```html or ``` if present
-    text = re.sub(r"```html", "", text, flags=re.IGNORECASE)
-    text = re.sub(r"```", "", text)
-    
-    # Trim whitespace
-    text = text.strip()
-
-    # Basic repair: Ensure critical tags are closed if they were opened
-    # This is a fallback for truncation
-    if "<html" in text.lower() and "</html>" not in text.lower():
-        print("!!! CRITICAL ERROR: Game generation was TRUNCATED by the model.")
-        print("!!! The generated file will likely be broken.")
-        
-        # Patching defensively so the page at least loads an error message
-        if "</script>" not in text.lower() and "<script" in text.lower():
-            text += "\n// [TRUNCATED BY AI]\n</script>"
-        text += "\n<div style='position:fixed;bottom:0;left:0;width:100%;background:red;color:white;text-align:center;z-index:9999;padding:10px;'>Warning: This game was truncated during generation and may not work.</div>"
-        text += "\n</body></html>"
-
-    return text
+    Single-pass post-processor for Gemini HTML, fed either a stream of chunks or
+    a whole document (run()).
+
+    Per chunk it makes one lowercased copy and collects its edits from C-level
+    searches: markdown fences to strip, placeholders (e.g. [[GAME_ID]]) to
+    substitute and the metadata script to inject before </body>. It also notes
+    which structural tags were seen, so finish() can patch output the model
+    truncated. The result is assembled with a single join, and a chunk with
+    nothing to change is passed through as is. Any tail that could be the start
+    of a token is held back until the next chunk arrives; the output is stripped
+    like clean_html_output.
+    """
+
+    _TAGS = ("<html", "</html>", "<script", "</script>")
+
+    def __init__(self, replacements: dict = None, metadata_script: str = ""):
+        self.replacements = replacements or {}
+        self.metadata_script = metadata_script
+        self.metadata_injected = not metadata_script
+        self._prefixes = ["```html", "</body>", *self._TAGS, *(p.lower() for p in self.replacements)]
+        self._holdback = max(len(t) for t in self._prefixes) - 1
+        self._leads = {t[0] for t in self._prefixes}
+        self._pending = ""
+        self._started = False
+        self._seen = dict.fromkeys(self._TAGS, False)
+        self.truncated = False
+
+    def _process(self, text: str) -> str:
+        lowered = lower_aligned(text)
+        for tag, seen in self._seen.items():
+            # Only <html sits near the start of a document; scripts and closing tags are found faster backwards
+            if not seen and (lowered.find(tag) if tag == "<html" else lowered.rfind(tag)) != -1:
+                self._seen[tag] = True
+
+        edits = []  # (start, end, replacement)
+        i = lowered.find("```")
+        while i != -1:
+            end = i + 7 if lowered.startswith("html", i + 3) else i + 3
+            edits.append((i, end, ""))
+            i = lowered.find("```", end)
+        for placeholder, value in self.replacements.items():
+            i = text.find(placeholder)
+            while i != -1:
+                edits.append((i, i + len(placeholder), value))
+                i = text.find(placeholder, i + len(placeholder))
+        if not self.metadata_injected:
+            i = lowered.rfind("</body>")
+            if i != -1:
+                edits.append((i, i, f"{self.metadata_script}\n"))
+                self.metadata_injected = True
+
+        if not edits:
+            return text
+        edits.sort()
+        out = []
+        pos = 0
+        for start, end, replacement in edits:
+            out.append(text[pos:start])
+            out.append(replacement)
+            pos = end
+        out.append(text[pos:])
+        return "".join(out)
+
+    def _safe_cut(self, text: str) -> int:
+        """Index before which no token can still be completed by later chunks."""
+        start = max(len(text) - self._holdback, 0)
+        tail = lower_aligned(text[start:])
+        for i, char in enumerate(tail):
+            if char in self._leads:
+                rest = tail[i:]
+                if any(t.startswith(rest) for t in self._prefixes):
+                    return start + i
+        return len(text)
+
+    def feed(self, chunk: str) -> str:
+        """Processes a chunk and returns the part that is safe to emit."""
+        buf = self._pending + chunk
+        cut = self._safe_cut(buf)
+        text = self._process(buf[:cut] if cut < len(buf) else buf)
+        if not self._started:
+            text = text.lstrip()
+
+        # Trailing whitespace is held back too, since the final output is stripped
+        body = text.rstrip()
+        self._pending = text[len(body):] + buf[cut:]
+        if body:
+            self._started = True
+        return body
+
+    def finish(self) -> str:
+        """Flushes the held-back tail, patching truncated output."""
+        tail = self._process(self._pending).rstrip()
+        if not self._started:
+            tail = tail.lstrip()
+        self._pending = ""
+
+        self.truncated = self._seen["<html"] and not self._seen["</html>"]
+        if self.truncated:
+            print("!!! CRITICAL ERROR: Game generation was TRUNCATED by the model.")
+            print("!!! The generated file will likely be broken.")
+            # Patching defensively so the page at least loads an error message
+            if self._seen["<script"] and not self._seen["</script>"]:
+                tail += "\n// [TRUNCATED BY AI]\n</script>"
+            tail += TRUNCATION_BANNER
+            # Route the closing tags through the normal pass so metadata still lands before </body>
+            tail += self._process("\n</body></html>")
+
+        if not self.metadata_injected:
+            tail += self.metadata_script
+            self.metadata_injected = True
+        return tail
+
+    def run(self, text: str) -> str:
+        """Processes a complete document."""
+        return self.feed(text) + self.finish()
@@ -0,0 +1,235 @@
+"""
+In-process stand-in for the parts of `google.generativeai` that GeminiClient uses.
+
+Simulates prefill cost proportional to uncached input tokens, decode cost per
+output chunk, explicit context caches (with a minimum cacheable size), token
+usage metadata and, optionally, output truncated at MAX_TOKENS that continues
+where it left off, so generation paths can be benchmarked without an API key or
+network access.
+
+Usage:
+    from benchmarks.fake_gemini import FakeGenAI, install
+    fake = install(FakeGenAI(prefill_ms_per_1k_tokens=40))
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+FINISH_STOP = 1
+FINISH_MAX_TOKENS = 2
+
+# The API's minimum explicit-cache size per model; others get the largest
+MIN_CACHE_TOKENS = {"gemini-2.5-pro": 4096, "gemini-2.5-flash": 1024}
+MIN_CACHE_TOKENS_DEFAULT = 4096
+
+DEFAULT_HTML = (
+    "<!DOCTYPE html><html><head><title>Game</title></head><body>"
+    + "<p>question</p>" * 400
+    + "<script>const GAME_ID = \"[[GAME_ID]]\";\n"
+    + "const getApiBaseUrl = () => window.location.origin;\nconst API_BASE = getApiBaseUrl();\n"
+    + "function submitScore(score) { return fetch(`${API_BASE}/submit-score`, { method: 'POST' }); }\n"
+    + "function initGame() {}\ninitGame();</script></body></html>"
+)
+
+
+def count_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def partial_output(contents) -> str:
+    """Text of the model turn in a continuation request ("" for a fresh prompt)."""
+    if isinstance(contents, str):
+        return ""
+    return "".join(part for turn in contents if turn["role"] == "model" for part in turn["parts"])
+
+
+def contents_text(contents) -> str:
+    """Flattens a prompt string or a list of {"role", "parts"} turns."""
+    if isinstance(contents, str):
+        return contents
+    return "".join(part for turn in contents for part in turn["parts"])
+
+
+class FakeCachedContent:
+    def __init__(self, api, model: str, system_instruction: str, ttl):
+        self.api = api
+        self.name = f"cachedContents/fake-{id(self):x}"
+        self.model = model
+        self.system_instruction = system_instruction
+        self.token_count = count_tokens(system_instruction)
+        self.expire_time = time.time() + ttl.total_seconds()
+
+    def update(self, *, ttl=None, expire_time=None):
+        self.api.cache_updates += 1
+        self.expire_time = time.time() + ttl.total_seconds()
+
+
+class FakeResponse:
+    """Non-streaming response, or a streaming one once iterated."""
+
+    def __init__(self, chunks, usage, finish_reason: int = FINISH_STOP):
+        self._chunks = chunks
+        self.text = "".join(chunk.text for chunk in chunks)
+        self.candidates = [SimpleNamespace(finish_reason=finish_reason)]
+        self.usage_metadata = usage
+        self.prompt_feedback = None
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+
+class FakeStream(FakeResponse):
+    def __init__(self, api, chunks, usage, finish_reason: int = FINISH_STOP):
+        super().__init__(chunks, usage, finish_reason)
+        self.api = api
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            time.sleep(self.api.decode_seconds(chunk.text))
+            yield chunk
+
+
+class FakeGenerativeModel:
+    def __init__(self, api, model_name: str, generation_config=None, system_instruction=None, cached_content=None):
+        self.api = api
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self.generation_config = generation_config
+        self.system_instruction = system_instruction
+        self.cached_content = cached_content
+
+    def generate_content(self, contents, stream: bool = False, request_options=None):
+        api = self.api
+        api.check_failure(self.model_name)
+        delay = api.model_delays.get(self.model_name.split("/")[-1])
+        if delay:
+            time.sleep(delay)
+        instruction = self.system_instruction or ""
+        cached_tokens = 0
+        if self.cached_content is not None:
+            if self.cached_content.expire_time <= time.time():
+                raise RuntimeError(f"404 CachedContent not found (expired): {self.cached_content.name}")
+            instruction = self.cached_content.system_instruction
+            cached_tokens = self.cached_content.token_count
+
+        prompt_tokens = count_tokens(instruction) + count_tokens(contents_text(contents))
+        time.sleep(api.prefill_seconds(prompt_tokens - cached_tokens, cached_tokens))
+
+        html = api.output_for(self.model_name)[len(partial_output(contents)):]
+        finish_reason = FINISH_STOP
+        if api.max_output_chars and len(html) > api.max_output_chars:
+            html, finish_reason = html[:api.max_output_chars], FINISH_MAX_TOKENS
+        chunks = [SimpleNamespace(text=html[i:i + api.chunk_chars]) for i in range(0, len(html), api.chunk_chars)]
+        usage = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=count_tokens(html),
+            cached_content_token_count=cached_tokens,
+        )
+        with api.lock:
+            api.calls += 1
+            api.prompt_tokens += prompt_tokens
+            api.cached_tokens += cached_tokens
+        if stream:
+            return FakeStream(api, chunks, usage, finish_reason)
+        time.sleep(api.decode_seconds(html))
+        return FakeResponse(chunks, usage, finish_reason)
+
+
+class FakeGenAI:
+    """
+    Drop-in for the `genai` module object.
+
+    prefill_ms_per_1k_tokens applies to uncached input; cached input is charged
+    cached_prefill_factor of that. Explicit caches smaller than the model's minimum
+    (MIN_CACHE_TOKENS, or min_cache_tokens for every model when given) are
+    rejected, like the real API. With max_output_chars set, longer outputs
+    stop with MAX_TOKENS and the continuation request picks up after the partial
+    output it replays.
+    """
+
+    def __init__(
+        self,
+        prefill_ms_per_1k_tokens: float = 40.0,
+        cached_prefill_factor: float = 0.1,
+        decode_ms_per_1k_chars: float = 2.0,
+        chunk_chars: int = 2048,
+        min_cache_tokens: int = None,
+        html: str = DEFAULT_HTML,
+        max_output_chars: int = None,
+    ):
+        self.prefill_ms_per_1k_tokens = prefill_ms_per_1k_tokens
+        self.cached_prefill_factor = cached_prefill_factor
+        self.decode_ms_per_1k_chars = decode_ms_per_1k_chars
+        self.chunk_chars = chunk_chars
+        self.min_cache_tokens = min_cache_tokens
+        self.html = html
+        self.max_output_chars = max_output_chars
+        # model name -> exception to raise, for fallback testing
+        self.failures = {}
+        # model name -> extra seconds before each response, for hedging tests
+        self.model_delays = {}
+
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.caches_created = 0
+        self.cache_updates = 0
+
+        api = self
+
+        class GenerativeModel(FakeGenerativeModel):
+            def __init__(self, model_name: str = "gemini-2.5-pro", generation_config=None, system_instruction=None, **kwargs):
+                super().__init__(api, model_name, generation_config, system_instruction)
+
+            @classmethod
+            def from_cached_content(cls, cached_content, generation_config=None, **kwargs):
+                model = cls(cached_content.model, generation_config)
+                model.cached_content = cached_content
+                return model
+
+        class CachedContent:
+            @staticmethod
+            def create(model: str, *, display_name=None, system_instruction=None, contents=None, ttl=None, **kwargs):
+                tokens = count_tokens(system_instruction or "")
+                minimum = api.min_cache_tokens_for(model)
+                if tokens < minimum:
+                    raise RuntimeError(
+                        f"400 Cached content is too small. total_token_count={tokens}, min_total_token_count={minimum}"
+                    )
+                api.caches_created += 1
+                return FakeCachedContent(api, model, system_instruction, ttl)
+
+        self.GenerativeModel = GenerativeModel
+        self.caching = SimpleNamespace(CachedContent=CachedContent)
+
+    def configure(self, api_key=None, **kwargs):
+        pass
+
+    def min_cache_tokens_for(self, model_name: str) -> int:
+        if self.min_cache_tokens is not None:
+            return self.min_cache_tokens
+        return MIN_CACHE_TOKENS.get(model_name.split("/")[-1], MIN_CACHE_TOKENS_DEFAULT)
+
+    def prefill_seconds(self, uncached_tokens: int, cached_tokens: int) -> float:
+        effective = uncached_tokens + cached_tokens * self.cached_prefill_factor
+        return effective / 1000 * self.prefill_ms_per_1k_tokens / 1000
+
+    def decode_seconds(self, text: str) -> float:
+        return len(text) / 1000 * self.decode_ms_per_1k_chars / 1000
+
+    def output_for(self, model_name: str) -> str:
+        return self.html
+
+    def check_failure(self, model_name: str):
+        error = self.failures.get(model_name.split("/")[-1])
+        if error is not None:
+            raise error
+
+
+def install(fake: FakeGenAI) -> FakeGenAI:
+    """Points backend.gemini_client at the fake (call before creating GeminiClient)."""
+    import os
+    import backend.gemini_client as gemini_client
+    os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+    gemini_client.genai = fake
+    return fake
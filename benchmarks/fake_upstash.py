@@ -0,0 +1,228 @@
+"""
+Local stand-in for the Upstash Redis REST API.
+
+Implements just the commands the backend uses, over HTTP/1.1 keep-alive, so
+benchmarks and debugging can run without credentials or network access.
+
+Usage:
+    python -m benchmarks.fake_upstash --port 8079 --latency-ms 2
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_TOKEN = "fake-token"
+
+
+class FakeRedis:
+    """In-memory strings (with expiry), sorted sets and pub/sub channels."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.strings = {}  # key -> (value, expires_at or None)
+        self.zsets = {}  # key -> {member: score}
+        self.channels = {}  # channel -> set of queue.Queue
+
+    def subscribe(self, channel: str) -> queue.Queue:
+        q = queue.Queue()
+        with self.lock:
+            self.channels.setdefault(channel, set()).add(q)
+        return q
+
+    def unsubscribe(self, channel: str, q: queue.Queue):
+        with self.lock:
+            self.channels.get(channel, set()).discard(q)
+
+    def _get_string(self, key):
+        entry = self.strings.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self.strings[key]
+            return None
+        return value
+
+    def _ranked(self, key):
+        members = self.zsets.get(key, {})
+        # Redis orders ties by member, reversed for ZREV* commands
+        return sorted(members.items(), key=lambda kv: (kv[1], kv[0]), reverse=True)
+
+    @staticmethod
+    def _score(value: float) -> str:
+        return repr(int(value)) if value == int(value) else repr(value)
+
+    def execute(self, command: list):
+        name = command[0].upper()
+        args = command[1:]
+        with self.lock:
+            if name == "GET":
+                return self._get_string(args[0])
+            if name == "SET":
+                expires_at = None
+                opts = [a.upper() for a in args[2:]]
+                if "EX" in opts:
+                    expires_at = time.time() + int(args[2 + opts.index("EX") + 1])
+                self.strings[args[0]] = (args[1], expires_at)
+                return "OK"
+            if name == "DEL":
+                removed = 0
+                for key in args:
+                    removed += int(self.strings.pop(key, None) is not None)
+                    removed += int(self.zsets.pop(key, None) is not None)
+                return removed
+            if name == "TTL":
+                entry = self.strings.get(args[0])
+                if entry is None or self._get_string(args[0]) is None:
+                    return -2
+                return -1 if entry[1] is None else int(entry[1] - time.time())
+            if name == "ZADD":
+                key, rest = args[0], args[1:]
+                flags = set()
+                while rest and rest[0].upper() in ("NX", "XX", "GT", "LT", "CH"):
+                    flags.add(rest[0].upper())
+                    rest = rest[1:]
+                zset = self.zsets.setdefault(key, {})
+                added = 0
+                for i in range(0, len(rest), 2):
+                    score, member = float(rest[i]), rest[i + 1]
+                    current = zset.get(member)
+                    if current is None:
+                        if "XX" in flags:
+                            continue
+                        added += 1
+                    elif "NX" in flags or ("GT" in flags and score <= current) or ("LT" in flags and score >= current):
+                        continue
+                    zset[member] = score
+                return added
+            if name == "ZREVRANGE":
+                key, start, stop = args[0], int(args[1]), int(args[2])
+                ranked = self._ranked(key)
+                stop = len(ranked) - 1 if stop == -1 else stop
+                window = ranked[start:stop + 1]
+                if len(args) > 3 and args[3].upper() == "WITHSCORES":
+                    flat = []
+                    for member, score in window:
+                        flat += [member, self._score(score)]
+                    return flat
+                return [member for member, _ in window]
+            if name == "ZREVRANK":
+                for rank, (member, _) in enumerate(self._ranked(args[0])):
+                    if member == args[1]:
+                        return rank
+                return None
+            if name == "ZSCORE":
+                score = self.zsets.get(args[0], {}).get(args[1])
+                return None if score is None else self._score(score)
+            if name == "ZCARD":
+                return len(self.zsets.get(args[0], {}))
+            if name == "PUBLISH":
+                subscribers = list(self.channels.get(args[0], ()))
+                for q in subscribers:
+                    q.put(args[1])
+                return len(subscribers)
+        raise ValueError(f"ERR unknown command '{name}'")
+
+
+class FakeUpstashHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real service
+    # Send each response in a single write so delayed ACKs don't add ~40ms per call
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_subscription(self, channel: str):
+        """Upstash-style SSE: `data: subscribe,<channel>,1` then `data: message,<channel>,<payload>`."""
+        q = self.server.redis.subscribe(channel)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            self.wfile.write(f"data: subscribe,{channel},1\n\n".encode("utf-8"))
+            self.wfile.flush()
+            while True:
+                try:
+                    message = q.get(timeout=15)
+                    line = f"data: message,{channel},{message}\n\n"
+                except queue.Empty:
+                    line = ": ping\n\n"
+                self.wfile.write(line.encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.server.redis.unsubscribe(channel, q)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"null")
+
+        if self.headers.get("Authorization") != f"Bearer {FAKE_TOKEN}":
+            return self._send(401, {"error": "Unauthorized"})
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        redis = self.server.redis
+        if self.path.startswith("/subscribe/"):
+            return self._stream_subscription(self.path[len("/subscribe/"):])
+        if self.path.rstrip("/") in ("/pipeline", "/multi-exec"):
+            results = []
+            for command in body:
+                try:
+                    results.append({"result": redis.execute(command)})
+                except Exception as e:
+                    results.append({"error": str(e)})
+            return self._send(200, results)
+
+        try:
+            return self._send(200, {"result": redis.execute(body)})
+        except Exception as e:
+            return self._send(400, {"error": str(e)})
+
+
+class FakeUpstashServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The stdlib default backlog (5) resets connections under concurrent load
+    request_queue_size = 256
+
+
+def start_fake_upstash(port: int = 0, latency_ms: float = 0.0):
+    """Starts the server in a daemon thread. Returns (server, base_url)."""
+    server = FakeUpstashServer(("127.0.0.1", port), FakeUpstashHandler)
+    server.redis = FakeRedis()
+    server.latency = latency_ms / 1000.0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8079)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="artificial per-request delay")
+    args = parser.parse_args()
+
+    server, url = start_fake_upstash(args.port, args.latency_ms)
+    print(f"Fake Upstash listening on {url}")
+    print(f"  KV_REST_API_URL={url}")
+    print(f"  KV_REST_API_TOKEN={FAKE_TOKEN}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
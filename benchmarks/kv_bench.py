@@ -0,0 +1,103 @@
+"""
+Measures KV call latency (p50/p99) for get_game, submit_score and get_leaderboard
+against a local fake Upstash server, comparing the pooled keep-alive session
+with a fresh connection per call (the cost of not reusing connections).
+
+Usage:
+    python -m benchmarks.kv_bench --iterations 500 --latency-ms 1
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.fake_upstash import FAKE_TOKEN, start_fake_upstash
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def report(label: str, samples: dict):
+    for op, values in samples.items():
+        print(
+            f"{label:<18} {op:<16} n={len(values):<6} "
+            f"p50={percentile(values, 0.50) * 1000:7.2f}ms  p99={percentile(values, 0.99) * 1000:7.2f}ms"
+        )
+
+
+def run_pooled(kv, iterations: int) -> dict:
+    samples = {"get_game": [], "submit_score": [], "get_leaderboard": []}
+    for i in range(iterations):
+        for op, call in (
+            ("get_game", lambda: kv.get_game("bench")),
+            ("submit_score", lambda: kv.submit_score("bench", f"player{i % 50}", i)),
+            ("get_leaderboard", lambda: kv.get_leaderboard("bench")),
+        ):
+            start = time.perf_counter()
+            call()
+            samples[op].append(time.perf_counter() - start)
+    return samples
+
+
+def run_unpooled(url: str, iterations: int) -> dict:
+    """One short-lived connection per call, as a baseline."""
+    headers = {"Authorization": f"Bearer {FAKE_TOKEN}", "Connection": "close"}
+    samples = {"get_game": [], "submit_score": [], "get_leaderboard": []}
+    for i in range(iterations):
+        for op, command in (
+            ("get_game", ["GET", "game_html:bench"]),
+            ("submit_score", ["ZADD", "leaderboard:bench", str(i), f"player{i % 50}"]),
+            ("get_leaderboard", ["ZREVRANGE", "leaderboard:bench", "0", "9", "WITHSCORES"]),
+        ):
+            start = time.perf_counter()
+            httpx.post(url, json=command, headers=headers)
+            samples[op].append(time.perf_counter() - start)
+    return samples
+
+
+async def run_async(kv, iterations: int, concurrency: int) -> dict:
+    samples = {"get_game": [], "get_leaderboard": []}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(op, coro_fn):
+        async with semaphore:
+            start = time.perf_counter()
+            await coro_fn()
+            samples[op].append(time.perf_counter() - start)
+
+    tasks = []
+    for _ in range(iterations):
+        tasks.append(timed("get_game", lambda: kv.get_game_async("bench")))
+        tasks.append(timed("get_leaderboard", lambda: kv.get_leaderboard_async("bench")))
+    await asyncio.gather(*tasks)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="artificial server-side delay")
+    parser.add_argument("--concurrency", type=int, default=16, help="in-flight calls for the async run")
+    args = parser.parse_args()
+
+    server, url = start_fake_upstash(latency_ms=args.latency_ms)
+    os.environ["KV_REST_API_URL"] = url
+    os.environ["KV_REST_API_TOKEN"] = FAKE_TOKEN
+
+    from backend.kv_client import KVClient
+    kv = KVClient()
+    kv.save_game("bench", "<html>" + "x" * 30000 + "</html>")
+
+    report("unpooled (sync)", run_unpooled(url, args.iterations))
+    report("pooled (sync)", run_pooled(kv, args.iterations))
+    report(f"pooled (async x{args.concurrency})", asyncio.run(run_async(kv, args.iterations, args.concurrency)))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Offline load test: drives the FastAPI app in-process against the fake Gemini
+API and a fake Upstash server, and reports throughput and p50/p95/p99 latency
+for generate (streamed, end to end), serve, submit-score and leaderboard.
+
+No credentials or network access are needed and the fakes are deterministic,
+so runs on the same machine are comparable. Each run is appended to
+benchmarks/results/history.jsonl under the current commit; the report compares
+it with the latest run with the same settings from a different commit and
+exits non-zero when a p95 or throughput figure regressed by more than --threshold.
+
+Usage:
+    python -m benchmarks.load_test --generate 40 --requests 2000 --concurrency 32
+    python -m benchmarks.load_test --max-output-chars 4000   # exercise MAX_TOKENS continuations
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.fake_gemini import FakeGenAI, install
+from benchmarks.fake_upstash import FAKE_TOKEN, start_fake_upstash
+
+RESULTS_DIR = Path(__file__).parent / "results"
+HISTORY_PATH = RESULTS_DIR / "history.jsonl"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def current_commit() -> str:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD", "--", "backend"]).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+async def run_scenario(name: str, request_fn, count: int, concurrency: int) -> dict:
+    """Runs `count` calls of request_fn(i) with at most `concurrency` in flight."""
+    latencies, errors = [], 0
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal errors
+        async with limit:
+            start = time.perf_counter()
+            try:
+                ok = await request_fn(i)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": name,
+        "requests": count,
+        "errors": errors,
+        "throughput_rps": count / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run_load(app, args) -> list:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        game_ids = []
+
+        async def generate(i):
+            # Distinct prompts so every request reaches the model unless --repeat-prompts
+            prompt = f"Fractions quiz #{i % args.repeat_prompts if args.repeat_prompts else i}"
+            async with client.stream("POST", "/generate-game/stream", json={"prompt": prompt}) as response:
+                body = "".join([chunk async for chunk in response.aiter_text()])
+            if response.status_code != 200 or "event: done" not in body:
+                return False
+            done = json.loads(body.split("event: done\ndata: ", 1)[1].split("\n", 1)[0])
+            game_ids.append(done["game_id"])
+            return True
+
+        async def serve(i):
+            game_id = game_ids[i % len(game_ids)]
+            response = await client.get(f"/games/game_{game_id}.html", headers={"Accept-Encoding": "gzip"})
+            return response.status_code == 200
+
+        async def submit_score(i):
+            game_id = game_ids[i % len(game_ids)]
+            response = await client.post(
+                "/submit-score", json={"game_id": game_id, "player_name": f"player{i % 200}", "score": i % 1000}
+            )
+            return response.status_code == 200
+
+        async def leaderboard(i):
+            response = await client.get(f"/leaderboard/{game_ids[i % len(game_ids)]}")
+            return response.status_code == 200
+
+        results = [await run_scenario("generate", generate, args.generate, args.generate_concurrency)]
+        if not game_ids:
+            raise SystemExit("No game was generated; nothing to serve")
+        for name, fn in (("serve", serve), ("submit-score", submit_score), ("leaderboard", leaderboard)):
+            results.append(await run_scenario(name, fn, args.requests, args.concurrency))
+        return results
+
+
+def load_baseline(commit: str, config: dict):
+    """Latest recorded run with the same settings for a different commit."""
+    if not HISTORY_PATH.exists():
+        return None
+    baseline = None
+    with open(HISTORY_PATH, encoding="utf-8") as f:
+        for line in f:
+            run = json.loads(line)
+            if run["commit"] != commit and run["config"] == config:
+                baseline = run
+    return baseline
+
+
+def report(results: list, baseline, threshold: float) -> list:
+    before = {r["scenario"]: r for r in baseline["results"]} if baseline else {}
+    regressions = []
+    print(f"{'scenario':<14} {'req':>6} {'err':>5} {'rps':>9} {'p50':>10} {'p95':>10} {'p99':>10}   vs baseline")
+    for r in results:
+        line = (
+            f"{r['scenario']:<14} {r['requests']:>6} {r['errors']:>5} {r['throughput_rps']:>9.1f} "
+            f"{r['p50_ms']:>8.2f}ms {r['p95_ms']:>8.2f}ms {r['p99_ms']:>8.2f}ms"
+        )
+        old = before.get(r["scenario"])
+        if old:
+            p95_change = r["p95_ms"] / old["p95_ms"] - 1 if old["p95_ms"] else 0.0
+            rps_change = r["throughput_rps"] / old["throughput_rps"] - 1 if old["throughput_rps"] else 0.0
+            line += f"   p95 {p95_change:+.0%}, rps {rps_change:+.0%}"
+            if p95_change > threshold or rps_change < -threshold:
+                regressions.append(r["scenario"])
+                line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--generate", type=int, default=24, help="generations to run (also the games served)")
+    parser.add_argument("--generate-concurrency", type=int, default=8)
+    parser.add_argument("--repeat-prompts", type=int, default=0, help="cycle through this many prompts (cache hits)")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per serve/score/leaderboard scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--prefill-ms", type=float, default=20.0, help="fake prefill cost per 1k input tokens")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="fake decode rate")
+    parser.add_argument("--max-output-chars", type=int, default=None, help="truncate fake outputs at MAX_TOKENS")
+    parser.add_argument("--kv-latency-ms", type=float, default=1.0, help="fake Upstash per-request delay")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change counted as a regression")
+    parser.add_argument("--no-save", action="store_true", help="don't record this run")
+    args = parser.parse_args()
+
+    server, url = start_fake_upstash(latency_ms=args.kv_latency_ms)
+    os.environ.update({"KV_REST_API_URL": url, "KV_REST_API_TOKEN": FAKE_TOKEN, "KV_BACKEND": "upstash"})
+    # Game files and any local KV data go to a scratch directory, not the repo
+    scratch = tempfile.TemporaryDirectory(prefix="load_test_")
+    os.environ["GENERATED_GAMES_DIR"] = os.path.join(scratch.name, "games")
+    os.environ["KV_SQLITE_PATH"] = os.path.join(scratch.name, "kv.sqlite3")
+    os.environ.setdefault("GENERATION_MAX_QUEUE", "0")
+    # ~4 characters per token
+    decode_ms_per_1k_chars = 1000 * 1000 / (args.tokens_per_second * 4)
+    fake = install(FakeGenAI(
+        prefill_ms_per_1k_tokens=args.prefill_ms,
+        decode_ms_per_1k_chars=decode_ms_per_1k_chars,
+        max_output_chars=args.max_output_chars,
+    ))
+
+    from backend.main import app
+
+    # The backend logs every generation and save; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(run_load(app, args))
+    server.shutdown()
+    scratch.cleanup()
+
+    commit = current_commit()
+    config = {k: v for k, v in vars(args).items() if k not in ("threshold", "no_save")}
+    baseline = load_baseline(commit, config)
+    if baseline:
+        print(f"commit {commit}, baseline {baseline['commit']} ({baseline['recorded_at']})")
+    else:
+        print(f"commit {commit}, no baseline recorded yet")
+    regressions = report(results, baseline, args.threshold)
+    print(f"fake Gemini: {fake.calls} calls, {fake.prompt_tokens} prompt tokens")
+
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        run = {
+            "commit": commit,
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": config,
+            "results": results,
+        }
+        with open(HISTORY_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(run) + "\n")
+
+    if regressions:
+        print(f"Regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Micro-benchmark of game HTML post-processing: the previous chain (regex fence
+removal, lower()-based truncation checks, then [[GAME_ID]] replace, a </body>
+scan and a metadata replace) against the single-pass HtmlPostProcessor, on a
+whole document and fed as stream chunks. Also checks both produce the same HTML.
+
+Usage:
+    python -m benchmarks.postprocess_bench --size-kb 60 --iterations 500
+"""
+import argparse
+import contextlib
+import io
+import re
+import time
+
+from backend.utils import TRUNCATION_BANNER, HtmlPostProcessor
+
+GAME_ID = "0123456789abcdef0123456789abcdef"
+METADATA = '\n<!-- GENERATED METADATA -->\n<script id="game-metadata" type="application/json">\n{"prompt": "bench"}\n</script>'
+
+
+def legacy_postprocess(text: str) -> str:
+    """clean_html_output followed by the id and metadata injection, as before HtmlPostProcessor."""
+    text = re.sub(r"```html", "", text, flags=re.IGNORECASE)
+    text = re.sub(r"```", "", text)
+    text = text.strip()
+    if "<html" in text.lower() and "</html>" not in text.lower():
+        if "</script>" not in text.lower() and "<script" in text.lower():
+            text += "\n// [TRUNCATED BY AI]\n</script>"
+        text += TRUNCATION_BANNER
+        text += "\n</body></html>"
+
+    text = text.replace("[[GAME_ID]]", GAME_ID)
+    if "</body>" in text:
+        text = text.replace("</body>", f"{METADATA}\n</body>")
+    else:
+        text += METADATA
+    return text
+
+
+def single_pass(text: str) -> str:
+    return HtmlPostProcessor({"[[GAME_ID]]": GAME_ID}, METADATA).run(text)
+
+
+def single_pass_stream(chunks: list) -> str:
+    processor = HtmlPostProcessor({"[[GAME_ID]]": GAME_ID}, METADATA)
+    return "".join([processor.feed(chunk) for chunk in chunks]) + processor.finish()
+
+
+def make_document(size_kb: int, truncated: bool = False) -> str:
+    body = "<div class='q'><p>Question about fractions</p><button>Answer</button></div>\n"
+    body *= size_kb * 1024 // len(body)
+    script = "<script>\nconst GAME_ID = \"[[GAME_ID]]\";\nfunction initGame() { return 1; }\n</script>\n"
+    doc = f"```html\n<!DOCTYPE html>\n<html><head><title>Game</title></head><body>\n{body}{script}</body></html>\n```\n"
+    return doc[: len(doc) * 2 // 3] if truncated else doc
+
+
+def timed(fn, arg, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-kb", type=int, default=60)
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--chunk-chars", type=int, default=2048, help="stream chunk size")
+    args = parser.parse_args()
+
+    for truncated in (False, True):
+        doc = make_document(args.size_kb, truncated)
+        chunks = [doc[i:i + args.chunk_chars] for i in range(0, len(doc), args.chunk_chars)]
+        # Truncated documents make both versions print a warning per call
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = legacy_postprocess(doc)
+            assert single_pass(doc) == expected, "single-pass output differs from the legacy chain"
+            assert single_pass_stream(chunks) == expected, "streamed output differs from the legacy chain"
+
+            legacy = timed(legacy_postprocess, doc, args.iterations)
+            whole = timed(single_pass, doc, args.iterations)
+            streamed = timed(single_pass_stream, chunks, args.iterations)
+
+        label = "truncated" if truncated else "complete"
+        print(f"{label} document, {len(doc) / 1024:.0f} KB:")
+        print(f"  legacy chain          {legacy * 1e6:9.1f} us")
+        print(f"  single pass           {whole * 1e6:9.1f} us  ({legacy / whole:.2f}x)")
+        print(f"  single pass, {len(chunks):>3} chunks {streamed * 1e6:8.1f} us  ({legacy / streamed:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
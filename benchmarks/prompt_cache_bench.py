@@ -0,0 +1,78 @@
+"""
+Compares GEMINI_PROMPT_CACHE modes (off / system / explicit) against the fake
+Gemini API: time to first token (prefill latency) and billed input tokens per
+request, using the real game-generation template.
+
+Cached input tokens are billed at CACHED_TOKEN_RATE of the normal price; the
+"billed" column is that input cost expressed in full-price tokens.
+
+Usage:
+    python -m benchmarks.prompt_cache_bench --requests 20 --prefill-ms 40
+"""
+import argparse
+import contextlib
+import io
+import os
+
+from benchmarks.fake_gemini import FakeGenAI, install
+
+CACHED_TOKEN_RATE = 0.25
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def run_mode(mode: str, fake: FakeGenAI, requests: int) -> dict:
+    os.environ["GEMINI_PROMPT_CACHE"] = mode
+    from backend.gemini_client import GeminiClient
+    from backend.prompt_templates import prompt_registry
+
+    client = GeminiClient()
+    template = prompt_registry.get()
+    ttft, prompt_tokens, cached_tokens = [], [], []
+    for i in range(requests):
+        system_instruction, prompt = template.render_parts(
+            f"Quiz game #{i} about fractions\n\n[OPTIONS]\nDifficulty: medium\nTimed Mode: YES"
+        )
+        # The client logs usage for every call; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in client.generate_stream(prompt, system_instruction=system_instruction):
+                pass
+        usage = client.last_usage
+        ttft.append(usage["first_token_seconds"])
+        prompt_tokens.append(usage["prompt_tokens"])
+        cached_tokens.append(usage["cached_tokens"])
+
+    billed = [p - c + c * CACHED_TOKEN_RATE for p, c in zip(prompt_tokens, cached_tokens)]
+    return {
+        "mode": usage["prompt_cache"],
+        "ttft_p50_ms": percentile(ttft, 0.5) * 1000,
+        "ttft_p99_ms": percentile(ttft, 0.99) * 1000,
+        "prompt_tokens": sum(prompt_tokens) / requests,
+        "cached_tokens": sum(cached_tokens) / requests,
+        "billed_tokens": sum(billed) / requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--prefill-ms", type=float, default=40.0, help="fake prefill cost per 1k uncached input tokens")
+    parser.add_argument("--min-cache-tokens", type=int, default=None, help="smallest instruction the fake lets you cache (default: per-model API minimums)")
+    args = parser.parse_args()
+
+    fake = install(FakeGenAI(prefill_ms_per_1k_tokens=args.prefill_ms, min_cache_tokens=args.min_cache_tokens))
+    print(f"{'requested':<10} {'used':<9} {'ttft p50':>10} {'ttft p99':>10} {'prompt tok':>11} {'cached tok':>11} {'billed tok':>11}")
+    for mode in ("off", "system", "explicit"):
+        r = run_mode(mode, fake, args.requests)
+        print(
+            f"{mode:<10} {r['mode']:<9} {r['ttft_p50_ms']:>8.1f}ms {r['ttft_p99_ms']:>8.1f}ms "
+            f"{r['prompt_tokens']:>11.0f} {r['cached_tokens']:>11.0f} {r['billed_tokens']:>11.0f}"
+        )
+    print(f"fake API: {fake.calls} calls, {fake.caches_created} context caches created, {fake.cache_updates} refreshed")
+
+
+if __name__ == "__main__":
+    main()
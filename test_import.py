@@ -2,6 +2,7 @@
 import requests
 import json
 import os
+import time
 
 BASE_URL = "http://localhost:8000"
 
@@ -19,6 +20,19 @@ def test_generation_and_metadata():
         response.raise_for_status()
         
         data = response.json()
+        print(f"Queued job {data['job_id']}, polling {data['status_url']}...")
+
+        # Generation runs in the background; poll until the job finishes
+        while True:
+            job = requests.get(f"{BASE_URL}{data['status_url']}").json()
+            if job["status"] in ("succeeded", "failed"):
+                break
+            time.sleep(2)
+
+        if job["status"] == "failed":
+            print(f"❌ Generation failed: {job['error']}")
+            return
+
         print(f"Success! Game URL: {data['game_url']}")
         
         # Download the game
@@ -0,0 +1,59 @@
+"""
+Shared setup: every backend module reads its configuration from the environment
+at import time, so point storage at a throwaway directory and the Gemini client
+at benchmarks.fake_gemini before anything under backend/ is imported.
+
+Run from the repository root:
+    python -m pytest -q
+"""
+import os
+import tempfile
+
+import pytest
+
+_tmp = tempfile.TemporaryDirectory(prefix="game_generator_tests_")
+os.environ.update({
+    "GEMINI_API_KEY": "fake-key",
+    "GEMINI_HEDGE": "0",
+    "GEMINI_RETRY_BASE_DELAY": "0",
+    "KV_BACKEND": "sqlite",
+    "KV_SQLITE_PATH": os.path.join(_tmp.name, "kv.sqlite3"),
+    "GENERATED_GAMES_DIR": os.path.join(_tmp.name, "generated_games"),
+    "SCORE_WRITE_BEHIND": "0",
+})
+
+from benchmarks.fake_gemini import FakeGenAI, install  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    _tmp.cleanup()
+
+
+@pytest.fixture
+def fake():
+    """A FakeGenAI with no simulated latency, installed for newly created clients."""
+    return install(FakeGenAI(prefill_ms_per_1k_tokens=0, decode_ms_per_1k_chars=0))
+
+
+@pytest.fixture
+def client(fake):
+    from backend.gemini_client import GeminiClient
+    return GeminiClient()
+
+
+@pytest.fixture
+def app_module(fake, monkeypatch):
+    """backend.main with a fresh Gemini client and an empty, process-local generation cache."""
+    import backend.main as main
+    from backend.generation_cache import GenerationCache
+
+    monkeypatch.setattr(main, "gemini_client", None)
+    monkeypatch.setattr(main, "generation_cache", GenerationCache())
+    return main
+
+
+@pytest.fixture
+def make_request(app_module):
+    def make(prompt="A quiz about fractions", difficulty="medium", is_timed=True):
+        return app_module.GameRequest(prompt=prompt, difficulty=difficulty, is_timed=is_timed)
+    return make
@@ -0,0 +1,64 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.jobs import JobQueue
+from backend.rate_limit import RateLimiter, RateLimitExceeded
+
+
+def full_queue(monkeypatch, depth: int, max_depth: int = 2) -> JobQueue:
+    queue = JobQueue(None, concurrency=1, max_depth=max_depth)
+    monkeypatch.setattr(queue, "depth", lambda: depth)
+    return queue
+
+
+def test_limiter_rejects_calls_that_would_wait_too_long():
+    limiter = RateLimiter(rpm=1, tpm=0, per_model={}, max_wait=5)
+    limiter.acquire("gemini-2.5-pro", 100)
+
+    assert limiter.wait_time("gemini-2.5-pro") > 5
+    with pytest.raises(RateLimitExceeded) as raised:
+        limiter.acquire("gemini-2.5-pro", 100)
+    assert raised.value.retry_after > 5
+    assert limiter.wait_time("gemini-2.5-flash") == 0
+
+
+def test_saturation_counts_queued_and_waiting_work(monkeypatch):
+    assert not full_queue(monkeypatch, depth=1).saturated()
+    assert full_queue(monkeypatch, depth=2).saturated()
+    # A batch larger than the queue still fits an empty one
+    assert not full_queue(monkeypatch, depth=0).saturated(5)
+    assert not JobQueue(None, concurrency=1, max_depth=0).saturated(1000)
+
+
+def test_estimated_wait_scales_with_the_backlog(monkeypatch):
+    queue = full_queue(monkeypatch, depth=3)
+    queue.avg_seconds = 10.0
+    assert queue.estimated_wait() == 30.0
+    assert full_queue(monkeypatch, depth=0).estimated_wait() == 0.0
+
+
+def test_full_queue_answers_429_with_retry_after(app_module, monkeypatch):
+    queue = full_queue(monkeypatch, depth=2)
+    queue.avg_seconds = 4.0
+    monkeypatch.setattr(app_module, "generation_jobs", queue)
+
+    with TestClient(app_module.app) as api:
+        for path in ("/generate-game", "/generate-game/stream"):
+            response = api.post(path, json={"prompt": "A quiz about stars"})
+            assert response.status_code == 429
+            assert response.headers["Retry-After"] == "8"
+    assert queue.stats()["rejected"] == 2
+
+
+def test_rejects_only_when_every_model_is_out_of_quota(app_module, client, make_request, monkeypatch):
+    client.limiter = RateLimiter(rpm=1, tpm=0, per_model={}, max_wait=5)
+    monkeypatch.setattr(app_module, "gemini_client", client)
+    request = make_request()
+    models = client.router.plan(request.difficulty, request.prompt)
+
+    for model in models[:-1]:
+        client.limiter.acquire(model, 0)
+    assert app_module.admission_retry_after([request]) is None
+
+    client.limiter.acquire(models[-1], 0)
+    assert app_module.admission_retry_after([request]) >= 5
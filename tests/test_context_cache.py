@@ -0,0 +1,98 @@
+import threading
+import time
+
+from backend.gemini_client import ContextCache
+
+CONFIG = {"temperature": 0.5}
+
+
+def instruction(tokens: int) -> str:
+    return "x" * (tokens * 4)
+
+
+def test_minimum_size_is_per_model(fake):
+    cache = ContextCache()
+
+    assert cache.model_for("gemini-2.5-pro", instruction(2700), CONFIG) is None
+    assert cache.model_for("gemini-2.5-flash", instruction(2700), CONFIG) is not None
+    assert cache.model_for("some-new-model", instruction(2700), CONFIG) is None
+    assert cache.stats()["too_small"] == 2
+    assert fake.caches_created == 1
+
+
+def test_minimum_can_be_overridden(fake, monkeypatch):
+    monkeypatch.setenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", '{"gemini-2.5-pro": 2048}')
+    assert ContextCache().min_tokens_for("models/gemini-2.5-pro") == 2048
+    assert ContextCache().min_tokens_for("gemini-2.5-flash") == 1024
+
+
+def test_warm_handle_is_returned_without_the_lock(fake):
+    cache = ContextCache()
+    model = cache.model_for("gemini-2.5-flash", instruction(2000), CONFIG)
+
+    result = []
+    with cache._lock:
+        reader = threading.Thread(target=lambda: result.append(cache.model_for("gemini-2.5-flash", instruction(2000), CONFIG)))
+        reader.start()
+        reader.join(timeout=2)
+    assert result == [model]
+
+
+def slow_creates(fake, monkeypatch):
+    """Makes CachedContent.create block until the returned event is set."""
+    release = threading.Event()
+    create = fake.caching.CachedContent.create
+
+    def blocking_create(*args, **kwargs):
+        release.wait(timeout=5)
+        return create(*args, **kwargs)
+
+    monkeypatch.setattr(fake.caching.CachedContent, "create", staticmethod(blocking_create))
+    return release
+
+
+def test_concurrent_requests_fall_back_instead_of_queueing_behind_a_create(fake, monkeypatch):
+    cache = ContextCache()
+    release = slow_creates(fake, monkeypatch)
+    created = []
+    creator = threading.Thread(target=lambda: created.append(cache.model_for("gemini-2.5-flash", instruction(2000), CONFIG)))
+    creator.start()
+    while not cache._pending:
+        time.sleep(0.001)
+
+    start = time.perf_counter()
+    assert cache.model_for("gemini-2.5-flash", instruction(2000), CONFIG) is None
+    assert time.perf_counter() - start < 0.5
+
+    release.set()
+    creator.join(timeout=2)
+    assert created[0] is not None
+    assert cache.model_for("gemini-2.5-flash", instruction(2000), CONFIG) is created[0]
+    assert fake.caches_created == 1
+
+
+def test_refresh_keeps_serving_the_current_handle(fake, monkeypatch):
+    cache = ContextCache(ttl=600, refresh_margin=300)
+    model = cache.model_for("gemini-2.5-flash", instruction(2000), CONFIG)
+    key = next(iter(cache._entries))
+    cached, _, _ = cache._entries[key]
+    cache._entries[key] = (cached, model, time.time() + 100)  # inside the refresh margin
+
+    release = threading.Event()
+    update = cached.update
+
+    def blocking_update(**kwargs):
+        release.wait(timeout=5)
+        update(**kwargs)
+
+    cached.update = blocking_update
+    refresher = threading.Thread(target=lambda: cache.model_for("gemini-2.5-flash", instruction(2000), CONFIG))
+    refresher.start()
+    while not cache._pending:
+        time.sleep(0.001)
+
+    assert cache.model_for("gemini-2.5-flash", instruction(2000), CONFIG) is model
+    release.set()
+    refresher.join(timeout=2)
+    assert cache.stats()["refreshed"] == 1
+    assert cache._entries[key][2] - time.time() > 300
@@ -0,0 +1,45 @@
+from backend.gemini_client import stitch_overlap
+
+# Lines must differ, or stitch_overlap reads the start of each continuation as a repeat
+NUMBERED_HTML = (
+    "<!DOCTYPE html><html><body>"
+    + "".join(f"<p>question {i}</p>" for i in range(400))
+    + "<script>function initGame() {}\ninitGame();</script></body></html>"
+)
+
+
+def test_truncated_output_is_continued_and_stitched(client, fake):
+    fake.html = NUMBERED_HTML
+    fake.max_output_chars = len(fake.html) // 2 + 1
+    html = client.generate("prompt")
+
+    assert html == fake.html
+    assert client.last_usage["continuations"] == 1
+    assert fake.calls == 2
+
+
+def test_continuations_are_bounded(client, fake):
+    fake.html = NUMBERED_HTML
+    fake.max_output_chars = len(fake.html) // 10
+    html = client.generate("prompt")
+
+    assert client.last_usage["continuations"] == client.max_continuations
+    assert fake.calls == client.max_continuations + 1
+    assert fake.html.startswith(html)
+    assert len(html) < len(fake.html)
+
+
+def test_streamed_output_is_continued(client, fake):
+    fake.html = NUMBERED_HTML
+    fake.max_output_chars = len(fake.html) // 2 + 1
+    html = "".join(client.generate_stream("prompt"))
+
+    assert html.strip() == fake.html
+    assert client.last_usage["continuations"] == 1
+
+
+def test_stitch_overlap_drops_repeated_prefix():
+    existing = "function initGame() { setupBoard(); startTimer(); }"
+    assert stitch_overlap(existing, "setupBoard(); startTimer(); }\ninitGame();") == "\ninitGame();"
+    # Short overlaps are more likely coincidence than repetition
+    assert stitch_overlap(existing, "}\ninitGame();") == "}\ninitGame();"
@@ -0,0 +1,159 @@
+import pytest
+
+from backend.game_editor import (
+    EditFailed,
+    GameEditor,
+    PatchError,
+    apply_edit_blocks,
+    game_id_of,
+    parse_edit_blocks,
+    render_metadata_script,
+    split_metadata,
+)
+
+GAME = """<html><body>
+<script>
+    function initGame() {
+        score = 0;
+        startTimer(60);
+    }
+    initGame();
+</script>
+</body></html>"""
+
+
+def reply(*blocks) -> str:
+    return "".join(f"<<<<<<< SEARCH\n{search}\n=======\n{replace}\n>>>>>>> REPLACE\n" for search, replace in blocks)
+
+
+def test_parse_edit_blocks():
+    blocks = parse_edit_blocks(reply(("startTimer(60);", "startTimer(90);"), ("score = 0;", "")))
+    assert blocks == [("startTimer(60);", "startTimer(90);"), ("score = 0;", "")]
+
+
+def test_reply_without_blocks_is_rejected():
+    with pytest.raises(PatchError):
+        parse_edit_blocks("Sure! Here is the updated game: <html>...</html>")
+
+
+def test_exact_match_is_applied():
+    html, loose = apply_edit_blocks(GAME, [("        startTimer(60);", "        startTimer(90);")])
+    assert "        startTimer(90);" in html
+    assert loose == 0
+
+
+def test_mid_line_search_matches_trimmed():
+    html, loose = apply_edit_blocks(GAME, [("  startTimer(60);  \n", "startTimer(90);")])
+    assert "        startTimer(90);\n" in html
+    assert loose == 1
+
+
+def test_lines_match_ignoring_indentation():
+    search = "function initGame() {\n  score = 0;\n  startTimer(60);\n}"
+    replace = "    function initGame() {\n        score = 10;\n        startTimer(60);\n    }"
+    html, loose = apply_edit_blocks(GAME, [(search, replace)])
+    assert "        score = 10;" in html
+    assert "score = 0;" not in html
+    assert loose == 1
+
+
+def test_ambiguous_and_missing_searches_are_reported_together():
+    game = GAME.replace("score = 0;", "score = 0;\n        score = 0;")
+    with pytest.raises(PatchError) as error:
+        apply_edit_blocks(game, [("score = 0;", "score = 1;"), ("stopTimer();", "")])
+    assert "matches 2 places" in str(error.value)
+    assert "not found" in str(error.value)
+
+
+def test_metadata_round_trip():
+    html = GAME.replace("</body>", render_metadata_script({"version": 2}) + "\n</body>")
+    game, metadata = split_metadata(html)
+    assert metadata == {"version": 2}
+    assert "game-metadata" not in game
+
+
+def passing_validate(html, known):
+    return html, {"remaining": []}
+
+
+def test_edit_retries_with_the_patch_error():
+    replies = iter([
+        reply(("startTimer(30);", "startTimer(90);")),
+        reply(("startTimer(60);", "startTimer(90);")),
+    ])
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return next(replies), {"output_tokens": 10}
+
+    editor = GameEditor(max_attempts=2)
+    html, info = editor.edit(GAME, "Give players 90 seconds", "parent", generate, passing_validate)
+
+    assert "startTimer(90);" in html
+    assert info["attempts"] == 2
+    assert "SEARCH not found" in prompts[1]
+    _, metadata = split_metadata(html)
+    assert metadata["edited_from"] == "parent"
+    assert metadata["version"] == 2
+
+
+def test_edit_that_breaks_the_game_fails():
+    def generate(prompt):
+        return reply(("initGame();", "")), {}
+
+    def validate(html, known):
+        return html, {"remaining": [{"code": "missing_init_call", "message": "initGame() is defined but never called"}]}
+
+    with pytest.raises(EditFailed):
+        GameEditor(max_attempts=2).edit(GAME, "Remove the start call", "parent", generate, validate)
+
+
+def test_game_id_of():
+    assert game_id_of('<script>\nconst GAME_ID = "abc123";\n</script>') == "abc123"
+    assert game_id_of("<script>let GAME_ID='x-1';</script>") == "x-1"
+    assert game_id_of("<script>initGame();</script>") is None
+
+
+def stored_game(game_id: str) -> str:
+    from benchmarks.fake_gemini import DEFAULT_HTML
+    return DEFAULT_HTML.replace("[[GAME_ID]]", game_id)
+
+
+def edit(app_module, html, parent_id="parent1", instruction="Make it harder"):
+    return app_module.run_edit_pipeline({
+        "html": html,
+        "instruction": instruction,
+        "parent_id": parent_id,
+        "game_id": "child1",
+        "difficulty": "medium",
+    })
+
+
+def test_edit_keeps_the_parents_game_id(app_module, fake):
+    fake.html = reply(("<p>question</p><script>", "<p>harder question</p><script>"))
+    result = edit(app_module, stored_game("original1"), parent_id="parent1")
+
+    edited = app_module.load_game_html(result["game_id"])
+    assert result["game_id"] == "child1"
+    assert game_id_of(edited) == "original1"
+    assert "harder question" in edited
+
+
+def test_repaired_edit_restores_the_parents_game_id(app_module, fake):
+    # The patch drops the GAME_ID const; the local repair must put back the original id
+    fake.html = reply(('const GAME_ID = "original1";', ""))
+    result = edit(app_module, stored_game("original1"))
+
+    edited = app_module.load_game_html(result["game_id"])
+    assert game_id_of(edited) == "original1"
+    assert {r["code"] for r in result["validation"]["repairs"]} == {"missing_game_id"}
+
+
+def test_edit_does_not_regenerate_problems_the_game_already_had(app_module, fake):
+    broken = stored_game("original1").replace("function initGame() {}", "function initGame() { draw(]; }")
+    fake.html = reply(("<p>question</p><script>", "<p>harder question</p><script>"))
+    edit(app_module, broken)
+
+    # One call for the patch; none for repairing the pre-existing syntax error
+    assert fake.calls == 1
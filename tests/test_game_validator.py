@@ -0,0 +1,91 @@
+from backend.game_validator import GameValidator, scan_js, validate_game
+
+API_BASE = "const getApiBaseUrl = () => '';\nconst API_BASE = getApiBaseUrl();\n"
+SUBMIT = "function submitScore(s) { return fetch(`${API_BASE}/submit-score`, {method: 'POST'}); }\n"
+INIT = "function initGame() { draw(); }\n"
+
+
+def game(script: str, closed: bool = True) -> str:
+    return f"<!DOCTYPE html><html><body><script>\n{script}{'</script>' if closed else ''}\n</body></html>"
+
+
+VALID = game(f'const GAME_ID = "g1";\n{API_BASE}{SUBMIT}{INIT}initGame();\n')
+
+
+def codes(html: str) -> set:
+    return {p.code for p in validate_game(html)[0]}
+
+
+def test_valid_game_has_no_problems():
+    assert codes(VALID) == set()
+
+
+def test_scan_js_ignores_brackets_in_strings_comments_templates_and_regexes():
+    code = "const a = '(' + \"[\"; // {\n/* ) */ const r = /[(]/g; const t = `${ {x: '}'}.x }`;"
+    assert scan_js(code) == ([], [])
+
+
+def test_scan_js_reports_unclosed_and_mismatched_brackets():
+    assert scan_js("function f() { if (x) { go();") == ([], ["{", "{"])
+    errors, _ = scan_js("call(a]);")
+    assert errors and "closes '('" in errors[0][1]
+
+
+def test_contract_gaps_are_reported():
+    html = game(f"{INIT}\n")
+    assert {"missing_game_id", "missing_api_base", "missing_submit_score", "missing_init_call"} <= codes(html)
+
+
+def test_missing_pieces_are_repaired_locally():
+    html = game(f"{SUBMIT}{INIT}")
+    repaired, report = GameValidator(mode="repair").process(html, "g1")
+
+    assert report["result"] == "repaired"
+    assert report["remaining"] == []
+    assert {r["code"] for r in report["repairs"]} == {"missing_game_id", "missing_api_base", "missing_init_call"}
+    assert 'const GAME_ID = "g1";' in repaired
+    assert codes(repaired) == set()
+
+
+def test_truncated_script_is_closed():
+    html = game(f'const GAME_ID = "g1";\n{API_BASE}{SUBMIT}function initGame() {{ if (ready) {{ draw();\n', closed=False)
+    repaired, report = GameValidator(mode="repair").process(html, "g1")
+
+    assert {"unclosed_script", "js_unclosed"} <= {p["code"] for p in report["problems"]}
+    assert report["result"] == "repaired"
+    assert codes(repaired) == set()
+
+
+def test_broken_section_is_regenerated_by_the_repair_model():
+    html = game(f'const GAME_ID = "g1";\n{API_BASE}{SUBMIT}{INIT}initGame(];\n')
+    prompts = []
+
+    def regenerate(prompt):
+        prompts.append(prompt)
+        return f'```javascript\nconst GAME_ID = "g1";\n{API_BASE}{SUBMIT}{INIT}initGame();\n```', {"output_tokens": 50}
+
+    repaired, report = GameValidator(mode="repair", max_sections=2).process(html, "g1", regenerate)
+
+    assert len(prompts) == 1
+    assert report["result"] == "repaired"
+    assert report["repairs"][-1]["kind"] == "regenerated"
+    assert codes(repaired) == set()
+
+
+def test_invalid_regeneration_keeps_the_original():
+    html = game(f'const GAME_ID = "g1";\n{API_BASE}{SUBMIT}{INIT}initGame(];\n')
+    validator = GameValidator(mode="repair")
+
+    repaired, report = validator.process(html, "g1", lambda prompt: ("initGame(];", {}))
+
+    assert "initGame(];" in repaired
+    assert report["result"] == "failed"
+    assert report["remaining"][0]["code"] == "js_syntax"
+    assert validator.regeneration_failures == 1
+
+
+def test_check_mode_reports_without_repairing():
+    html = game(f"{SUBMIT}{INIT}")
+    checked, report = GameValidator(mode="check").process(html, "g1")
+    assert checked == html
+    assert report["result"] == "failed"
@@ -0,0 +1,53 @@
+import time
+
+from backend.generation_cache import GenerationCache
+
+
+def test_second_identical_request_is_a_cache_hit(app_module, fake, make_request):
+    first, status, _ = app_module.build_game(make_request(), "game1")
+    calls = fake.calls
+    second, second_status, _ = app_module.build_game(make_request(), "game2")
+
+    assert (status, second_status) == ("miss", "hit")
+    assert fake.calls == calls
+    # Post-processing runs per game, so each copy gets its own id
+    assert 'const GAME_ID = "game1"' in first
+    assert 'const GAME_ID = "game2"' in second
+
+
+def test_prompts_differing_only_in_case_and_spacing_share_an_entry(app_module, fake, make_request):
+    app_module.build_game(make_request("A quiz about fractions"), "game1")
+    _, status, _ = app_module.build_game(make_request("  a QUIZ about   fractions."), "game2")
+    assert status == "hit"
+
+
+def test_other_options_miss(app_module, fake, make_request):
+    app_module.build_game(make_request(), "game1")
+    _, status, _ = app_module.build_game(make_request(difficulty="hard"), "game2")
+    assert status == "miss"
+
+
+def test_lru_evicts_oldest_entry():
+    cache = GenerationCache(max_entries=2)
+    cache.set("a", "<html>a</html>")
+    cache.set("b", "<html>b</html>")
+    cache.get("a")
+    cache.set("c", "<html>c</html>")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "<html>a</html>"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_miss(monkeypatch):
+    cache = GenerationCache(ttl=10)
+    cache.set("a", "<html>a</html>")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("a") is None
+
+
+def test_entries_over_the_byte_budget_are_not_kept():
+    cache = GenerationCache(max_bytes=10)
+    cache.set("a", "<html>too big</html>")
+    assert cache.get("a") is None
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.jobs import JobQueue
+
+
+def blocking_handler(release: threading.Event, calls: list):
+    def handler(payload):
+        calls.append(payload)
+        release.wait(timeout=5)
+        return payload
+    return handler
+
+
+def test_submitted_job_runs_and_is_kept():
+    async def scenario():
+        queue = JobQueue(lambda payload: payload * 2, concurrency=2, max_depth=0)
+        job = await queue.submit(21, job_id="job1")
+        assert job.status == "queued"
+        return queue, await queue.wait(job)
+
+    queue, job = asyncio.run(scenario())
+    assert (job.status, job.result, job.error) == ("succeeded", 42, None)
+    assert job.started_at <= job.finished_at
+    assert queue.get("job1") is job
+
+
+def test_handler_failure_is_recorded():
+    def handler(payload):
+        raise ValueError("bad prompt")
+
+    async def scenario():
+        queue = JobQueue(handler, concurrency=1, max_depth=0)
+        return await queue.wait(await queue.submit("x"))
+
+    job = asyncio.run(scenario())
+    assert job.status == "failed"
+    assert job.error == "bad prompt"
+    assert job.to_dict()["status"] == "failed"
+
+
+def test_run_returns_the_result_and_forgets_the_job():
+    def handler(payload):
+        if payload == "boom":
+            raise RuntimeError("boom")
+        return payload.upper()
+
+    async def scenario():
+        queue = JobQueue(None, concurrency=1, max_depth=0)
+        assert await queue.run(handler, "ok") == "OK"
+        with pytest.raises(RuntimeError):
+            await queue.run(handler, "boom")
+        return queue
+
+    assert asyncio.run(scenario()).backend.jobs == {}
+
+
+def test_concurrency_bounds_running_handlers():
+    peak, running, lock = [0], [0], threading.Lock()
+
+    def handler(payload):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return payload
+
+    async def scenario():
+        queue = JobQueue(handler, concurrency=2, max_depth=0)
+        jobs = [await queue.submit(i) for i in range(6)]
+        return [(await queue.wait(job)).result for job in jobs]
+
+    assert asyncio.run(scenario()) == list(range(6))
+    assert peak[0] == 2
+
+
+def test_slot_shares_the_bound_with_workers():
+    async def scenario():
+        queue = JobQueue(None, concurrency=1, max_depth=0)
+        release, calls = threading.Event(), []
+        task = asyncio.create_task(queue.run(blocking_handler(release, calls), "job"))
+        while not calls:
+            await asyncio.sleep(0.001)
+
+        entered = threading.Event()
+
+        def stream():
+            with queue.slot():
+                entered.set()
+
+        thread = threading.Thread(target=stream)
+        thread.start()
+        await asyncio.sleep(0.05)
+        assert not entered.is_set()
+        assert queue.stats()["waiting"] == 1
+        release.set()
+        await task
+        thread.join(timeout=2)
+        return entered.is_set()
+
+    assert asyncio.run(scenario())
+
+
+def test_cancelled_run_is_skipped_before_it_starts():
+    async def scenario():
+        queue = JobQueue(None, concurrency=1, max_depth=0)
+        release, calls = threading.Event(), []
+        handler = blocking_handler(release, calls)
+
+        first = asyncio.create_task(queue.run(handler, "first"))
+        while not calls:
+            await asyncio.sleep(0.001)
+        second = asyncio.create_task(queue.run(handler, "second"))
+        await asyncio.sleep(0.01)
+        second.cancel()
+        release.set()
+
+        assert await first == "first"
+        await asyncio.sleep(0.05)
+        return queue, calls
+
+    queue, calls = asyncio.run(scenario())
+    assert calls == ["first"]
+    assert queue.stats()["cancelled"] == 1
+    assert queue.backend.jobs == {}
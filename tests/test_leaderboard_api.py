@@ -0,0 +1,69 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def api():
+    import backend.main as main
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def board(api):
+    """A fresh game with five players: p4 (40) down to p0 (0)."""
+    game_id = uuid.uuid4().hex
+    for i in range(5):
+        assert api.post("/submit-score", json={"game_id": game_id, "player_name": f"p{i}", "score": i * 10}).status_code == 200
+    return game_id
+
+
+def test_first_page_carries_ranks_and_paging_headers(api, board):
+    response = api.get(f"/leaderboard/{board}?limit=2")
+
+    assert response.json() == [{"name": "p4", "score": 40.0, "rank": 1}, {"name": "p3", "score": 30.0, "rank": 2}]
+    assert response.headers["X-Total-Count"] == "5"
+    assert response.headers["X-Next-Offset"] == "2"
+
+
+def test_following_next_offset_walks_the_whole_board(api, board):
+    names, url = [], f"/leaderboard/{board}?limit=2"
+    while True:
+        response = api.get(url)
+        names += [entry["name"] for entry in response.json()]
+        if "X-Next-Offset" not in response.headers:
+            break
+        url = f"/leaderboard/{board}?limit=2&offset={response.headers['X-Next-Offset']}"
+
+    assert names == ["p4", "p3", "p2", "p1", "p0"]
+
+
+def test_cached_head_reflects_a_new_submission(api, board):
+    api.get(f"/leaderboard/{board}")
+    result = api.post("/submit-score", json={"game_id": board, "player_name": "new", "score": 35}).json()
+    assert (result["rank"], result["total"]) == (2, 6)
+
+    response = api.get(f"/leaderboard/{board}")
+    assert [entry["name"] for entry in response.json()][:2] == ["p4", "new"]
+    assert response.headers["X-Total-Count"] == "6"
+    assert "X-Next-Offset" not in response.headers
+
+
+def test_around_centres_the_page_on_the_player(api, board):
+    response = api.get(f"/leaderboard/{board}?limit=3&around=p1")
+
+    assert [(entry["name"], entry["rank"]) for entry in response.json()] == [("p2", 3), ("p1", 4), ("p0", 5)]
+    assert "X-Next-Offset" not in response.headers
+    assert api.get(f"/leaderboard/{board}?around=nobody").status_code == 404
+
+
+def test_player_rank_lookup(api, board):
+    assert api.get(f"/leaderboard/{board}/rank/p3").json() == {"name": "p3", "rank": 2, "score": 30.0}
+    assert api.get(f"/leaderboard/{board}/rank/nobody").status_code == 404
+
+
+def test_page_bounds_are_validated(api, board):
+    assert api.get(f"/leaderboard/{board}?limit=0").status_code == 400
+    assert api.get(f"/leaderboard/{board}?offset=-1").status_code == 400
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from backend.leaderboard_cache import LeaderboardCache
+
+
+class FakeKV:
+    """Serves a fixed board; each fetch waits on `release` when one is set."""
+
+    def __init__(self, board: list):
+        self.board = board
+        self.fetches = 0
+        self.release = None
+
+    async def get_leaderboard_page_async(self, game_id: str, offset: int, limit: int):
+        self.fetches += 1
+        page = (list(self.board[offset:offset + limit]), len(self.board))
+        if self.release is not None:
+            await self.release.wait()
+        return page
+
+
+BOARD = [{"name": "a", "score": 3.0, "rank": 1}, {"name": "b", "score": 2.0, "rank": 2}]
+
+
+def test_repeat_reads_are_served_from_memory():
+    async def scenario():
+        kv = FakeKV(BOARD)
+        cache = LeaderboardCache(kv, ttl=60)
+        assert await cache.get_page("g") == (BOARD, 2)
+        assert await cache.get("g") == BOARD
+        return kv, cache
+
+    kv, cache = asyncio.run(scenario())
+    assert kv.fetches == 1
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_concurrent_misses_share_one_fetch():
+    async def scenario():
+        kv = FakeKV(BOARD)
+        kv.release = asyncio.Event()
+        cache = LeaderboardCache(kv, ttl=60)
+        readers = [asyncio.create_task(cache.get("g")) for _ in range(5)]
+        await asyncio.sleep(0)
+        kv.release.set()
+        return kv, cache, await asyncio.gather(*readers)
+
+    kv, cache, results = asyncio.run(scenario())
+    assert kv.fetches == 1
+    assert results == [BOARD] * 5
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_expired_entries_are_refetched():
+    async def scenario():
+        kv = FakeKV(BOARD)
+        cache = LeaderboardCache(kv, ttl=0.01)
+        await cache.get("g")
+        await asyncio.sleep(0.02)
+        await cache.get("g")
+        return kv
+
+    assert asyncio.run(scenario()).fetches == 2
+
+
+def test_fetch_started_before_a_submit_does_not_overwrite_it():
+    async def scenario():
+        kv = FakeKV(BOARD)
+        kv.release = asyncio.Event()
+        cache = LeaderboardCache(kv, ttl=60)
+        stale = asyncio.create_task(cache.get("g"))
+        await asyncio.sleep(0)
+
+        fresh = [{"name": "new", "score": 9.0, "rank": 1}] + BOARD
+        cache.update("g", fresh, 3)
+        kv.release.set()
+        assert await stale == BOARD
+        return cache, fresh
+
+    cache, fresh = asyncio.run(scenario())
+    assert asyncio.run(cache.get_page("g")) == (fresh, 3)
+    assert cache._versions == {}
+
+
+def test_versions_are_only_kept_while_a_fetch_is_in_flight():
+    async def scenario():
+        cache = LeaderboardCache(FakeKV(BOARD), ttl=60)
+        for i in range(100):
+            cache.update(f"game{i}", BOARD, 2)
+        await cache.get("other")
+        return cache
+
+    assert asyncio.run(scenario())._versions == {}
+
+
+def test_failed_fetch_is_raised_and_not_cached():
+    class BrokenKV(FakeKV):
+        async def get_leaderboard_page_async(self, game_id, offset, limit):
+            self.fetches += 1
+            raise ConnectionError("kv down")
+
+    async def scenario():
+        kv = BrokenKV(BOARD)
+        cache = LeaderboardCache(kv, ttl=60)
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await cache.get("g")
+        return kv, cache
+
+    kv, cache = asyncio.run(scenario())
+    assert kv.fetches == 2
+    assert cache._inflight == {} and cache._entries == {}
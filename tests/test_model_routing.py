@@ -0,0 +1,34 @@
+PRIMARY = "gemini-2.5-pro"
+FALLBACK = "gemini-2.5-flash"
+
+
+def test_timeout_falls_back_to_next_model(client, fake):
+    fake.failures[PRIMARY] = TimeoutError("deadline exceeded")
+    html = client.generate("prompt")
+
+    assert html == fake.html
+    assert client.last_usage["model"] == FALLBACK
+    assert client.router.fallbacks_used == 1
+
+
+def test_bad_request_does_not_fall_back(client, fake):
+    fake.failures[PRIMARY] = ValueError("400 invalid argument")
+    try:
+        client.generate("prompt")
+    except RuntimeError as e:
+        assert "400 invalid argument" in str(e)
+    else:
+        raise AssertionError("expected the primary's error")
+    assert client.router.fallbacks_used == 0
+
+
+def test_fallback_output_is_not_cached_under_the_primary_key(app_module, fake, make_request):
+    fake.failures[PRIMARY] = TimeoutError("deadline exceeded")
+    _, status, _ = app_module.build_game(make_request(), "game1")
+    assert status == "miss"
+    assert app_module.generation_cache.stats()["entries"] == 0
+
+    del fake.failures[PRIMARY]
+    _, status, _ = app_module.build_game(make_request(), "game2")
+    _, second_status, _ = app_module.build_game(make_request(), "game3")
+    assert (status, second_status) == ("miss", "hit")
@@ -0,0 +1,71 @@
+import pytest
+
+from backend.utils import HtmlPostProcessor, TRUNCATION_BANNER, clean_html_output
+
+METADATA = "<script>window.META = {};</script>"
+DOCUMENT = """```html
+<!DOCTYPE html>
+<html><head><script>const GAME_ID = "[[GAME_ID]]";</script></head>
+<body><p>Play</p></body></html>
+```"""
+
+
+def processor() -> HtmlPostProcessor:
+    return HtmlPostProcessor({"[[GAME_ID]]": "game1"}, METADATA)
+
+
+def stream(text: str, size: int) -> str:
+    post = processor()
+    out = [post.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    return "".join(out) + post.finish()
+
+
+def test_run_strips_fences_substitutes_and_injects():
+    html = processor().run(DOCUMENT)
+
+    assert html.startswith("<!DOCTYPE html>") and html.endswith("</html>")
+    assert "```" not in html
+    assert 'const GAME_ID = "game1"' in html
+    assert f"{METADATA}\n</body>" in html
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 11])
+def test_tokens_split_across_chunks_match_a_single_run(size):
+    assert stream(DOCUMENT, size) == processor().run(DOCUMENT)
+
+
+def test_partial_token_is_held_back_until_the_next_chunk():
+    post = processor()
+
+    assert post.feed("<p>a</p>[[GAME") == "<p>a</p>"
+    assert post.feed("_ID]] ok</bo") == "game1 ok"
+    assert post.feed("dy>") + post.finish() == f"{METADATA}\n</body>"
+
+
+def test_metadata_is_injected_once():
+    html = processor().run("<html><body></body></html>\n<body></body>")
+    assert html.count(METADATA) == 1
+
+
+def test_metadata_is_appended_when_there_is_no_body_tag():
+    assert processor().run("<div>no body</div>") == f"<div>no body</div>{METADATA}"
+
+
+def test_truncated_document_is_patched():
+    html = stream("<html><body><script>let x = 1;", 4)
+    assert html.endswith(f"\n// [TRUNCATED BY AI]\n</script>{TRUNCATION_BANNER}\n{METADATA}\n</body></html>")
+
+    post = processor()
+    post.run("<html><body><script>let x = 1;")
+    assert post.truncated
+
+
+def test_complete_document_is_not_marked_truncated():
+    post = processor()
+    post.run(DOCUMENT)
+    assert not post.truncated
+
+
+def test_clean_html_output_matches_the_processor():
+    assert clean_html_output(DOCUMENT) == HtmlPostProcessor().run(DOCUMENT)
+    assert clean_html_output("  ```html\n<p>x</p>\n```  ") == "<p>x</p>"
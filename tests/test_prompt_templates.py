@@ -0,0 +1,28 @@
+from backend.prompt_templates import GAME_TEMPLATE_V3, GAME_TEMPLATE_V4, PromptTemplate, TemplateRegistry
+
+
+def registry(**kwargs) -> TemplateRegistry:
+    registry = TemplateRegistry("game-v4", ab_config=kwargs.pop("ab_config", {}), control_id="game-v3", **kwargs)
+    registry.register(PromptTemplate("game-v3", GAME_TEMPLATE_V3))
+    registry.register(PromptTemplate("game-v4", GAME_TEMPLATE_V4))
+    return registry
+
+
+def test_control_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("PROMPT_TEMPLATE_CONTROL_WEIGHT", raising=False)
+    assert {registry().select("medium", f"prompt {i}").id for i in range(500)} == {"game-v4"}
+
+
+def test_control_weight_splits_traffic():
+    selected = [registry(control_weight=20).select("medium", f"prompt {i}").id for i in range(2000)]
+    assert 300 < selected.count("game-v3") < 500
+
+
+def test_assignment_is_stable_per_prompt():
+    templates = registry(control_weight=50)
+    assert len({templates.select("easy", "same prompt").id for _ in range(10)}) == 1
+
+
+def test_ab_config_overrides_the_control_split():
+    templates = registry(control_weight=50, ab_config={"hard": {"game-v3": 100}})
+    assert {templates.select("hard", f"prompt {i}").id for i in range(50)} == {"game-v3"}
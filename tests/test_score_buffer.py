@@ -0,0 +1,159 @@
+import asyncio
+
+from backend.kv_client import KVClient
+from backend.score_buffer import ScoreBuffer
+
+
+class RecordingKV:
+    """Records submit_scores_async batches; `block` holds the next write until released."""
+
+    def __init__(self):
+        self.batches = []
+        self.fail_next = False
+        self.block = None
+        self.started = asyncio.Event()
+
+    async def submit_scores_async(self, scores: dict):
+        self.started.set()
+        if self.block is not None:
+            block, self.block = self.block, None
+            await block.wait()
+        if self.fail_next:
+            self.fail_next = False
+            raise RuntimeError("connection reset")
+        self.batches.append({game_id: dict(players) for game_id, players in scores.items()})
+
+
+def test_keeps_each_players_best_score():
+    async def run():
+        kv = RecordingKV()
+        buffer = ScoreBuffer(kv, flush_interval=60)
+        buffer.add("g1", "alice", 10)
+        buffer.add("g1", "alice", 5)
+        buffer.add("g1", "alice", 12)
+        buffer.add("g2", "bob", 3)
+        assert buffer.pending_count() == 2
+        await buffer.flush()
+        await buffer.close()
+        return kv
+
+    kv = asyncio.run(run())
+    assert kv.batches == [{"g1": {"alice": 12}, "g2": {"bob": 3}}]
+
+
+def test_overlay_merges_pending_scores_into_reads():
+    async def run():
+        buffer = ScoreBuffer(RecordingKV(), flush_interval=60)
+        buffer.add("g1", "carol", 25)
+        buffer.add("g1", "alice", 5)
+        board = [{"name": "alice", "score": 30.0}, {"name": "bob", "score": 20.0}]
+        merged = buffer.overlay("g1", board, limit=2)
+        await buffer.close()
+        return merged
+
+    assert asyncio.run(run()) == [{"name": "alice", "score": 30.0, "rank": 1}, {"name": "carol", "score": 25.0, "rank": 2}]
+
+
+def test_flushes_on_interval_and_reports_games():
+    async def run():
+        kv = RecordingKV()
+        flushed = []
+        buffer = ScoreBuffer(kv, flush_interval=0.01, on_flush=flushed.append)
+        buffer.add("g1", "alice", 10)
+        await asyncio.sleep(0.1)
+        await buffer.close()
+        return kv, flushed, buffer.stats()
+
+    kv, flushed, stats = asyncio.run(run())
+    assert kv.batches == [{"g1": {"alice": 10}}]
+    assert flushed == [["g1"]]
+    assert stats["flushes"] == 1
+    assert stats["pending"] == 0
+
+
+def test_max_pending_flushes_without_waiting_for_the_interval():
+    async def run():
+        kv = RecordingKV()
+        buffer = ScoreBuffer(kv, flush_interval=60, max_pending=3)
+        for i in range(3):
+            buffer.add("g1", f"p{i}", i)
+        await asyncio.wait_for(kv.started.wait(), timeout=1)
+        await asyncio.sleep(0)
+        await buffer.close()
+        return kv
+
+    assert len(asyncio.run(run()).batches) == 1
+
+
+def test_failed_flush_is_retried_with_newer_scores_merged():
+    async def run():
+        kv = RecordingKV()
+        buffer = ScoreBuffer(kv, flush_interval=60)
+        kv.fail_next = True
+        buffer.add("g1", "alice", 10)
+        await buffer.flush()
+        buffer.add("g1", "alice", 8)
+        buffer.add("g1", "bob", 4)
+        await buffer.flush()
+        await buffer.close()
+        return kv, buffer.failures
+
+    kv, failures = asyncio.run(run())
+    assert failures == 1
+    assert kv.batches == [{"g1": {"alice": 10, "bob": 4}}]
+
+
+def test_close_writes_a_batch_whose_flush_was_in_flight():
+    async def run():
+        kv = RecordingKV()
+        kv.block = asyncio.Event()
+        buffer = ScoreBuffer(kv, flush_interval=0.01)
+        buffer.add("g1", "alice", 10)
+        await asyncio.wait_for(kv.started.wait(), timeout=1)
+        buffer.add("g1", "bob", 7)
+        # Shutdown cancels the flush loop mid-write
+        await buffer.close()
+        return kv
+
+    kv = asyncio.run(run())
+    assert kv.batches == [{"g1": {"alice": 10, "bob": 7}}]
+
+
+def test_journal_survives_a_restart(tmp_path):
+    journal = str(tmp_path / "scores.jsonl")
+
+    async def crash():
+        buffer = ScoreBuffer(RecordingKV(), flush_interval=60, journal_path=journal)
+        buffer.add("g1", "alice", 10)
+        buffer.add("g1", "alice", 15)
+        buffer._task.cancel()  # no close(): the process died
+
+    async def restart():
+        kv = RecordingKV()
+        buffer = ScoreBuffer(kv, flush_interval=60, journal_path=journal)
+        assert buffer.pending_count() == 1
+        await buffer.close()
+        return kv
+
+    asyncio.run(crash())
+    kv = asyncio.run(restart())
+    assert kv.batches == [{"g1": {"alice": 15}}]
+    with open(journal, encoding="utf-8") as f:
+        assert f.read() == ""
+
+
+def test_flushes_through_to_sqlite(tmp_path, monkeypatch):
+    monkeypatch.setenv("KV_BACKEND", "sqlite")
+    monkeypatch.setenv("KV_SQLITE_PATH", str(tmp_path / "kv.sqlite3"))
+    kv = KVClient()
+
+    async def run():
+        kv.submit_score("g1", "alice", 50)
+        buffer = ScoreBuffer(kv, flush_interval=60)
+        buffer.add("g1", "alice", 40)
+        buffer.add("g1", "bob", 45)
+        await buffer.close()
+        return await kv.get_leaderboard_async("g1")
+
+    assert asyncio.run(run()) == [{"name": "alice", "score": 50.0}, {"name": "bob", "score": 45.0}]
+    kv.client.close()
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from backend.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flights, release, calls = SingleFlight(), threading.Event(), []
+
+    def fn():
+        calls.append(1)
+        release.wait(timeout=5)
+        return "html"
+
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(flights.do("prompt", fn))) for _ in range(4)]
+    for caller in callers:
+        caller.start()
+    while flights.stats()["coalesced"] < 3:
+        release.wait(0.001)
+    release.set()
+    for caller in callers:
+        caller.join(timeout=2)
+
+    assert calls == [1]
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    stats = flights.stats()
+    assert (stats["in_flight"], stats["leaders"], stats["max_waiters"]) == (0, 1, 3)
+
+
+def test_followers_see_the_leaders_error():
+    flights, release = SingleFlight(), threading.Event()
+
+    def fn():
+        release.wait(timeout=5)
+        raise RuntimeError("quota")
+
+    errors = []
+
+    def call():
+        try:
+            flights.do("prompt", fn)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    callers = [threading.Thread(target=call) for _ in range(2)]
+    for caller in callers:
+        caller.start()
+    while flights.stats()["coalesced"] < 1:
+        release.wait(0.001)
+    release.set()
+    for caller in callers:
+        caller.join(timeout=2)
+
+    assert errors == ["quota", "quota"]
+
+
+def test_stream_followers_replay_every_chunk():
+    flights, release = SingleFlight(), threading.Event()
+
+    def fn():
+        yield "a"
+        release.wait(timeout=5)
+        yield "b"
+
+    leader, leader_shared = flights.do_stream("prompt", fn)
+    follower, follower_shared = flights.do_stream("prompt", fn)
+    release.set()
+
+    assert (leader_shared, follower_shared) == (False, True)
+    assert list(leader) == list(follower) == ["a", "b"]
+    assert flights.stats()["leaders"] == 1
+
+
+def test_single_flight_gauges_are_exported(app_module, monkeypatch):
+    flights = SingleFlight()
+    flights.do("prompt", lambda: "html")
+    monkeypatch.setattr(app_module, "generation_flights", flights)
+
+    samples = {(name, tuple(labels.items())): value for name, _, _, labels, value in app_module.pipeline_gauges()}
+    assert samples[("generation_flight_leaders_total", ())] == 1
+    assert samples[("generation_flight_coalesced_total", ())] == 0
+    assert samples[("generation_flights_in_flight", ())] == 0
+    assert samples[("generation_flight_window_seconds", (("window", "last"),))] == pytest.approx(
+        samples[("generation_flight_window_seconds", (("window", "avg"),))]
+    )
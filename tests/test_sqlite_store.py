@@ -0,0 +1,101 @@
+"""
+SqliteStore must answer the sorted-set commands KVClient sends the way Redis
+does, so leaderboards look the same on either backend.
+"""
+import asyncio
+import random
+
+import pytest
+
+from backend.kv_client import KVClient, KVError
+from backend.sqlite_store import SqliteStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteStore(str(tmp_path / "kv.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_zadd_returns_number_of_new_members(store):
+    assert store.execute("ZADD", "lb", 10, "alice", 20, "bob") == 2
+    assert store.execute("ZADD", "lb", 15, "alice", 5, "carol") == 1
+    assert store.execute("ZADD", "lb", "CH", 16, "alice", 5, "carol", 1, "dave") == 2
+
+
+def test_zadd_gt_only_raises_scores(store):
+    store.execute("ZADD", "lb", 50, "alice")
+    store.execute("ZADD", "lb", "GT", 40, "alice")
+    assert store.execute("ZSCORE", "lb", "alice") == "50"
+    store.execute("ZADD", "lb", "GT", 60, "alice")
+    assert store.execute("ZSCORE", "lb", "alice") == "60"
+    # GT still adds members that aren't there yet
+    assert store.execute("ZADD", "lb", "GT", 1, "bob") == 1
+
+
+def test_zadd_nx_and_xx(store):
+    store.execute("ZADD", "lb", 1, "alice")
+    assert store.execute("ZADD", "lb", "NX", 9, "alice", 2, "bob") == 1
+    assert store.execute("ZADD", "lb", "XX", 3, "bob", 4, "carol") == 0
+    assert store.execute("ZREVRANGE", "lb", 0, -1, "WITHSCORES") == ["bob", "3", "alice", "1"]
+
+
+def test_zadd_accepts_inf_but_not_nan(store):
+    store.execute("ZADD", "lb", float("inf"), "alice", float("-inf"), "bob", 1.5, "carol")
+    assert store.execute("ZREVRANGE", "lb", 0, -1, "WITHSCORES") == ["alice", "inf", "carol", "1.5", "bob", "-inf"]
+    with pytest.raises(KVError):
+        store.execute("ZADD", "lb", float("nan"), "dave")
+
+
+def test_zrevrange_breaks_ties_by_member_descending(store):
+    store.execute("ZADD", "lb", 10, "alice", 10, "bob", 10, "carol", 20, "dave")
+    assert store.execute("ZREVRANGE", "lb", 0, -1) == ["dave", "carol", "bob", "alice"]
+
+
+def test_zrevrange_index_arithmetic(store):
+    for i in range(5):
+        store.execute("ZADD", "lb", i, f"p{i}")
+    assert store.execute("ZREVRANGE", "lb", 1, 2) == ["p3", "p2"]
+    assert store.execute("ZREVRANGE", "lb", -2, -1) == ["p1", "p0"]
+    assert store.execute("ZREVRANGE", "lb", 3, 100) == ["p1", "p0"]
+    assert store.execute("ZREVRANGE", "lb", 4, 2) == []
+    assert store.execute("ZREVRANGE", "missing", 0, -1) == []
+
+
+def test_zrevrank_agrees_with_zrevrange(store):
+    rng = random.Random(7)
+    for i in range(200):
+        store.execute("ZADD", "lb", rng.randint(0, 20), f"player{i}")
+    ranking = store.execute("ZREVRANGE", "lb", 0, -1)
+
+    assert len(ranking) == store.execute("ZCARD", "lb") == 200
+    for position, member in enumerate(ranking):
+        assert store.execute("ZREVRANK", "lb", member) == position
+    assert store.execute("ZREVRANK", "lb", "nobody") is None
+    assert store.execute("ZSCORE", "lb", "nobody") is None
+
+
+def test_async_pipeline_matches_sync_results(store):
+    commands = [["ZADD", "lb", 3, "a", 2, "b"], ["ZREVRANGE", "lb", 0, -1, "WITHSCORES"], ["ZREVRANK", "lb", "b"]]
+    results = asyncio.run(store.apipeline(commands))
+    assert results == [2, ["a", "3", "b", "2"], 1]
+    assert asyncio.run(store.aexecute("ZCARD", "lb")) == 2
+
+
+def test_kv_client_submit_and_fetch(tmp_path, monkeypatch):
+    monkeypatch.setenv("KV_BACKEND", "sqlite")
+    monkeypatch.setenv("KV_SQLITE_PATH", str(tmp_path / "client.sqlite3"))
+    kv = KVClient()
+
+    kv.submit_score("g1", "alice", 30)
+    kv.submit_score("g1", "bob", 20)
+    result = kv.submit_score_and_get_leaderboard("g1", "bob", 10)
+
+    # A lower score doesn't replace a player's best
+    assert result["leaderboard"] == [{"name": "alice", "score": 30.0, "rank": 1}, {"name": "bob", "score": 20.0, "rank": 2}]
+    assert (result["rank"], result["total"]) == (2, 2)
+    assert asyncio.run(kv.get_player_rank_async("g1", "alice")) == {"name": "alice", "rank": 1, "score": 30.0}
+    entries, total = asyncio.run(kv.get_leaderboard_page_async("g1", offset=1, limit=5))
+    assert (entries, total) == ([{"name": "bob", "score": 20.0, "rank": 2}], 2)
+    kv.client.close()
@@ -0,0 +1,53 @@
+import asyncio
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+
+def parse_events(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def wait_for_game(main, game_id: str, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        html = main.load_game_html(game_id)
+        if html is not None:
+            return html
+        time.sleep(0.02)
+    return None
+
+
+def test_stream_sends_start_chunks_and_done(app_module, fake):
+    with TestClient(app_module.app) as api:
+        response = api.post("/generate-game/stream", json={"prompt": "A quiz about planets"})
+    events = parse_events(response.text)
+
+    (first, start), (last, done) = events[0], events[-1]
+    assert (first, last) == ("start", "done")
+    assert done["game_id"] == start["game_id"]
+    streamed = "".join(data for event, data in events if event == "chunk")
+    assert f'const GAME_ID = "{start["game_id"]}"' in streamed
+    assert wait_for_game(app_module, start["game_id"]) == streamed
+
+
+def test_game_is_saved_and_cached_when_the_client_disconnects(app_module, fake, make_request):
+    fake.decode_ms_per_1k_chars = 20  # long enough to still be streaming when the client leaves
+    response = app_module.generate_game_stream(make_request("A quiz about rivers"))
+
+    async def read_start_and_leave():
+        body = response.body_iterator
+        start = await body.__anext__()
+        await body.aclose()
+        return parse_events(start)[0][1]
+
+    start = asyncio.run(read_start_and_leave())
+
+    assert wait_for_game(app_module, start["game_id"]) is not None
+    _, status, _ = app_module.build_game(make_request("A quiz about rivers"), "game2")
+    assert status == "hit"